@@ -5,6 +5,7 @@ from math import sqrt
 from pathlib import Path
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 import psycopg2
 import random
@@ -21,6 +22,12 @@ from tensorflow.keras import regularizers
 
 from dotenv import load_dotenv
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
 import matplotlib.pyplot as plt
 
 # ============= CONFIG =============
@@ -32,6 +39,10 @@ PG_DB = os.getenv("PG_DB")
 PG_USER = os.getenv("PG_USER")
 PG_PASSWORD = os.getenv("PG_PASSWORD")
 
+# Arrow copy written by the ingestion pipeline (crypto-project/data_access/columnar_store.py)
+HISTORY_STORE_DIR = os.getenv("HISTORY_STORE_DIR")
+HISTORY_YEARS = 5
+
 DEFAULT_LOOKBACK = 21
 EPOCHS = 100
 BATCH_SIZE = 8
@@ -58,7 +69,25 @@ def get_conn():
     )
 
 
+def load_history_from_store(symbol: str):
+    # memory-mapped Arrow file instead of a DB query; None if the symbol is not there
+    if not HISTORY_STORE_DIR or pa is None:
+        return None
+    path = os.path.join(HISTORY_STORE_DIR, "history", f"{symbol}.arrow")
+    if not os.path.exists(path):
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    since = (pd.Timestamp.today() - pd.DateOffset(years=HISTORY_YEARS)).date()
+    table = table.filter(pc.greater_equal(table["date"], pa.scalar(since, pa.date32())))
+    return table.select(["date", "close"]).to_pandas()
+
+
 def load_history(symbol: str) -> pd.DataFrame:
+    df = load_history_from_store(symbol)
+    if df is not None:
+        return df
+
     query = """
             SELECT date, close
             FROM historical_data
@@ -70,6 +99,31 @@ def load_history(symbol: str) -> pd.DataFrame:
         return pd.read_sql(query, conn, params=(symbol,))
 
 
+def load_histories(symbols) -> dict:
+    # all symbols in one query (Arrow store first where it has the symbol)
+    histories = {}
+    for symbol in symbols:
+        df = load_history_from_store(symbol)
+        if df is not None:
+            histories[symbol] = df
+    remaining = [s for s in symbols if s not in histories]
+    if not remaining:
+        return histories
+
+    query = """
+            SELECT symbol, date, close
+            FROM historical_data
+            WHERE symbol = ANY(%s)
+              AND date >= CURRENT_DATE - interval '5 years'
+            ORDER BY symbol, date ASC \
+            """
+    with get_conn() as conn:
+        df = pd.read_sql(query, conn, params=(remaining,))
+    for symbol, group in df.groupby("symbol", sort=False):
+        histories[symbol] = group[["date", "close"]].reset_index(drop=True)
+    return histories
+
+
 def save_prediction(symbol: str, next_date, next_price, rmse, mape, r2):
     sql = """
           INSERT INTO lstm_predictions(symbol, prediction_date, predicted_close, rmse, mape, r2)
@@ -119,47 +173,38 @@ def should_use_log(df: pd.DataFrame) -> bool:
 
 
 def make_sequences_raw(closes: np.ndarray, lookback: int):
-    X, y = [], []
-    for i in range(lookback, len(closes)):
-        X.append(closes[i - lookback:i])
-        y.append(closes[i])
-    return np.array(X), np.array(y)
-
-
-def split_data(X_raw, y_raw):
-    train_size = int(len(X_raw) * 0.70)
-    val_size = int(len(X_raw) * 0.15)
+    # strided views over the series: X[i] = closes[i:i + lookback] as (lookback, 1), y[i] = closes[i + lookback]
+    X = sliding_window_view(closes[:-1], lookback)[:, :, np.newaxis]
+    return X, closes[lookback:]
 
-    X_train = X_raw[:train_size]
-    y_train = y_raw[:train_size]
-    X_val = X_raw[train_size:train_size + val_size]
-    y_val = y_raw[train_size:train_size + val_size]
-    X_test = X_raw[train_size + val_size:]
-    y_test = y_raw[train_size + val_size:]
 
-    return X_train, y_train, X_val, y_val, X_test, y_test
+def split_bounds(n_windows: int):
+    train_size = int(n_windows * 0.70)
+    val_size = int(n_windows * 0.15)
+    return train_size, train_size + val_size
 
 
-def scale_data(X_train, X_val, X_test, y_train, y_val, y_test):
-    scaler_X = MinMaxScaler()
-    X_train_s = scaler_X.fit_transform(X_train)
-    X_val_s = scaler_X.transform(X_val)
-    X_test_s = scaler_X.transform(X_test)
+def scale_series(closes: np.ndarray, fit_until: int):
+    # one scaler for inputs and targets, fit once on the part of the series the training windows see
+    scaler = MinMaxScaler()
+    scaler.fit(closes[:fit_until].reshape(-1, 1))
+    scaled = scaler.transform(closes.reshape(-1, 1)).ravel().astype(np.float32)
+    return scaled, scaler
 
-    scaler_y = MinMaxScaler()
-    y_train_s = scaler_y.fit_transform(y_train.reshape(-1, 1))
-    y_val_s = scaler_y.transform(y_val.reshape(-1, 1))
-    y_test_s = scaler_y.transform(y_test.reshape(-1, 1))
 
-    return X_train_s, X_val_s, X_test_s, y_train_s, y_val_s, y_test_s, scaler_X, scaler_y
+def make_dataset(X, y, batch_size: int):
+    # batches are copied out of the strided view one at a time and prefetched
+    def batches():
+        for i in range(0, len(X), batch_size):
+            yield X[i:i + batch_size], y[i:i + batch_size]
 
-
-def reshape_for_lstm(X_train, X_val, X_test, lookback: int):
-    return (
-        X_train.reshape(-1, lookback, 1),
-        X_val.reshape(-1, lookback, 1),
-        X_test.reshape(-1, lookback, 1),
-    )
+    return tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(
+            tf.TensorSpec(shape=(None, X.shape[1], 1), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        ),
+    ).prefetch(tf.data.AUTOTUNE)
 
 
 # ============= MODEL =============
@@ -262,12 +307,13 @@ def print_metrics(symbol, rmse, mape, r2, mae):
 
 
 # ============= TRAINING =============
-def train_lstm_for_symbol(symbol: str):
+def train_lstm_for_symbol(symbol: str, df: pd.DataFrame = None):
     print(f"\n{'=' * 60}")
     print(f"LSTM Training for {symbol}")
     print(f"{'=' * 60}")
 
-    df = load_history(symbol)
+    if df is None:
+        df = load_history(symbol)
 
     if df.empty:
         print(f"[WARN] No data for {symbol}")
@@ -307,23 +353,19 @@ def train_lstm_for_symbol(symbol: str):
         print(f"[INFO] Using RAW prices (no log) for {symbol}")
         closes_for_model = closes_raw
 
-    # 1. Create sequences
-    X_raw, y_raw = make_sequences_raw(closes_for_model, lookback)
+    # 1. Split by window index
+    train_end, val_end = split_bounds(n_rows - lookback)
 
-    # 2. Split data
-    X_train, y_train, X_val, y_val, X_test, y_test = split_data(X_raw, y_raw)
+    # 2. Scale the series once
+    scaled, scaler = scale_series(closes_for_model, train_end + lookback)
 
-    # 3. Scale data
-    X_train_s, X_val_s, X_test_s, y_train_s, y_val_s, y_test_s, scaler_X, scaler_y = scale_data(
-        X_train, X_val, X_test, y_train, y_val, y_test
-    )
-
-    # 4. Reshape for LSTM
-    X_train_l, X_val_l, X_test_l = reshape_for_lstm(X_train_s, X_val_s, X_test_s, lookback)
+    # 3. Create sequences (views, no copy)
+    X, y = make_sequences_raw(scaled, lookback)
 
+    # 4. Input pipeline sizes
     print(f"\nDataset Sizes:")
-    print(f"  Train: {len(X_train_l)}, Val: {len(X_val_l)}, Test: {len(X_test_l)}")
-    print(f"  Input shape: {X_train_l.shape}")
+    print(f"  Train: {train_end}, Val: {val_end - train_end}, Test: {len(X) - val_end}")
+    print(f"  Input shape: {X[:train_end].shape}")
 
     # 5. Build model
     model = build_model((lookback, 1))
@@ -334,19 +376,17 @@ def train_lstm_for_symbol(symbol: str):
 
     local_batch_size = BATCH_SIZE if n_rows > 500 else 8
     history = model.fit(
-        X_train_l, y_train_s,
+        make_dataset(X[:train_end], y[:train_end], local_batch_size),
         epochs=EPOCHS,
-        batch_size=local_batch_size,
-        validation_data=(X_val_l, y_val_s),
+        validation_data=make_dataset(X[train_end:val_end], y[train_end:val_end], local_batch_size),
         callbacks=[early_stop, reduce_lr],
-        shuffle=False,
         verbose=0
     )
 
     # 7. Evaluate
-    y_pred_s = model.predict(X_test_l, verbose=0)
-    y_test_model_space = scaler_y.inverse_transform(y_test_s)[:, 0]
-    y_pred_model_space = scaler_y.inverse_transform(y_pred_s)[:, 0]
+    y_pred_s = model.predict(make_dataset(X[val_end:], y[val_end:], local_batch_size), verbose=0)
+    y_test_model_space = closes_for_model[lookback + val_end:]
+    y_pred_model_space = scaler.inverse_transform(y_pred_s)[:, 0]
 
     if use_log:
         y_test_orig = np.expm1(y_test_model_space)
@@ -363,18 +403,17 @@ def train_lstm_for_symbol(symbol: str):
     print(f"[OK] Saved loss plot")
 
     # 9. Plot predictions
-    start_idx = lookback + int(len(X_raw) * 0.70) + int(len(X_raw) * 0.15)
+    start_idx = lookback + val_end
     test_dates = df["date"].iloc[start_idx:start_idx + len(y_test_orig)]
 
     plot_predictions(test_dates, y_test_orig, y_pred_orig, symbol)
     print(f"[OK] Saved prediction plot")
 
     # 10. Next-day prediction
-    last_window_model = closes_for_model[-lookback:]
-    last_window_s = scaler_X.transform(last_window_model.reshape(1, -1)).reshape(1, lookback, 1)
+    last_window_s = scaled[-lookback:].reshape(1, lookback, 1)
 
     next_pred_model_s = model.predict(last_window_s, verbose=0)[0][0]
-    next_pred_model = scaler_y.inverse_transform([[next_pred_model_s]])[0][0]
+    next_pred_model = scaler.inverse_transform([[next_pred_model_s]])[0][0]
 
     if use_log:
         next_price = float(np.expm1(next_pred_model))
@@ -401,13 +440,25 @@ def train_lstm_for_symbol(symbol: str):
 # ============= MAIN =============
 if __name__ == "__main__":
     if len(sys.argv) > 1:
-        symbols = [sys.argv[1]]
+        symbols = sys.argv[1:]
     else:
         symbols = ["BTC", "ETH", "NODE", "SLAY", "CORN", "ASD", "USDT", "XRP"]
 
+    # one query for every symbol instead of one per symbol;
+    # if it fails, each symbol loads (and fails) on its own
+    try:
+        histories = load_histories(symbols)
+    except Exception as e:
+        print(f"\n[ERROR] Batch history load failed, loading per symbol: {e}")
+        histories = None
+
     for sym in symbols:
         try:
-            train_lstm_for_symbol(sym)
+            if histories is None:
+                df = None
+            else:
+                df = histories.get(sym, pd.DataFrame(columns=["date", "close"]))
+            train_lstm_for_symbol(sym, df)
         except Exception as e:
             print(f"\n[ERROR] Failed for {sym}: {e}")
             import traceback
@@ -1,34 +1,127 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-
-from app.service.lstm_service import run_training
-from app.state.training_state import training_state, TrainingStatus
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException
+
+from app.schemas import BatchPredictionRequest
+from app.service.lstm_service import (
+    cancel_batch,
+    cancel_training,
+    schedule_batch,
+    schedule_training,
+    serve_from_registry
+)
+from app.service.scheduler import BATCH_PRIORITY, DEFAULT_PRIORITY, scheduler
+from app.state.training_state import batch_state, training_state, TrainingStatus
 
 router = APIRouter(prefix="/api")
 
 
+# registered before /predict/{symbol}, otherwise "batch" is taken as a symbol
+@router.post("/predict/batch", status_code=202)
+def start_batch_prediction(request: BatchPredictionRequest, priority: int = BATCH_PRIORITY):
+    if not request.symbols and not request.universe:
+        raise HTTPException(
+            status_code=400,
+            detail="Provide a list of symbols or set universe to true"
+        )
+
+    symbols = None if request.universe else list(dict.fromkeys(request.symbols))
+    batch_id = uuid.uuid4().hex
+    batch_state[batch_id] = {
+        "status": TrainingStatus.STARTED,
+        "message": "Batch queued",
+        "universe": request.universe,
+        "total": len(symbols) if symbols is not None else None,
+        "done": 0,
+        "failed": 0,
+        "chunks": 0,
+        "groups": {},
+        "symbols": {},
+        "created_at": datetime.now(tz=timezone.utc).isoformat()
+    }
+
+    schedule_batch(batch_id, symbols, priority)
+
+    return {
+        "batch_id": batch_id,
+        "status": TrainingStatus.STARTED
+    }
+
+
+@router.get("/predict/batch/{batch_id}")
+def get_batch_prediction(batch_id: str):
+    if batch_id not in batch_state:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown batch"
+        )
+
+    return {
+        "batch_id": batch_id,
+        **batch_state[batch_id]
+    }
+
+
+@router.delete("/predict/batch/{batch_id}")
+def cancel_batch_prediction(batch_id: str):
+    jobs = cancel_batch(batch_id)
+    if not jobs:
+        raise HTTPException(
+            status_code=404,
+            detail="No queued or running batch with this id"
+        )
+
+    return {
+        "batch_id": batch_id,
+        "status": batch_state[batch_id]["status"],
+        "cancel_requested": any(job.cancel_requested for job in jobs)
+    }
+
+
+@router.get("/scheduler/metrics")
+def get_scheduler_metrics():
+    return scheduler.metrics()
+
+
 @router.post("/predict/{symbol}", status_code=202)
-def start_prediction(symbol: str, background_tasks: BackgroundTasks):
+def start_prediction(symbol: str, priority: int = DEFAULT_PRIORITY):
+    """Lower priority runs first; a repeated request only raises the priority of the queued job."""
     state = training_state.get(symbol)
+    in_progress = state and state["status"] in (
+        TrainingStatus.STARTED,
+        TrainingStatus.RUNNING
+    )
 
-    if state and state["status"] in (
-            TrainingStatus.STARTED,
-            TrainingStatus.RUNNING
-    ):
+    # a fresh stored model answers right away; training only when it is missing or stale
+    if not in_progress and serve_from_registry(symbol):
         return {
             "symbol": symbol,
-            "status": state["status"]
+            "status": TrainingStatus.DONE
         }
 
-    training_state[symbol] = {
-        "status": TrainingStatus.STARTED,
-        "message": "Training queued"
+    job = schedule_training(symbol, priority)
+
+    return {
+        "symbol": symbol,
+        "status": job.status,
+        "priority": job.priority
     }
 
-    background_tasks.add_task(run_training, symbol)
+
+@router.delete("/predict/{symbol}")
+def cancel_prediction(symbol: str):
+    job = cancel_training(symbol)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No queued or running training for this symbol"
+        )
 
     return {
         "symbol": symbol,
-        "status": TrainingStatus.STARTED
+        "status": job.status,
+        "cancel_requested": job.cancel_requested
     }
 
 
@@ -51,6 +144,12 @@ def get_prediction(symbol: str):
             detail=state.get("message", "Training failed")
         )
 
+    if state["status"] == TrainingStatus.CANCELLED:
+        raise HTTPException(
+            status_code=409,
+            detail=state.get("message", "Training cancelled")
+        )
+
     return state.get("result")
 
 
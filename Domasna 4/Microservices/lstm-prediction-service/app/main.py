@@ -1,7 +1,19 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.api import router
+from app.service.scheduler import scheduler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # training worker processes live as long as the web process
+    scheduler.start()
+    yield
+    scheduler.shutdown()
+
 
-app = FastAPI(title="LSTM Prediction Service")
+app = FastAPI(title="LSTM Prediction Service", lifespan=lifespan)
 app.include_router(router)
 
 # uvicorn app.main:app --reload --port 8001
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class PredictionResponse(BaseModel):
     symbol: str
@@ -9,3 +9,9 @@ class PredictionResponse(BaseModel):
     mae: Optional[float]
     mape: Optional[float]
     r2: Optional[float]
+
+
+class BatchPredictionRequest(BaseModel):
+    # None together with universe=True means every symbol with history
+    symbols: Optional[List[str]] = None
+    universe: bool = False
@@ -1,24 +1,208 @@
-from app.state.training_state import training_state, TrainingStatus
-from ml.lstm_train import train_lstm_for_symbol
+import math
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
 
+from app.service.scheduler import BATCH_JOB_TIMEOUT, BATCH_PRIORITY, Job, scheduler
+from app.state.training_state import batch_state, training_state, TrainingStatus
+from ml.lstm_train import (
+    list_symbols,
+    load_histories,
+    predict_from_registry,
+    predict_lstm_for_symbol
+)
 
-def run_training(symbol: str):
+# a batch is split into chunks of at most this many symbols, at least one per worker;
+# each chunk is a scheduler job that loads its series in one query
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "50"))
+
+
+def serve_from_registry(symbol: str) -> bool:
+    """
+    Answers from the stored model when it is still fresh, without training.
+    Returns False when the symbol has to be (re)trained.
+    """
     try:
-        print(f"[LSTM] START {symbol}", flush=True)
+        result = predict_from_registry(symbol)
+    except Exception as e:
+        print(f"[LSTM] registry inference failed for {symbol}: {e}", flush=True)
+        return False
 
-        training_state[symbol]["status"] = TrainingStatus.RUNNING
-        training_state[symbol]["message"] = "Training in progress"
+    if result is None:
+        return False
 
-        result = train_lstm_for_symbol(symbol)
+    training_state[symbol] = {
+        "status": TrainingStatus.DONE,
+        "message": "Served from stored model",
+        "result": result
+    }
+    return True
 
-        training_state[symbol]["result"] = result
-        training_state[symbol]["status"] = TrainingStatus.DONE
-        training_state[symbol]["message"] = "Training finished"
 
-        print(f"[LSTM] DONE {symbol}", flush=True)
+# Scheduling (web process): jobs go to the scheduler, state is updated from its callbacks
 
-    except Exception as e:
-        training_state[symbol]["status"] = TrainingStatus.FAILED
-        training_state[symbol]["message"] = str(e)
-        training_state[symbol].pop("result", None)
+def schedule_training(symbol: str, priority: int) -> Job:
+    def on_queue(job):
+        training_state[symbol] = {
+            "status": TrainingStatus.STARTED,
+            "message": "Training queued"
+        }
+
+    def on_start(job):
+        training_state[symbol] = {
+            "status": TrainingStatus.RUNNING,
+            "message": "Training in progress"
+        }
+
+    def on_finish(job, status, result):
+        if status == TrainingStatus.DONE:
+            training_state[symbol] = {
+                "status": status,
+                "message": "Training finished",
+                "result": result
+            }
+        else:
+            training_state[symbol] = {
+                "status": status,
+                "message": result
+            }
+
+    return scheduler.submit("symbol", f"symbol:{symbol}", symbol, priority, symbols=frozenset([symbol]),
+                            on_queue=on_queue, on_start=on_start, on_finish=on_finish)
+
+
+def cancel_training(symbol: str) -> Optional[Job]:
+    return scheduler.cancel(f"symbol:{symbol}")
+
+
+def batch_chunks(symbols: List[str]) -> List[List[str]]:
+    size = max(1, min(BATCH_CHUNK_SIZE, math.ceil(len(symbols) / scheduler.worker_count)))
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+
+def schedule_batch(batch_id: str, symbols: Optional[List[str]], priority: int = BATCH_PRIORITY) -> List[Job]:
+    """
+    Fans the batch out as chunk jobs, so it runs on every free worker.
+    symbols=None means the whole universe, resolved here.
+    """
+    batch = batch_state[batch_id]
+    if symbols is None:
+        try:
+            symbols = list_symbols()
+        except Exception as e:
+            _finish_batch(batch_id, TrainingStatus.FAILED, f"Could not list symbols: {e}")
+            return []
+
+    chunks = batch_chunks(symbols)
+    batch["total"] = len(symbols)
+    batch["chunks"] = len(chunks)
+    for symbol in symbols:
+        batch["symbols"][symbol] = {"status": TrainingStatus.STARTED}
+    if not chunks:
+        _finish_batch(batch_id, TrainingStatus.DONE, "Batch finished")
+        return []
+
+    lock = threading.Lock()
+    pending = {"jobs": len(chunks), "error": None, "cancelled": False}
+
+    def on_start(job):
+        if batch["status"] == TrainingStatus.STARTED:
+            batch["status"] = TrainingStatus.RUNNING
+            batch["message"] = "Training in progress"
+
+    def on_event(job, event):
+        kind, *data = event
+        if kind == "running":
+            batch["symbols"][data[0]] = {"status": TrainingStatus.RUNNING}
+        elif kind == "symbol":
+            _finish_symbol(batch, *data)
+
+    def on_finish(job, status, result):
+        # symbols of a cancelled, timed-out or crashed chunk that never reported
+        for symbol in job.payload:
+            if batch["symbols"][symbol]["status"] in (TrainingStatus.STARTED, TrainingStatus.RUNNING):
+                if status == TrainingStatus.CANCELLED:
+                    batch["symbols"][symbol] = {"status": status, "message": result}
+                else:
+                    _finish_symbol(batch, symbol, None, result or "Chunk finished without a result")
+        with lock:
+            pending["jobs"] -= 1
+            if status == TrainingStatus.CANCELLED:
+                pending["cancelled"] = True
+            elif status == TrainingStatus.FAILED:
+                pending["error"] = pending["error"] or result
+            if pending["jobs"] > 0:
+                return
+        if pending["cancelled"]:
+            _finish_batch(batch_id, TrainingStatus.CANCELLED, "Batch cancelled")
+        elif pending["error"]:
+            _finish_batch(batch_id, TrainingStatus.FAILED, pending["error"])
+        else:
+            _finish_batch(batch_id, TrainingStatus.DONE, "Batch finished")
+
+    return [
+        scheduler.submit("batch", f"batch:{batch_id}:{n}", chunk, priority, timeout=BATCH_JOB_TIMEOUT,
+                         symbols=frozenset(chunk), on_start=on_start, on_event=on_event, on_finish=on_finish)
+        for n, chunk in enumerate(chunks)
+    ]
+
+
+def cancel_batch(batch_id: str) -> List[Job]:
+    batch = batch_state.get(batch_id)
+    if batch is None:
+        return []
+    jobs = [scheduler.cancel(f"batch:{batch_id}:{n}") for n in range(batch["chunks"])]
+    return [job for job in jobs if job is not None]
+
+
+def _finish_batch(batch_id: str, status: TrainingStatus, message: str):
+    batch = batch_state[batch_id]
+    batch["status"] = status
+    batch["message"] = message
+    batch["finished_at"] = datetime.now(tz=timezone.utc).isoformat()
+    print(f"[LSTM] BATCH {batch_id} {status.value}: {batch['done']} ok, {batch['failed']} failed", flush=True)
+
+
+def _finish_symbol(batch: dict, symbol: str, result: Optional[dict] = None, error: Optional[str] = None):
+    if error is None:
+        entry = {"status": TrainingStatus.DONE, "result": result}
+        batch["done"] += 1
+        # groups by the lookback the symbol actually ran with (stored model, fine-tune or new model)
+        lookback = str(result.get("lookback"))
+        batch["groups"][lookback] = batch["groups"].get(lookback, 0) + 1
+    else:
+        entry = {"status": TrainingStatus.FAILED, "message": error}
+        batch["failed"] += 1
+    batch["symbols"][symbol] = entry
+    # the single-symbol endpoints see batch results too, unless a job of their own is queued
+    if scheduler.get(f"symbol:{symbol}") is None:
+        training_state[symbol] = {**entry, "message": error or "Finished in batch"}
+
+
+# Job bodies (worker process)
+
+def run_training(symbol: str) -> dict:
+    print(f"[LSTM] START {symbol}", flush=True)
+    result = predict_lstm_for_symbol(symbol)
+    print(f"[LSTM] DONE {symbol}", flush=True)
+    return result
+
+
+def run_batch(symbols: List[str], report: Callable):
+    """
+    One chunk of a batch: its series come from a single query and every
+    result is reported back to the web process as soon as it is ready.
+    """
+    histories = load_histories(symbols)
+    print(f"[LSTM] BATCH chunk: {len(histories)}/{len(symbols)} symbols with history", flush=True)
 
+    for symbol in symbols:
+        if symbol not in histories:
+            report("symbol", symbol, None, "No history for symbol")
+            continue
+        report("running", symbol)
+        try:
+            report("symbol", symbol, predict_lstm_for_symbol(symbol, histories[symbol]), None)
+        except Exception as e:
+            report("symbol", symbol, None, str(e))
@@ -0,0 +1,362 @@
+"""
+Training job scheduler.
+
+Training runs in a fixed number of long-lived worker processes, each limited
+to TF_THREADS_PER_WORKER TensorFlow threads, so concurrent requests queue up
+instead of oversubscribing the cores of the web process. Queued jobs are
+ordered by priority (lower runs first) and de-duplicated by key: a second
+request for a symbol that is already queued or running returns the existing
+job. Each job also lists the symbols it trains; a job is not started while
+another running job holds one of them, so a batch and a single-symbol job
+never train the same symbol at once. A running job that is cancelled or
+exceeds its timeout is stopped by terminating its worker, which is then replaced.
+"""
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Callable, Dict, FrozenSet, List, Optional, Set
+
+from app.state.training_state import TrainingStatus
+
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "2"))
+TF_THREADS_PER_WORKER = int(os.getenv("TF_THREADS_PER_WORKER", "2"))
+TRAINING_JOB_TIMEOUT = int(os.getenv("TRAINING_JOB_TIMEOUT", "900"))
+BATCH_JOB_TIMEOUT = int(os.getenv("BATCH_JOB_TIMEOUT", str(6 * 3600)))
+DEFAULT_PRIORITY = 10
+BATCH_PRIORITY = 20
+
+POLL_SECONDS = 0.2
+# an idle worker that died is replaced after this delay, so a worker that
+# cannot start (e.g. TensorFlow fails to import) does not respawn in a tight loop
+WORKER_RESTART_DELAY = 5.0
+
+
+class Job:
+    def __init__(self, kind: str, key: str, payload, symbols: FrozenSet[str], priority: int, timeout: float,
+                 on_start: Callable, on_event: Callable, on_finish: Callable):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.symbols = symbols
+        self.priority = priority
+        self.timeout = timeout
+        self.status = TrainingStatus.STARTED
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cancel_requested = False
+        self.on_start = on_start
+        self.on_event = on_event
+        self.on_finish = on_finish
+
+
+def _limit_tf_threads(threads: int):
+    # must run before TensorFlow is imported in the worker
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _worker_main(conn, tf_threads: int):
+    _limit_tf_threads(tf_threads)
+    from app.service import lstm_service
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+
+        job_id, kind, payload = message
+        try:
+            if kind == "batch":
+                result = lstm_service.run_batch(payload, lambda *event: conn.send(("event", job_id, event)))
+            else:
+                result = lstm_service.run_training(payload)
+            conn.send(("done", job_id, result))
+        except Exception as e:
+            conn.send(("error", job_id, str(e)))
+
+
+class _Worker:
+    def __init__(self, context, tf_threads: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, tf_threads), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.started_at = time.monotonic()
+        self.job: Optional[Job] = None
+
+    def stop(self, graceful: bool = False):
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def _callback(fn: Callable, job: Job, *args):
+    # state callbacks must not take the dispatcher thread down with them
+    try:
+        fn(job, *args)
+    except Exception as e:
+        print(f"[SCHEDULER] callback failed for {job.key}: {e}", flush=True)
+
+
+def _summary(values) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "avg": None, "p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class TrainingScheduler:
+    def __init__(self, workers: int = TRAINING_WORKERS, tf_threads: int = TF_THREADS_PER_WORKER):
+        self.worker_count = max(1, workers)
+        self.tf_threads = max(1, tf_threads)
+        # spawn: a forked child would inherit the parent's TensorFlow state
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._heap = []
+        self._sequence = itertools.count()
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.counters = {"submitted": 0, "deduplicated": 0, "done": 0, "failed": 0,
+                         "cancelled": 0, "timed_out": 0, "worker_restarts": 0}
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    # Lifecycle
+
+    def start(self):
+        self._workers = [_Worker(self._context, self.tf_threads) for _ in range(self.worker_count)]
+        self._thread = threading.Thread(target=self._run, name="training-scheduler", daemon=True)
+        self._thread.start()
+        print(f"[SCHEDULER] {self.worker_count} workers x {self.tf_threads} TF threads", flush=True)
+
+    def shutdown(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(10)
+        for worker in self._workers:
+            worker.stop(graceful=worker.job is None)
+        self._workers = []
+
+    # Public API
+
+    def submit(self, kind: str, key: str, payload, priority: int = DEFAULT_PRIORITY,
+               timeout: float = TRAINING_JOB_TIMEOUT, symbols: FrozenSet[str] = frozenset(),
+               on_queue: Callable = None, on_start: Callable = None,
+               on_event: Callable = None, on_finish: Callable = None) -> Job:
+        """
+        Queues a job, or returns the queued/running job with the same key.
+        on_queue runs only for a new job, before any worker can pick it up.
+        """
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None:
+                self.counters["deduplicated"] += 1
+                if existing.status == TrainingStatus.STARTED and priority < existing.priority:
+                    # the old heap entry is skipped because its priority no longer matches
+                    existing.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._sequence), existing))
+                return existing
+
+            job = Job(kind, key, payload, symbols, priority, timeout,
+                      on_start or (lambda job: None),
+                      on_event or (lambda job, event: None),
+                      on_finish or (lambda job, status, result: None))
+            if on_queue is not None:
+                _callback(on_queue, job)
+            self._active[key] = job
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            self.counters["submitted"] += 1
+        self._wakeup.set()
+        return job
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._lock:
+            return self._active.get(key)
+
+    def cancel(self, key: str) -> Optional[Job]:
+        """Queued jobs are dropped at once; running ones when the dispatcher stops their worker."""
+        with self._lock:
+            job = self._active.get(key)
+            if job is None:
+                return None
+            if job.status == TrainingStatus.STARTED:
+                del self._active[key]
+                self.counters["cancelled"] += 1
+                job.status = TrainingStatus.CANCELLED
+                cancelled_now = True
+            else:
+                job.cancel_requested = True
+                cancelled_now = False
+        if cancelled_now:
+            _callback(job.on_finish, job, TrainingStatus.CANCELLED, "Cancelled before start")
+        self._wakeup.set()
+        return job
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            queued = [job for job in self._active.values() if job.status == TrainingStatus.STARTED]
+            running = [job for job in self._active.values() if job.status == TrainingStatus.RUNNING]
+            return {
+                "workers": self.worker_count,
+                "tf_threads_per_worker": self.tf_threads,
+                "queue_depth": len(queued),
+                "running": len(running),
+                "oldest_queued_seconds": max((now - job.submitted_at for job in queued), default=0.0),
+                "queued": [{"key": job.key, "kind": job.kind, "priority": job.priority,
+                            "waiting_seconds": now - job.submitted_at}
+                           for job in sorted(queued, key=lambda j: (j.priority, j.submitted_at))],
+                "running_jobs": [{"key": job.key, "kind": job.kind,
+                                  "running_seconds": now - job.started_at, "timeout": job.timeout}
+                                 for job in running],
+                "wait_seconds": _summary(self._wait_times),
+                "run_seconds": _summary(self._run_times),
+                **self.counters,
+            }
+
+    # Dispatcher thread
+
+    def _run(self):
+        while not self._stopping:
+            self._dispatch()
+            busy = [worker.conn for worker in self._workers if worker.job is not None]
+            if busy:
+                for conn in wait(busy, timeout=POLL_SECONDS):
+                    self._receive(conn)
+            else:
+                self._wakeup.wait(POLL_SECONDS)
+                self._wakeup.clear()
+            self._check_workers()
+
+    def _next_job(self, busy: Set[str]) -> Optional[Job]:
+        """Highest-priority queued job that trains none of the busy symbols."""
+        blocked = []
+        job = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            priority, _, candidate = entry
+            if candidate.status != TrainingStatus.STARTED or candidate.priority != priority:
+                continue
+            if candidate.symbols & busy:
+                blocked.append(entry)
+                continue
+            job = candidate
+            break
+        for entry in blocked:
+            heapq.heappush(self._heap, entry)
+        return job
+
+    def _dispatch(self):
+        busy = set()
+        for worker in self._workers:
+            if worker.job is not None:
+                busy |= worker.job.symbols
+        for worker in self._workers:
+            if worker.job is not None or not worker.process.is_alive():
+                continue
+            with self._lock:
+                job = self._next_job(busy)
+                if job is None:
+                    return
+                busy |= job.symbols
+                job.status = TrainingStatus.RUNNING
+                job.started_at = time.monotonic()
+                self._wait_times.append(job.started_at - job.submitted_at)
+            worker.job = job
+            _callback(job.on_start, job)
+            try:
+                worker.conn.send((job.id, job.kind, job.payload))
+            except (BrokenPipeError, OSError) as e:
+                self._restart(worker, TrainingStatus.FAILED, f"Worker unavailable: {e}")
+
+    def _receive(self, conn):
+        worker = next(w for w in self._workers if w.conn is conn)
+        try:
+            kind, job_id, data = conn.recv()
+        except (EOFError, OSError):
+            return  # worker died; _check_workers handles it
+        job = worker.job
+        if job is None or job.id != job_id:
+            return
+        if kind == "event":
+            _callback(job.on_event, job, data)
+        elif kind == "done":
+            worker.job = None
+            self._finish(job, TrainingStatus.DONE, data)
+        else:
+            worker.job = None
+            self._finish(job, TrainingStatus.FAILED, data)
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker in list(self._workers):
+            job = worker.job
+            if job is None:
+                if not worker.process.is_alive() and now - worker.started_at > WORKER_RESTART_DELAY:
+                    self._restart(worker)
+                continue
+            if job.cancel_requested:
+                self._restart(worker, TrainingStatus.CANCELLED, "Cancelled while running")
+            elif now - job.started_at > job.timeout:
+                self.counters["timed_out"] += 1
+                self._restart(worker, TrainingStatus.FAILED, f"Timed out after {job.timeout}s")
+            elif not worker.process.is_alive():
+                self._restart(worker, TrainingStatus.FAILED,
+                              f"Worker exited with code {worker.process.exitcode}")
+
+    def _restart(self, worker: _Worker, status: TrainingStatus = None, message: str = None):
+        job = worker.job
+        worker.job = None
+        worker.stop()
+        self._workers[self._workers.index(worker)] = _Worker(self._context, self.tf_threads)
+        self.counters["worker_restarts"] += 1
+        if job is not None:
+            self._finish(job, status, message)
+
+    def _finish(self, job: Job, status: TrainingStatus, result):
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            job.status = status
+            self._run_times.append(time.monotonic() - job.started_at)
+            counter = {TrainingStatus.DONE: "done", TrainingStatus.CANCELLED: "cancelled"}.get(status, "failed")
+            self.counters[counter] += 1
+        _callback(job.on_finish, job, status, result)
+
+
+scheduler = TrainingScheduler()
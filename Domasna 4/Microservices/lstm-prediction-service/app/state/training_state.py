@@ -7,5 +7,10 @@ class TrainingStatus(str, Enum):
     RUNNING = "RUNNING"
     DONE = "DONE"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
 
 training_state: Dict[str, dict] = {}
+
+# batch_id -> {"status", "total", "done", "failed", "chunks",
+#              "groups": {lookback: symbols trained with it}, "symbols": {symbol: {...}}}
+batch_state: Dict[str, dict] = {}
@@ -1,7 +1,8 @@
 import os
 import random
+from datetime import datetime, timedelta, timezone
 from math import sqrt
-from typing import Dict
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
@@ -13,6 +14,7 @@ from keras.callbacks import EarlyStopping, ReduceLROnPlateau
 from keras.layers import LSTM, Dense, Dropout
 from keras.models import Sequential
 from keras.optimizers import Adam
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.metrics import (
     mean_squared_error,
     r2_score,
@@ -20,6 +22,14 @@ from sklearn.metrics import (
 )
 from sklearn.preprocessing import MinMaxScaler
 
+from ml import model_registry
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # optional: without it history always comes from Postgres
+    pa = None
+
 # Configuration
 load_dotenv()
 
@@ -30,12 +40,25 @@ PG_USER = os.getenv("PG_USER")
 PG_PASSWORD = os.getenv("PG_PASSWORD")
 PG_SSLMODE = os.getenv("PG_SSLMODE", "require")
 
+# Arrow copy of historical_data kept in sync by the ingestion pipeline
+# (crypto-project/data_access/columnar_store.py); unset = read from Postgres
+HISTORY_STORE_DIR = os.getenv("HISTORY_STORE_DIR")
+HISTORY_YEARS = 5
+
 DEFAULT_LOOKBACK = 21
 EPOCHS = 5
 BATCH_SIZE = 16
 SEED_VALUE = 42
 MIN_LSTM_LENGTH = 120
 
+# Incremental training: warm start from the registry model on the newest windows
+FINE_TUNE_WINDOWS = 90
+FINE_TUNE_EPOCHS = 3
+# full retrain from scratch at least this often
+FULL_RETRAIN_DAYS = int(os.getenv("FULL_RETRAIN_DAYS", "30"))
+# error on the new days above DRIFT_FACTOR x test MAE means the model drifted
+DRIFT_FACTOR = float(os.getenv("DRIFT_FACTOR", "3.0"))
+
 np.random.seed(SEED_VALUE)
 tf.random.set_seed(SEED_VALUE)
 random.seed(SEED_VALUE)
@@ -54,7 +77,28 @@ def get_conn():
     )
 
 
+def load_history_from_store(symbol: str):
+    """
+    Memory-maps <HISTORY_STORE_DIR>/history/<SYMBOL>.arrow and returns the
+    same (date, close) frame as the SQL query, or None if the symbol is not there.
+    """
+    if not HISTORY_STORE_DIR or pa is None:
+        return None
+    path = os.path.join(HISTORY_STORE_DIR, "history", f"{symbol}.arrow")
+    if not os.path.exists(path):
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    since = (pd.Timestamp.today() - pd.DateOffset(years=HISTORY_YEARS)).date()
+    table = table.filter(pc.greater_equal(table["date"], pa.scalar(since, pa.date32())))
+    return table.select(["date", "close"]).to_pandas()
+
+
 def load_history(symbol: str) -> pd.DataFrame:
+    df = load_history_from_store(symbol)
+    if df is not None:
+        return df
+
     query = """
         SELECT date, close
         FROM historical_data
@@ -66,6 +110,71 @@ def load_history(symbol: str) -> pd.DataFrame:
         return pd.read_sql(query, conn, params=(symbol,))
 
 
+def load_histories(symbols: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    History for many symbols at once: the Arrow store where it has the symbol,
+    one query for the rest. symbols=None means every symbol with history.
+    """
+    histories = {}
+    if symbols is not None:
+        for symbol in symbols:
+            df = load_history_from_store(symbol)
+            if df is not None:
+                histories[symbol] = df
+        remaining = [s for s in symbols if s not in histories]
+        if not remaining:
+            return histories
+
+    query = """
+        SELECT symbol, date, close
+        FROM historical_data
+        WHERE date >= CURRENT_DATE - interval '5 years'
+    """
+    params = ()
+    if symbols is not None:
+        query += " AND symbol = ANY(%s)"
+        params = (remaining,)
+    query += " ORDER BY symbol, date ASC"
+
+    with get_conn() as conn:
+        df = pd.read_sql(query, conn, params=params)
+    for symbol, group in df.groupby("symbol", sort=False):
+        histories[symbol] = group[["date", "close"]].reset_index(drop=True)
+    return histories
+
+
+def list_symbols() -> List[str]:
+    """Every symbol with history in the training window, i.e. what load_histories(None) returns."""
+    query = """
+        SELECT DISTINCT symbol
+        FROM historical_data
+        WHERE date >= CURRENT_DATE - interval '5 years'
+        ORDER BY symbol
+    """
+    with get_conn() as conn:
+        return pd.read_sql(query, conn)["symbol"].tolist()
+
+
+def load_recent_history(symbol: str, n: int, df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Only the last n days, which is all inference needs."""
+    if df is not None:
+        return df.tail(n).reset_index(drop=True)
+    df = load_history_from_store(symbol)
+    if df is not None:
+        return df.tail(n).reset_index(drop=True)
+
+    query = """
+        SELECT date, close
+        FROM historical_data
+        WHERE symbol = %s
+        ORDER BY date DESC
+        LIMIT %s
+    """
+    with get_conn() as conn:
+        df = pd.read_sql(query, conn, params=(symbol, n))
+    return df.iloc[::-1].reset_index(drop=True)
+
+
 # Helper functions
 def should_use_log(df: pd.DataFrame) -> bool:
     """
@@ -94,25 +203,48 @@ def choose_lookback(n_rows: int, use_log: bool) -> int:
 
 
 def make_sequences(data: np.ndarray, lookback: int):
-    X, y = [], []
-    for i in range(lookback, len(data)):
-        X.append(data[i - lookback:i])
-        y.append(data[i])
-    return np.array(X), np.array(y)
-
-
-def split_data(X, y):
-    train_size = int(len(X) * 0.7)
-    val_size = int(len(X) * 0.15)
-
-    return (
-        X[:train_size],
-        y[:train_size],
-        X[train_size:train_size + val_size],
-        y[train_size:train_size + val_size],
-        X[train_size + val_size:],
-        y[train_size + val_size:]
-    )
+    """
+    Windows as strided views over `data`, with no copy and no per-window Python work:
+    X[i] = data[i:i + lookback] shaped (lookback, 1), y[i] = data[i + lookback].
+    """
+    X = sliding_window_view(data[:-1], lookback)[:, :, np.newaxis]
+    return X, data[lookback:]
+
+
+def split_bounds(n_windows: int):
+    """End of the train and validation windows (70% / 15% / 15%)."""
+    train_size = int(n_windows * 0.7)
+    val_size = int(n_windows * 0.15)
+    return train_size, train_size + val_size
+
+
+def fit_scaler(series: np.ndarray, fit_until: int) -> MinMaxScaler:
+    # one scaler for inputs and targets, fit on the part of the series the training windows see
+    scaler = MinMaxScaler()
+    scaler.fit(series[:fit_until].reshape(-1, 1))
+    return scaler
+
+
+def scale_series(scaler: MinMaxScaler, series: np.ndarray) -> np.ndarray:
+    return scaler.transform(series.reshape(-1, 1)).ravel().astype(np.float32)
+
+
+def make_dataset(X: np.ndarray, y: np.ndarray, batch_size: int) -> tf.data.Dataset:
+    """
+    Batched, prefetching input pipeline over the strided windows. Only one batch
+    at a time is copied out of the view, while the model works on the previous one.
+    """
+    def batches():
+        for i in range(0, len(X), batch_size):
+            yield X[i:i + batch_size], y[i:i + batch_size]
+
+    return tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(
+            tf.TensorSpec(shape=(None, X.shape[1], 1), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        ),
+    ).prefetch(tf.data.AUTOTUNE)
 
 
 def build_model(input_shape):
@@ -155,14 +287,135 @@ def calculate_metrics(y_true, y_pred):
     return rmse, mae, mape, r2
 
 
+def predict_next_close(model, scaler: MinMaxScaler, window: np.ndarray, use_log: bool) -> float:
+    """Next-day close from the last `lookback` closes (log1p already applied if use_log)."""
+    window_s = scale_series(scaler, window).reshape(1, -1, 1)
+    # calling the model directly avoids predict()'s per-call setup for a single window
+    next_pred_s = float(model(window_s, training=False).numpy()[0][0])
+    next_pred = scaler.inverse_transform([[next_pred_s]])[0][0]
+    return float(np.expm1(next_pred)) if use_log else float(next_pred)
+
+
+def prediction_result(symbol: str, last_date, next_price: float, metrics: Dict, lookback: int) -> Dict:
+    next_date = pd.to_datetime(last_date) + pd.Timedelta(days=1)
+    return {
+        "symbol": symbol,
+        "prediction_date": str(next_date.date()),
+        "predicted_close": next_price,
+        "lookback": lookback,
+        **metrics
+    }
+
+
 # Main service entry point
-def train_lstm_for_symbol(symbol: str) -> Dict:
+def predict_from_registry(symbol: str, history: Optional[pd.DataFrame] = None) -> Optional[Dict]:
+    """
+    Inference only, with the stored model for the symbol. None if there is no
+    model yet, new data arrived after it was trained or it is older than
+    MODEL_MAX_AGE_DAYS; the caller then trains a new one.
+    """
+    entry = model_registry.load(symbol)
+    if entry is None:
+        return None
+
+    df = load_recent_history(symbol, entry.lookback, history)
+    if len(df) < entry.lookback:
+        return None
+    last_date = pd.to_datetime(df["date"].iloc[-1]).date()
+    if not entry.is_fresh(last_date):
+        return None
+
+    closes = df["close"].values.astype(float)
+    window = np.log1p(closes) if entry.use_log else closes
+    next_price = predict_next_close(entry.model, entry.scaler, window, entry.use_log)
+    return prediction_result(symbol, last_date, next_price, entry.metrics, entry.lookback)
+
+
+def fine_tune_lstm_for_symbol(symbol: str, history: Optional[pd.DataFrame] = None) -> Optional[Dict]:
+    """
+    Warm start: loads the registry model and trains it for a few epochs on the
+    newest windows instead of building a new one. Returns None when a full
+    retrain is due instead: no stored model, the last full training is older
+    than FULL_RETRAIN_DAYS, no or too many new days, or drift on the new days.
+    """
+    entry = model_registry.load_for_update(symbol)
+    if entry is None:
+        return None
+    if datetime.now(tz=timezone.utc) - entry.full_trained_at > timedelta(days=FULL_RETRAIN_DAYS):
+        print(f"[LSTM] {symbol}: scheduled full retrain", flush=True)
+        return None
+
+    lookback = entry.lookback
+    df = load_recent_history(symbol, FINE_TUNE_WINDOWS + lookback, history)
+    new_days = int((pd.to_datetime(df["date"]).dt.date > entry.last_date).sum())
+    if new_days == 0 or new_days > min(FINE_TUNE_WINDOWS, len(df) - lookback):
+        return None
+
+    closes_raw = df["close"].values.astype(float)
+    closes = np.log1p(closes_raw) if entry.use_log else closes_raw
+    scaler = entry.scaler
+
+    # Drift check: the stored model on the days it has not seen yet
+    X, _ = make_sequences(scale_series(scaler, closes), lookback)
+    pred_s = entry.model(X[-new_days:], training=False).numpy()
+    pred = scaler.inverse_transform(pred_s)[:, 0]
+    actual = closes[-new_days:]
+    if entry.use_log:
+        pred, actual = np.expm1(pred), np.expm1(actual)
+    recent_mae = float(np.mean(np.abs(actual - pred)))
+    test_mae = entry.metrics.get("mae")
+    if test_mae and recent_mae > DRIFT_FACTOR * test_mae:
+        print(f"[LSTM] {symbol}: drift (MAE {recent_mae:.6f} vs {test_mae:.6f}), full retrain", flush=True)
+        return None
+
+    # the scaler is refit only when the new days leave its range; partial_fit only widens it
+    new_values = closes[-new_days:]
+    if new_values.min() < scaler.data_min_[0] or new_values.max() > scaler.data_max_[0]:
+        scaler.partial_fit(new_values.reshape(-1, 1))
+
+    scaled = scale_series(scaler, closes)
+    X, y = make_sequences(scaled, lookback)
+    entry.model.fit(
+        make_dataset(X, y, BATCH_SIZE),
+        epochs=FINE_TUNE_EPOCHS,
+        verbose=0
+    )
+
+    next_price = predict_next_close(entry.model, scaler, closes[-lookback:], entry.use_log)
+    last_date = pd.to_datetime(df["date"].iloc[-1]).date()
+    model_registry.save(symbol, entry.model, scaler, lookback, entry.use_log, last_date,
+                        entry.metrics, full_trained_at=entry.full_trained_at)
+    print(f"[LSTM] {symbol}: fine-tuned on {len(X)} windows ({new_days} new days)", flush=True)
+
+    return prediction_result(symbol, last_date, next_price, entry.metrics, entry.lookback)
+
+
+def predict_lstm_for_symbol(symbol: str, history: Optional[pd.DataFrame] = None) -> Dict:
+    """
+    Stored model if it is fresh, else a warm-start fine-tune, else a full training.
+    `history` is the already loaded frame when the symbol is part of a batch.
+    A registry entry that cannot be read (missing files, a Keras upgrade)
+    counts as a miss, so a full training replaces it.
+    """
+    for step in (predict_from_registry, fine_tune_lstm_for_symbol):
+        try:
+            result = step(symbol, history)
+        except Exception as e:
+            print(f"[LSTM] {symbol}: {step.__name__} failed, falling back: {e}", flush=True)
+            continue
+        if result is not None:
+            return result
+    return train_lstm_for_symbol(symbol, history)
+
+
+def train_lstm_for_symbol(symbol: str, history: Optional[pd.DataFrame] = None) -> Dict:
     """
     End-to-end LSTM workflow:
     data loading, preprocessing, training and evaluation.
+    The trained model is stored in the registry for later inference.
     Returns next-day price prediction on demand.
     """
-    df = load_history(symbol)
+    df = history if history is not None else load_history(symbol)
 
     if df.empty or len(df) < MIN_LSTM_LENGTH:
         raise ValueError(
@@ -176,23 +429,11 @@ def train_lstm_for_symbol(symbol: str) -> Dict:
     closes_raw = df["close"].values.astype(float)
     closes = np.log1p(closes_raw) if use_log else closes_raw
 
-    X_raw, y_raw = make_sequences(closes, lookback)
-    X_train, y_train, X_val, y_val, X_test, y_test = split_data(X_raw, y_raw)
-
-    scaler_X = MinMaxScaler()
-    scaler_y = MinMaxScaler()
-
-    X_train_s = scaler_X.fit_transform(X_train)
-    X_val_s = scaler_X.transform(X_val)
-    X_test_s = scaler_X.transform(X_test)
-
-    y_train_s = scaler_y.fit_transform(y_train.reshape(-1, 1))
-    y_val_s = scaler_y.transform(y_val.reshape(-1, 1))
-    y_test_s = scaler_y.transform(y_test.reshape(-1, 1))
-
-    X_train_l = X_train_s.reshape(-1, lookback, 1)
-    X_val_l = X_val_s.reshape(-1, lookback, 1)
-    X_test_l = X_test_s.reshape(-1, lookback, 1)
+    # scaled once as a series; windows are views over it
+    train_end, val_end = split_bounds(len(closes) - lookback)
+    scaler = fit_scaler(closes, train_end + lookback)
+    scaled = scale_series(scaler, closes)
+    X, y = make_sequences(scaled, lookback)
 
     model = build_model((lookback, 1))
 
@@ -202,19 +443,16 @@ def train_lstm_for_symbol(symbol: str) -> Dict:
     ]
 
     model.fit(
-        X_train_l,
-        y_train_s,
+        make_dataset(X[:train_end], y[:train_end], BATCH_SIZE),
         epochs=EPOCHS,
-        batch_size=BATCH_SIZE,
-        validation_data=(X_val_l, y_val_s),
-        shuffle=False,
+        validation_data=make_dataset(X[train_end:val_end], y[train_end:val_end], BATCH_SIZE),
         verbose=1,
         callbacks=callbacks
     )
 
-    y_pred_s = model.predict(X_test_l, verbose=0)
-    y_pred = scaler_y.inverse_transform(y_pred_s)[:, 0]
-    y_test_orig = scaler_y.inverse_transform(y_test_s)[:, 0]
+    y_pred_s = model.predict(make_dataset(X[val_end:], y[val_end:], BATCH_SIZE), verbose=0)
+    y_pred = scaler.inverse_transform(y_pred_s)[:, 0]
+    y_test_orig = closes[lookback + val_end:]
 
     if use_log:
         y_pred = np.expm1(y_pred)
@@ -222,23 +460,10 @@ def train_lstm_for_symbol(symbol: str) -> Dict:
 
     rmse, mae, mape, r2 = calculate_metrics(y_test_orig, y_pred)
 
-    last_window = closes[-lookback:]
-    last_window_s = scaler_X.transform(last_window.reshape(1, -1))
-    last_window_l = last_window_s.reshape(1, lookback, 1)
-
-    next_pred_s = model.predict(last_window_l, verbose=0)[0][0]
-    next_pred = scaler_y.inverse_transform([[next_pred_s]])[0][0]
-    next_price = float(np.expm1(next_pred)) if use_log else float(next_pred)
+    next_price = predict_next_close(model, scaler, closes[-lookback:], use_log)
 
-    last_date = pd.to_datetime(df["date"].iloc[-1])
-    next_date = last_date + pd.Timedelta(days=1)
+    last_date = pd.to_datetime(df["date"].iloc[-1]).date()
+    metrics = {"rmse": rmse, "mae": mae, "mape": mape, "r2": r2}
+    model_registry.save(symbol, model, scaler, lookback, use_log, last_date, metrics)
 
-    return {
-        "symbol": symbol,
-        "prediction_date": str(next_date.date()),
-        "predicted_close": next_price,
-        "rmse": rmse,
-        "mae": mae,
-        "mape": mape,
-        "r2": r2
-    }
+    return prediction_result(symbol, last_date, next_price, metrics, lookback)
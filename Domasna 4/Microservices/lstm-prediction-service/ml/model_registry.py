@@ -0,0 +1,180 @@
+"""
+On-disk registry of trained LSTM models, one entry per symbol:
+
+    <MODEL_REGISTRY_DIR>/<SYMBOL>/current.json            {"version": ...}
+    <MODEL_REGISTRY_DIR>/<SYMBOL>/<version>/model.keras
+    <MODEL_REGISTRY_DIR>/<SYMBOL>/<version>/scaler.pkl
+    <MODEL_REGISTRY_DIR>/<SYMBOL>/<version>/meta.json      lookback, use_log, last_date, trained_at,
+                                                           full_trained_at, metrics
+
+A new version is written next to the old one and current.json is swapped
+atomically, so a reader never pairs a model with another version's scaler.
+Writers for the same symbol are serialized with a file lock (<SYMBOL>/.lock),
+which also covers the worker processes.
+Loaded models are kept in memory, so repeated predictions skip the disk.
+"""
+import fcntl
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from cachetools import LRUCache
+from dotenv import load_dotenv
+from keras.models import load_model
+
+load_dotenv()
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(SERVICE_DIR, "saved_models"))
+# a model older than this is retrained even if no new data arrived
+MODEL_MAX_AGE_DAYS = int(os.getenv("MODEL_MAX_AGE_DAYS", "7"))
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "64"))
+
+
+@dataclass
+class RegisteredModel:
+    symbol: str
+    version: str
+    model: object
+    scaler: object
+    lookback: int
+    use_log: bool
+    last_date: date
+    trained_at: datetime
+    metrics: Dict[str, Optional[float]]
+    # last training from scratch; fine-tuned versions carry it over
+    full_trained_at: datetime
+
+    def age(self, now: Optional[datetime] = None) -> timedelta:
+        return (now or datetime.now(tz=timezone.utc)) - self.trained_at
+
+    def is_fresh(self, latest_date: date, now: Optional[datetime] = None) -> bool:
+        """Trained on the latest data date and not older than MODEL_MAX_AGE_DAYS."""
+        return self.last_date >= latest_date and self.age(now) < timedelta(days=MODEL_MAX_AGE_DAYS)
+
+
+_cache: LRUCache = LRUCache(maxsize=MODEL_CACHE_SIZE)
+_lock = threading.Lock()
+
+
+def _symbol_dir(symbol: str) -> str:
+    return os.path.join(MODEL_REGISTRY_DIR, symbol)
+
+
+@contextmanager
+def _symbol_lock(symbol: str):
+    symbol_dir = _symbol_dir(symbol)
+    os.makedirs(symbol_dir, exist_ok=True)
+    with open(os.path.join(symbol_dir, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield symbol_dir
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _current_version(symbol: str) -> Optional[str]:
+    path = os.path.join(_symbol_dir(symbol), "current.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["version"]
+
+
+def _read_entry(symbol: str, version: str) -> RegisteredModel:
+    version_dir = os.path.join(_symbol_dir(symbol), version)
+    with open(os.path.join(version_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(os.path.join(version_dir, "scaler.pkl"), "rb") as f:
+        scaler = pickle.load(f)
+    model = load_model(os.path.join(version_dir, "model.keras"))
+
+    return RegisteredModel(
+        symbol=symbol,
+        version=version,
+        model=model,
+        scaler=scaler,
+        lookback=meta["lookback"],
+        use_log=meta["use_log"],
+        last_date=date.fromisoformat(meta["last_date"]),
+        trained_at=datetime.fromisoformat(meta["trained_at"]),
+        metrics=meta["metrics"],
+        full_trained_at=datetime.fromisoformat(meta.get("full_trained_at", meta["trained_at"])),
+    )
+
+
+def load(symbol: str) -> Optional[RegisteredModel]:
+    """The current model for the symbol, or None if it was never trained."""
+    version = _current_version(symbol)
+    if version is None:
+        return None
+
+    with _lock:
+        entry = _cache.get(symbol)
+    if entry is not None and entry.version == version:
+        return entry
+
+    entry = _read_entry(symbol, version)
+    with _lock:
+        _cache[symbol] = entry
+    return entry
+
+
+def load_for_update(symbol: str) -> Optional[RegisteredModel]:
+    """
+    A private copy read from disk, for fine-tuning. The cached model keeps
+    serving inference unchanged until the new version is saved.
+    """
+    version = _current_version(symbol)
+    return None if version is None else _read_entry(symbol, version)
+
+
+def save(symbol: str, model, scaler, lookback: int, use_log: bool, last_date: date,
+         metrics: Dict[str, Optional[float]], full_trained_at: Optional[datetime] = None) -> RegisteredModel:
+    """full_trained_at is passed by fine-tuning; a full training starts a new one."""
+    trained_at = datetime.now(tz=timezone.utc)
+    full_trained_at = full_trained_at or trained_at
+    version = trained_at.strftime("%Y%m%dT%H%M%S%f")
+
+    with _symbol_lock(symbol) as symbol_dir:
+        version_dir = os.path.join(symbol_dir, version)
+        os.makedirs(version_dir, exist_ok=True)
+
+        model.save(os.path.join(version_dir, "model.keras"))
+        with open(os.path.join(version_dir, "scaler.pkl"), "wb") as f:
+            pickle.dump(scaler, f)
+        with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "symbol": symbol,
+                "lookback": lookback,
+                "use_log": use_log,
+                "last_date": last_date.isoformat(),
+                "trained_at": trained_at.isoformat(),
+                "full_trained_at": full_trained_at.isoformat(),
+                "metrics": metrics,
+            }, f, indent=2)
+
+        previous = _current_version(symbol)
+        fd, tmp_path = tempfile.mkstemp(prefix="current.json.", suffix=".tmp", dir=symbol_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": version}, f)
+        os.replace(tmp_path, os.path.join(symbol_dir, "current.json"))
+
+        # the previous version stays for readers that are still loading it
+        for name in os.listdir(symbol_dir):
+            path = os.path.join(symbol_dir, name)
+            if os.path.isdir(path) and name not in (version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+    entry = RegisteredModel(symbol, version, model, scaler, lookback, use_log,
+                            last_date, trained_at, metrics, full_trained_at)
+    with _lock:
+        _cache[symbol] = entry
+    return entry
@@ -0,0 +1,123 @@
+"""
+Benchmark: старата патека (еден INSERT по ден) наспроти bulk upsert.
+
+Се извршува од root-от на проектот, врз базата од configuration/config.py:
+
+    python -m benchmarks.bench_histoday_insert --days 3650
+
+Користи привремен симбол кој се брише на крајот.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from configuration.config import HISTODAY_CUTOFF
+from data_access import db
+
+BENCH_SYMBOL = "ZZBENCH"
+
+
+def make_chunk(days: int) -> List[dict]:
+    start = datetime(HISTODAY_CUTOFF.year, HISTODAY_CUTOFF.month, HISTODAY_CUTOFF.day, tzinfo=timezone.utc)
+    chunk = []
+    for i in range(days):
+        ts = int((start + timedelta(days=i)).timestamp())
+        price = 100.0 + i * 0.01
+        chunk.append({
+            "time": ts,
+            "open": price,
+            "high": price * 1.02,
+            "low": price * 0.98,
+            "close": price * 1.01,
+            "volumefrom": 1000.0 + i,
+            "volumeto": (1000.0 + i) * price,
+        })
+    return chunk
+
+
+def legacy_insert(symbol: str, data: List[dict]) -> int:
+    # Стариот insert_histoday: по еден round trip за секој ден
+    rows = db.histoday_rows(symbol, data)
+    with db.connection() as conn:
+        cur = conn.cursor()
+        for row in rows:
+            cur.execute("""
+                INSERT INTO historical_data
+                (symbol, date, close, high, low, open, volume_from, volume_to)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (symbol, date) DO UPDATE
+                SET close       = EXCLUDED.close,
+                    high        = EXCLUDED.high,
+                    low         = EXCLUDED.low,
+                    open        = EXCLUDED.open,
+                    volume_from = EXCLUDED.volume_from,
+                    volume_to   = EXCLUDED.volume_to
+            """, row)
+        conn.commit()
+    return len(rows)
+
+
+def bulk_insert(symbol: str, data: List[dict]) -> int:
+    inserted, updated = db.upsert_histoday(symbol, data)
+    return inserted + (updated or 0)
+
+
+def clear_history(symbol: str):
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM historical_data WHERE symbol = %s", (symbol,))
+        conn.commit()
+
+
+def drop_symbol(symbol: str):
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM coins WHERE symbol = %s", (symbol,))
+        conn.commit()
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def run(days: int, repeat: int) -> dict:
+    db.init_db()
+    db.insert_coins({BENCH_SYMBOL: "Benchmark coin"})
+    chunk = make_chunk(days)
+    rows = len(db.histoday_rows(BENCH_SYMBOL, chunk))
+
+    results = {}
+    try:
+        for name, fn in (("row-by-row", legacy_insert), ("bulk", bulk_insert)):
+            cold, warm = [], []
+            for _ in range(repeat):
+                clear_history(BENCH_SYMBOL)
+                cold.append(timed(fn, BENCH_SYMBOL, chunk))   # сите редови се нови
+                warm.append(timed(fn, BENCH_SYMBOL, chunk))   # сите редови се ажурираат
+            results[name] = {"insert_s": min(cold), "update_s": min(warm)}
+    finally:
+        drop_symbol(BENCH_SYMBOL)
+
+    print(f"{rows} rows per run, best of {repeat}")
+    print(f"{'path':<12} {'insert rows/s':>14} {'update rows/s':>14}")
+    for name, r in results.items():
+        print(f"{name:<12} {rows / r['insert_s']:>14.0f} {rows / r['update_s']:>14.0f}")
+    base, bulk = results["row-by-row"], results["bulk"]
+    print(f"speedup: insert x{base['insert_s'] / bulk['insert_s']:.1f}, "
+          f"update x{base['update_s'] / bulk['update_s']:.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="histoday insert benchmark")
+    parser.add_argument("--days", type=int, default=3650, help="days of history per run")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.days, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
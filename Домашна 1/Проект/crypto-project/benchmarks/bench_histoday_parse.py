@@ -0,0 +1,87 @@
+"""
+Benchmark: CPU време по запис за обработка на histoday одговор, без мрежа и без база.
+
+- dict:     json.loads → datetime филтер за опсег → db.histoday_rows (старата патека)
+- columnar: orjson → structured array → векторизирани филтри → редови за upsert
+
+    python -m benchmarks.bench_histoday_parse --days 2000 --chunks 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Callable, List
+
+from benchmarks.bench_histoday_insert import make_chunk
+from configuration.config import START_DATE, LAST_DATE
+from data_access import db
+from services import histoday_columns
+from services.api_client import json_loads
+
+BENCH_SYMBOL = "ZZBENCH"
+
+
+def dict_path(bodies: List[bytes]) -> int:
+    rows = 0
+    for body in bodies:
+        chunk = json.loads(body)["Data"]["Data"]
+        in_range = []
+        for rec in chunk:
+            rec_date = datetime.fromtimestamp(rec["time"], tz=timezone.utc).date()
+            if START_DATE <= rec_date <= LAST_DATE:
+                in_range.append(rec)
+        merged = {}
+        for row in db.histoday_rows(BENCH_SYMBOL, in_range):
+            merged[row[1]] = row
+        rows += len([merged[d] for d in sorted(merged)])
+    return rows
+
+
+def columnar_path(bodies: List[bytes]) -> int:
+    rows = 0
+    for body in bodies:
+        chunk = json_loads(body)["Data"]["Data"]
+        days, _ = histoday_columns.select(histoday_columns.from_records(chunk), START_DATE, LAST_DATE)
+        rows += len(histoday_columns.to_rows(BENCH_SYMBOL, histoday_columns.merge([days])))
+    return rows
+
+
+def cpu_time(fn: Callable[[List[bytes]], int], bodies: List[bytes], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(bodies)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(days: int, chunks: int, repeat: int) -> dict:
+    body = json.dumps({"Response": "Success", "Data": {"Data": make_chunk(days)}}).encode()
+    bodies = [body] * chunks
+    records = days * chunks
+    rows = columnar_path(bodies[:1])
+    assert rows == dict_path(bodies[:1]), "paths disagree"
+
+    results = {name: cpu_time(fn, bodies, repeat)
+               for name, fn in (("dict", dict_path), ("columnar", columnar_path))}
+
+    print(f"{records} records ({chunks} chunks x {days} days, {rows} rows kept per chunk), best of {repeat}")
+    print(f"{'path':<10} {'CPU s':>8} {'us/record':>10}")
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds:>8.3f} {seconds / records * 1e6:>10.2f}")
+    print(f"speedup: x{results['dict'] / results['columnar']:.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="histoday parse benchmark (CPU per record)")
+    parser.add_argument("--days", type=int, default=2000, help="records per chunk (API max is 2000)")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.days, args.chunks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark: обична (heap) historical_data наспроти партиционирана по година.
+
+Двете шеми се полнат со исти синтетички податоци во посебни Postgres шеми
+(bench_heap и bench_part), па се мерат:
+  - читање на 5 години за еден симбол (LSTM/TA патеката), p50/p95
+  - upsert на последните 30 дена за еден симбол (дневниот инкремент), p50/p95
+
+    python -m benchmarks.bench_partitioning --symbols 200 --samples 200
+
+Редовите се внесуваат по датум (како дневните извршувања), не по симбол,
+за heap табелата да не е вештачки кластерирана по symbol.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from configuration.config import HISTODAY_CUTOFF
+from data_access import db
+
+SCHEMAS = {"heap": ("bench_heap", False), "partitioned": ("bench_part", True)}
+READ_YEARS = 5
+
+
+def use_schema(schema: str):
+    # libpq ја чита PGOPTIONS при секое отворање конекција (без pool)
+    os.environ["PGOPTIONS"] = f"-c search_path={schema}"
+
+
+def seed(schema: str, partitioned: bool, symbols: int, end: date):
+    use_schema(schema)
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {schema}")
+        conn.commit()
+        db.create_tables(cur, partitioned)
+        cur.execute("""
+            INSERT INTO coins (symbol, full_name)
+            SELECT 'B' || s, 'Bench ' || s FROM generate_series(1, %s) s
+        """, (symbols,))
+        cur.execute("""
+            INSERT INTO historical_data
+            (symbol, date, close, high, low, open, volume_from, volume_to)
+            SELECT 'B' || s, d::date, 100 + s, 101 + s, 99 + s, 100 + s, 1000, 100000
+            FROM generate_series(%s::date, %s::date, interval '1 day') d,
+                 generate_series(1, %s) s
+            ORDER BY d, s
+        """, (HISTODAY_CUTOFF, end, symbols))
+        conn.commit()
+        # VACUUM го поставува visibility map-от (како autovacuum), без него
+        # index-only scan-от преку INCLUDE (close) не може да се искористи
+        conn.autocommit = True
+        cur.execute("VACUUM ANALYZE historical_data")
+        conn.autocommit = False
+        cur.execute("SELECT pg_total_relation_size('historical_data'::regclass)")
+        size = cur.fetchone()[0]
+        if partitioned:
+            cur.execute("""
+                SELECT COALESCE(SUM(pg_total_relation_size(inhrelid)), 0)
+                FROM pg_inherits WHERE inhparent = 'historical_data'::regclass
+            """)
+            size = cur.fetchone()[0]
+        conn.commit()
+    return size
+
+
+def read_range(cur, symbol: str, start: date, end: date) -> int:
+    cur.execute("""
+        SELECT date, close
+        FROM historical_data
+        WHERE symbol = %s AND date BETWEEN %s AND %s
+        ORDER BY date
+    """, (symbol, start, end))
+    return len(cur.fetchall())
+
+
+def upsert_rows(symbol: str, end: date, days: int):
+    rows = []
+    for i in range(days):
+        price = random.uniform(90, 110)
+        rows.append((symbol, end - timedelta(days=i), price, price * 1.01, price * 0.99,
+                     price, 1000.0, 1000.0 * price))
+    return rows
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(schema: str, symbols: int, samples: int, end: date) -> dict:
+    use_schema(schema)
+    start = end - timedelta(days=365 * READ_YEARS)
+    picks = [f"B{random.randint(1, symbols)}" for _ in range(samples)]
+
+    reads = []
+    with db.connection() as conn:
+        cur = conn.cursor()
+        for symbol in picks:
+            t0 = time.perf_counter()
+            read_range(cur, symbol, start, end)
+            reads.append(time.perf_counter() - t0)
+        conn.rollback()
+
+    upserts = []
+    for symbol in picks:
+        rows = upsert_rows(symbol, end, 30)
+        t0 = time.perf_counter()
+        db.upsert_histoday_rows(rows)
+        upserts.append(time.perf_counter() - t0)
+
+    return {
+        "read_p50_ms": percentile(reads, 0.5) * 1000,
+        "read_p95_ms": percentile(reads, 0.95) * 1000,
+        "upsert_p50_ms": percentile(upserts, 0.5) * 1000,
+        "upsert_p95_ms": percentile(upserts, 0.95) * 1000,
+        "read_mean_ms": statistics.mean(reads) * 1000,
+    }
+
+
+def run(symbols: int, samples: int, keep: bool) -> dict:
+    end = datetime.now(tz=timezone.utc).date()
+    results = {}
+    try:
+        for name, (schema, partitioned) in SCHEMAS.items():
+            t0 = time.perf_counter()
+            size = seed(schema, partitioned, symbols, end)
+            print(f"[{name}] seeded in {time.perf_counter() - t0:.1f}s, {size / 2 ** 20:.1f} MiB")
+            results[name] = measure(schema, symbols, samples, end)
+    finally:
+        if not keep:
+            for schema, _ in SCHEMAS.values():
+                use_schema("public")
+                with db.connection() as conn:
+                    conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                    conn.commit()
+        os.environ.pop("PGOPTIONS", None)
+
+    print(f"{symbols} symbols since {HISTODAY_CUTOFF}, {samples} samples, "
+          f"{READ_YEARS}-year range reads")
+    print(f"{'schema':<12} {'read p50':>9} {'read p95':>9} {'upsert p50':>11} {'upsert p95':>11}  (ms)")
+    for name, r in results.items():
+        print(f"{name:<12} {r['read_p50_ms']:>9.2f} {r['read_p95_ms']:>9.2f} "
+              f"{r['upsert_p50_ms']:>11.2f} {r['upsert_p95_ms']:>11.2f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="heap vs partitioned historical_data benchmark")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="keep the bench_* schemas for inspection")
+    args = parser.parse_args()
+    run(args.symbols, args.samples, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+End-to-end benchmark за pipeline/main.py врз локален fake CryptoCompare
+(benchmarks/fake_cryptocompare.py) и посебна Postgres база.
+
+Сценарија:
+- cold:        празна база → Filter1 + целосен backfill + snapshots
+- incremental: се брише последниот ден историја и денешните snapshots,
+               што одговара на дневното извршување
+
+    python -m benchmarks.bench_pipeline --coins 200 --latency-ms 50 --concurrency 8
+
+Резултатите се запишуваат во benchmarks/results/<време>-<commit>.json
+и се споредуваат со последното извршување со исти параметри.
+ВНИМАНИЕ: табелите во --pg-db се бришат.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import psycopg2
+
+from configuration.config import PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PROJECT_DIR
+
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+METRICS = ["wall_s", "symbols_per_s", "http_calls_per_symbol", "db_rows_per_s"]
+
+
+def pg_connect(dbname: str):
+    return psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=dbname, user=PG_USER, password=PG_PASSWORD)
+
+
+def ensure_database(dbname: str):
+    conn = pg_connect("postgres")
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{dbname}"')
+    finally:
+        conn.close()
+
+
+def execute(dbname: str, sql: str, params=None):
+    conn = pg_connect(dbname)
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def table_counts(dbname: str) -> dict:
+    conn = pg_connect(dbname)
+    try:
+        cur = conn.cursor()
+        counts = {}
+        for table in ("coins", "historical_data", "snapshots"):
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            if cur.fetchone()[0] is None:
+                counts[table] = 0
+                continue
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def fake_request(base: str, path: str, method: str = "GET") -> dict:
+    req = urllib.request.Request(base + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def start_fake(args) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "benchmarks.fake_cryptocompare",
+        "--port", str(args.port), "--coins", str(args.coins),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+    ]
+    proc = subprocess.Popen(cmd, cwd=PROJECT_DIR)
+    base = f"http://127.0.0.1:{args.port}"
+    for _ in range(100):
+        try:
+            fake_request(base, "/__stats")
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake CryptoCompare did not start")
+
+
+def run_pipeline(args, env: dict, log_path: str) -> float:
+    cmd = [sys.executable, "-m", "pipeline.main", "--concurrency", str(args.concurrency)]
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        result = subprocess.run(cmd, cwd=PROJECT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        with open(log_path, encoding="utf-8") as log:
+            print("".join(log.readlines()[-30:]))
+        raise RuntimeError(f"pipeline exited with {result.returncode}, log: {log_path}")
+    return elapsed
+
+
+def prepare_incremental(dbname: str):
+    # еден „нов ден“: последниот ден за секој симбол и денешните snapshots недостигаат
+    execute(dbname, """
+        DELETE FROM historical_data h
+        USING (SELECT symbol, MAX(date) AS last_date FROM historical_data GROUP BY symbol) m
+        WHERE h.symbol = m.symbol AND h.date = m.last_date
+    """)
+    execute(dbname, "DELETE FROM snapshots WHERE date = %s", (datetime.now(tz=timezone.utc).date(),))
+
+
+def scenario(name: str, args, env: dict, base: str, workdir: str) -> dict:
+    fake_request(base, "/__reset", "POST")
+    before = table_counts(args.pg_db)
+    wall = run_pipeline(args, env, os.path.join(workdir, f"{name}.log"))
+    after = table_counts(args.pg_db)
+    stats = fake_request(base, "/__stats")
+
+    symbols = after["coins"]
+    rows = (after["historical_data"] - before["historical_data"]) + (after["snapshots"] - before["snapshots"])
+    result = {
+        "wall_s": round(wall, 3),
+        "symbols": symbols,
+        "symbols_per_s": round(symbols / wall, 3) if wall else None,
+        "http_calls": stats["total_calls"],
+        "http_calls_by_endpoint": stats["calls"],
+        "http_calls_per_symbol": round(stats["total_calls"] / symbols, 3) if symbols else None,
+        "http_errors_injected": stats["errors"] + stats["rate_limited"],
+        "db_rows_written": rows,
+        "db_rows_per_s": round(rows / wall, 1) if wall else None,
+    }
+    print(f"[{name}] {wall:.1f}s, {result['symbols_per_s']} symbols/s, "
+          f"{result['http_calls_per_symbol']} calls/symbol, {result['db_rows_per_s']} rows/s")
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(params: dict):
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("params") == params:
+            return path, data
+    return None, None
+
+
+def print_comparison(current: dict, previous: dict, previous_path: str):
+    print(f"--- compared with {os.path.basename(previous_path)} (commit {previous.get('commit')}) ---")
+    for name, result in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if not old:
+            continue
+        parts = []
+        for metric in METRICS:
+            new_v, old_v = result.get(metric), old.get(metric)
+            if new_v is None or not old_v:
+                continue
+            parts.append(f"{metric} {old_v} -> {new_v} ({(new_v - old_v) / old_v * 100:+.1f}%)")
+        print(f"[{name}] " + ", ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark against a local CryptoCompare stand-in")
+    parser.add_argument("--pg-db", default="crypto_bench", help="benchmark database (its tables are dropped)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--coins", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default="cold,incremental")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    if args.pg_db == os.getenv("PG_DB", "crypto_app"):
+        raise SystemExit("Refusing to benchmark against the pipeline's own database")
+
+    ensure_database(args.pg_db)
+    workdir = tempfile.mkdtemp(prefix="crypto-bench-")
+    base = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, CC_API_BASE=base, PG_DB=args.pg_db, HTTP_CACHE_MODE="off",
+               CRYPTO_CACHE_DIR=os.path.join(workdir, "cache"), PYTHONUNBUFFERED="1")
+
+    params = {k: getattr(args, k) for k in
+              ("coins", "latency_ms", "jitter_ms", "error_rate", "rate_limit_rate", "concurrency")}
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        "params": params,
+        "scenarios": {},
+    }
+
+    fake = start_fake(args)
+    try:
+        for name in args.scenarios.split(","):
+            if name == "cold":
+                # и дневникот: инаку прекинато извршување од истиот ден би продолжило
+                execute(args.pg_db, "DROP TABLE IF EXISTS snapshots, historical_data, coins, "
+                                    "pipeline_run_symbols, pipeline_runs CASCADE")
+                shutil.rmtree(env["CRYPTO_CACHE_DIR"], ignore_errors=True)
+            elif name == "incremental":
+                if table_counts(args.pg_db)["coins"] == 0:
+                    raise SystemExit("incremental scenario needs a populated database, run cold first")
+                prepare_incremental(args.pg_db)
+            else:
+                raise SystemExit(f"unknown scenario {name!r}")
+            report["scenarios"][name] = scenario(name, args, env, base, workdir)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    previous_path, previous = previous_result(params)
+    if previous:
+        print_comparison(report, previous, previous_path)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(tz=timezone.utc).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+    print(f"Pipeline logs: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Локален fake за CryptoCompare со конфигурабилна латенција и грешки.
+Ги имитира само endpoint-ите што ги користи pipeline-от:
+
+    /data/top/mktcapfull, /data/v2/histoday, /data/pricemultifull
+
+Статистика за повиците: GET /__stats, ресетирање: POST /__reset.
+
+    python -m benchmarks.fake_cryptocompare --port 8765 --coins 200 --latency-ms 50
+"""
+import argparse
+import asyncio
+import random
+import time
+import zlib
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+DAY = 86400
+FIRST_LISTING = int(datetime(2013, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+class FakeCryptoCompare:
+    def __init__(self, coins: int = 200, latency_ms: float = 50, jitter_ms: float = 20,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 42):
+        self.symbols = [f"F{i:04d}" for i in range(coins)]
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.listing = {}
+        for sym in self.symbols:
+            # детерминистички датум на листање: дел монети имаат кратка историја
+            h = zlib.crc32(sym.encode())
+            self.listing[sym] = FIRST_LISTING + (h % 4000) * DAY
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.errors = 0
+        self.rate_limited = 0
+
+    def _price(self, sym: str, ts: int) -> float:
+        base = (zlib.crc32(sym.encode()) % 1000) / 10 + 0.01
+        return base * (1 + ((ts // DAY) % 97) / 100)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.path
+        self.calls[path] = self.calls.get(path, 0) + 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="upstream unavailable")
+        if roll < self.error_rate + self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response({
+                "Response": "Error",
+                "Message": "You are over your rate limit please upgrade your account!",
+                "Type": 99,
+            })
+
+        if path == "/data/top/mktcapfull":
+            return self.top(request)
+        if path == "/data/v2/histoday":
+            return self.histoday(request)
+        if path == "/data/pricemultifull":
+            return self.pricemultifull(request)
+        return web.json_response({"Response": "Error", "Message": "unknown path"}, status=404)
+
+    def top(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", 0))
+        limit = int(request.query.get("limit", 100))
+        page_symbols = self.symbols[page * limit:(page + 1) * limit]
+        return web.json_response({
+            "Response": "Success",
+            "Data": [{"CoinInfo": {"Name": s, "FullName": f"Fake {s}"}} for s in page_symbols],
+        })
+
+    def histoday(self, request: web.Request) -> web.Response:
+        sym = request.query["fsym"]
+        if sym not in self.listing:
+            return web.json_response({"Response": "Error", "Message": "no data"})
+        limit = int(request.query.get("limit", 30))
+        to_ts = int(request.query.get("toTs", time.time()))
+        to_ts -= to_ts % DAY
+
+        data = []
+        for k in range(limit, -1, -1):
+            ts = to_ts - k * DAY
+            if ts < self.listing[sym]:
+                data.append({"time": ts, "open": 0, "high": 0, "low": 0, "close": 0,
+                             "volumefrom": 0, "volumeto": 0})
+                continue
+            p = self._price(sym, ts)
+            data.append({"time": ts, "open": p, "high": p * 1.03, "low": p * 0.97, "close": p * 1.01,
+                         "volumefrom": 1000.0, "volumeto": 1000.0 * p})
+        return web.json_response({"Response": "Success", "Data": {"Data": data}})
+
+    def pricemultifull(self, request: web.Request) -> web.Response:
+        now = int(time.time())
+        raw = {}
+        for sym in request.query.get("fsyms", "").split(","):
+            if sym not in self.listing:
+                continue
+            p = self._price(sym, now)
+            raw[sym] = {"USD": {
+                "PRICE": p, "OPEN24HOUR": p * 0.99, "HIGH24HOUR": p * 1.02, "LOW24HOUR": p * 0.97,
+                "VOLUME24HOUR": 5000.0, "VOLUME24HOURTO": 5000.0 * p, "CHANGEPCT24HOUR": 1.0,
+                "MKTCAP": p * 1e6, "SUPPLY": 1e6,
+            }}
+        return web.json_response({"RAW": raw})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": self.calls,
+            "total_calls": sum(self.calls.values()),
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+        })
+
+    async def reset_handler(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_post("/__reset", self.reset_handler)
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CryptoCompare stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--coins", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="share of requests answered with a rate-limit error")
+    args = parser.parse_args()
+
+    fake = FakeCryptoCompare(args.coins, args.latency_ms, args.jitter_ms,
+                             args.error_rate, args.rate_limit_rate)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
+import os
 from datetime import datetime, timezone, timedelta, date
 
-CC_API_BASE = "https://min-api.cryptocompare.com"
+# Сите вредности што зависат од околината може да се препокријат со env променлива
+# (на пр. benchmarks/bench_pipeline.py го насочува pipeline-от кон локален fake API)
+CC_API_BASE = os.getenv("CC_API_BASE", "https://min-api.cryptocompare.com")
 
 CC_API_KEYS = [
     "ac9e71a1b85ad060f6c955757307df9e4a746242f6d550bc49c52ec06e31dcfe",
@@ -11,20 +14,92 @@ CC_API_KEYS = [
 # DB_PATH = "../database/crypto_data.db"
 SQLITE_PATH = r"C:\Users\User\Downloads\crypto-app-main\crypto-app-main\Homework1\crypto-project\database\crypto_data.db"
 
-PG_HOST = "localhost"
-PG_PORT = 5432
-PG_DB = "crypto_app"
-PG_USER = "postgres"
-PG_PASSWORD = "aleks123"
+PG_HOST = os.getenv("PG_HOST", "localhost")
+PG_PORT = int(os.getenv("PG_PORT", "5432"))
+PG_DB = os.getenv("PG_DB", "crypto_app")
+PG_USER = os.getenv("PG_USER", "postgres")
+PG_PASSWORD = os.getenv("PG_PASSWORD", "aleks123")
 
 START_DATE = date(2010, 1, 1)
 LAST_DATE = (datetime.now(tz=timezone.utc).date() - timedelta(days=1))
 
 BATCH_SIZE = 50
 DAYS_PER_CHUNK = 1800
-REQUEST_DELAY = 1.0
 MAX_PAGES = 15
 PAGE_LIMIT = 100
 BATCH_SLEEP = 4
 RETRY_COUNT = 3
 RETRY_SLEEP = 1.5
+# Буџет по API клуч; централниот лимитер ги заменува рачните sleep-ови
+CC_CALLS_PER_SECOND_PER_KEY = float(os.getenv("CC_CALLS_PER_SECOND_PER_KEY", "20"))
+CC_BURST_PER_KEY = float(os.getenv("CC_BURST_PER_KEY", "20"))
+RATE_LIMIT_MAX_RETRIES = 8
+BACKOFF_MAX_SLEEP = 60
+CONCURRENCY = 8
+DB_POOL_SIZE = 10
+HISTODAY_CUTOFF = date(2015, 1, 1)
+HISTODAY_PAGE_SIZE = 1000
+# Writer фаза: колку симболи чекаат за запишување и колку редови во една трансакција
+WRITER_QUEUE_SIZE = 16
+WRITER_BATCH_ROWS = 20000
+# Симболи без нови редови (ажурни) се запишуваат во дневникот групно, по толку одеднаш
+JOURNAL_FLUSH_SYMBOLS = 500
+# Опционално: historical_data/snapshots партиционирани по година
+# (постојна база се префрла со python -m data_access.partition_migration)
+PG_PARTITIONED = os.getenv("PG_PARTITIONED", "0") == "1"
+PARTITION_FIRST_YEAR = HISTODAY_CUTOFF.year
+# Sharded режим: workers (процеси/хостови) земаат симболи од pipeline_run_symbols
+CLAIM_BATCH_SIZE = 20
+CLAIM_TIMEOUT_SECONDS = 600
+CLAIM_MAX_ATTEMPTS = 3
+SHARD_PROGRESS_INTERVAL = 10
+SHARD_JOIN_WAIT_SECONDS = 300
+# Intraday свеќи (python -m pipeline.intraday): посебна тесна табела по резолуција.
+# retention_days ја ограничува табелата; со downsample_to постарите свеќи прво се
+# агрегираат во погрубата резолуција, па се бришат.
+INTRADAY_RESOLUTIONS = {
+    "hour": {
+        "endpoint": "/data/v2/histohour",
+        "table": "candles_hour",
+        "step": 3600,
+        "retention_days": 730,
+        "downsample_to": None,
+    },
+    "minute": {
+        "endpoint": "/data/v2/histominute",
+        "table": "candles_minute",
+        "step": 60,
+        "retention_days": 7,
+        "downsample_to": "hour",
+    },
+}
+INTRADAY_PAGE_LIMIT = 2000
+INTRADAY_SYMBOLS = 100
+SNAPSHOT_BATCH_SIZE = 100
+# Snapshot daemon (python -m pipeline.snapshot_daemon): интервал во секунди,
+# колку дена се чуваат intraday snapshot-ите и на колку круга се освежува листата симболи
+SNAPSHOT_DAEMON_INTERVAL = int(os.getenv("SNAPSHOT_DAEMON_INTERVAL", "60"))
+SNAPSHOT_DAEMON_RETENTION_DAYS = 30
+SNAPSHOT_DAEMON_REFRESH_TICKS = 60
+SNAPSHOT_FSYMS_MAX_CHARS = 300
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CRYPTO_CACHE_DIR", os.path.join(PROJECT_DIR, "cache"))
+FILTER1_CONCURRENCY = 5
+FILTER1_CACHE_PATH = os.path.join(CACHE_DIR, "filter1_cache.json")
+FILTER1_CACHE_TTL_HOURS = 24
+
+# off | record | replay (види services/http_cache.py)
+HTTP_CACHE_MODE = os.getenv("HTTP_CACHE_MODE", "off")
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http")
+
+# JSON извештај и Prometheus textfile по секое извршување
+REPORT_DIR = os.getenv("CRYPTO_REPORT_DIR", os.path.join(CACHE_DIR, "reports"))
+
+# Колонарна (Arrow) копија на historical_data по симбол, за LSTM и анализи
+COLUMNAR_STORE_DIR = os.getenv("CRYPTO_COLUMNAR_DIR", os.path.join(CACHE_DIR, "columnar"))
+COLUMNAR_SYNC = os.getenv("COLUMNAR_SYNC", "1") == "1"
+COLUMNAR_EXPORT_BATCH = 100
+
+MIGRATION_CHUNK_SIZE = 5000
+MIGRATION_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "migration_checkpoint.json")
@@ -0,0 +1,178 @@
+"""
+Колонарна копија на historical_data: по една Arrow IPC датотека за симбол.
+
+    <COLUMNAR_STORE_DIR>/history/<SYMBOL>.arrow
+    <COLUMNAR_STORE_DIR>/manifest.json      symbol → последен датум, број на редови
+
+Датотеките се без компресија, па читачот ги мапира во меморија и колоните
+се читаат без копирање. Pipeline-от ја синхронизира копијата по секое извршување;
+LSTM сервисите ја читаат наместо Postgres ако е поставен HISTORY_STORE_DIR.
+
+    python -m data_access.columnar_store --full     # целосна повторна изградба
+"""
+import argparse
+import json
+import os
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from configuration.config import COLUMNAR_STORE_DIR, COLUMNAR_EXPORT_BATCH
+from data_access import db
+
+try:
+    import numpy as np
+    import pyarrow as pa
+except ImportError:  # опционална зависност: без неа pipeline-от работи, само без копијата
+    pa = None
+
+COLUMNS = ["close", "high", "low", "open", "volume_from", "volume_to"]
+
+
+def _schema():
+    return pa.schema([("date", pa.date32())] + [(c, pa.float64()) for c in COLUMNS])
+
+
+def symbol_path(symbol: str, directory: str = COLUMNAR_STORE_DIR) -> str:
+    return os.path.join(directory, "history", f"{symbol}.arrow")
+
+
+def load_manifest(directory: str = COLUMNAR_STORE_DIR) -> Dict[str, dict]:
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, dict], directory: str = COLUMNAR_STORE_DIR):
+    path = os.path.join(directory, "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def write_symbol(symbol: str, rows: List[Tuple], directory: str = COLUMNAR_STORE_DIR):
+    """rows = (date, close, high, low, open, volume_from, volume_to) по датум."""
+    columns = list(zip(*rows)) if rows else [[] for _ in range(len(COLUMNS) + 1)]
+    table = pa.Table.from_arrays([pa.array(col, type=field.type)
+                                  for col, field in zip(columns, _schema())], schema=_schema())
+    path = symbol_path(symbol, directory)
+    tmp_path = path + ".tmp"
+    # нова датотека + rename: читач кој ја има мапирано старата не гледа половичен запис
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _fetch_history(symbols: List[str]) -> Iterator[Tuple[str, List[Tuple]]]:
+    # еден server-side cursor за цела група симболи, редовите се групираат по симбол
+    with db.connection() as conn:
+        cur = conn.cursor(name="columnar_export")
+        cur.itersize = 20000
+        cur.execute(f"""
+            SELECT symbol, date, {", ".join(COLUMNS)}
+            FROM historical_data
+            WHERE symbol = ANY(%s)
+            ORDER BY symbol, date
+        """, (symbols,))
+        current, rows = None, []
+        for row in cur:
+            if row[0] != current:
+                if current is not None:
+                    yield current, rows
+                current, rows = row[0], []
+            rows.append(row[1:])
+        if current is not None:
+            yield current, rows
+        conn.rollback()
+
+
+def sync(last_dates: Optional[Dict[str, date]] = None, full: bool = False,
+         directory: str = COLUMNAR_STORE_DIR) -> int:
+    """
+    Ги препишува датотеките само за симболите чиј последен датум се разликува
+    од манифестот (нова историја во ова извршување). Враќа број на симболи.
+    """
+    if pa is None:
+        print("Columnar store: pyarrow is not installed, skipping sync")
+        return 0
+
+    os.makedirs(os.path.join(directory, "history"), exist_ok=True)
+    if last_dates is None:
+        last_dates = db.get_last_historical_dates()
+    manifest = {} if full else load_manifest(directory)
+
+    changed = sorted(sym for sym, last in last_dates.items()
+                     if manifest.get(sym, {}).get("last_date") != last.isoformat()
+                     or not os.path.exists(symbol_path(sym, directory)))
+    if not changed:
+        print("Columnar store: up to date")
+        return 0
+
+    for i in range(0, len(changed), COLUMNAR_EXPORT_BATCH):
+        for symbol, rows in _fetch_history(changed[i:i + COLUMNAR_EXPORT_BATCH]):
+            write_symbol(symbol, rows, directory)
+            manifest[symbol] = {"last_date": rows[-1][0].isoformat(), "rows": len(rows)}
+        save_manifest(manifest, directory)
+    print(f"Columnar store: synced {len(changed)} symbols into {directory}")
+    return len(changed)
+
+
+# Читање
+
+def open_history(symbol: str, directory: str = COLUMNAR_STORE_DIR) -> Optional["pa.Table"]:
+    """
+    Табелата за симболот, мапирана во меморија (без читање на датотеката).
+    None ако симболот го нема во копијата.
+    """
+    path = symbol_path(symbol, directory)
+    if not os.path.exists(path):
+        return None
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def _column(table, name: str):
+    column = table[name]
+    # една датотека = еден record batch, па chunk(0) е поглед без копирање
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def load_series(symbol: str, column: str = "close", since: Optional[date] = None,
+                directory: str = COLUMNAR_STORE_DIR):
+    """
+    (dates, values) како numpy низи. Без null вредности колоната е поглед
+    врз мапираната датотека, без копирање.
+    """
+    table = open_history(symbol, directory)
+    if table is None:
+        return None
+    dates = _column(table, "date").to_numpy(zero_copy_only=False)
+    values = _column(table, column)
+    values = values.to_numpy(zero_copy_only=values.null_count == 0)
+    if since is not None:
+        start = int(np.searchsorted(dates, np.datetime64(since, "D")))
+        dates, values = dates[start:], values[start:]
+    return dates, values
+
+
+def scan_universe(directory: str = COLUMNAR_STORE_DIR) -> Iterator[Tuple[str, "pa.Table"]]:
+    """Сите симболи од манифестот, за анализи низ целиот универзум без база."""
+    for symbol in sorted(load_manifest(directory)):
+        table = open_history(symbol, directory)
+        if table is not None:
+            yield symbol, table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the per-symbol Arrow copy of historical_data")
+    parser.add_argument("--full", action="store_true", help="rewrite every symbol")
+    parser.add_argument("--dir", default=COLUMNAR_STORE_DIR)
+    args = parser.parse_args()
+    sync(full=args.full, directory=args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,21 @@
+import asyncio
 import psycopg2
 
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Dict, List, Optional, Set, Tuple
 from configuration.config import *
+from monitoring.metrics import metrics
+
+# Заеднички pool за целото извршување на pipeline-от.
+# Ако не е иницијализиран, секоја функција отвора своја конекција (старото однесување).
+_pool: Optional[ThreadedConnectionPool] = None
+_executor: Optional[ThreadPoolExecutor] = None
+# Дали historical_data е партиционирана; се поставува при креирање на шемата
+_history_partitioned: Optional[bool] = None
 
 
 def get_conn():
@@ -15,10 +29,89 @@ def get_conn():
     return conn
 
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+def init_pool(size: int = DB_POOL_SIZE):
+    """
+    Отвора pool од конекции и executor со исто толку нишки,
+    така што ниедна нишка не чека на слободна конекција.
+    Една дополнителна конекција е резервирана за повици од главната нишка.
+    """
+    global _pool, _executor
+    if _pool is not None:
+        return
+
+    size = max(1, size)
+    _pool = ThreadedConnectionPool(
+        1, size + 1,
+        host=PG_HOST,
+        port=PG_PORT,
+        dbname=PG_DB,
+        user=PG_USER,
+        password=PG_PASSWORD,
+    )
+    _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+
+
+def close_pool():
+    global _pool, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def connection():
+    if _pool is None:
+        conn = get_conn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    conn = _pool.getconn()
+    try:
+        yield conn
+    finally:
+        # pool-от сам прави rollback на незатворени трансакции
+        _pool.putconn(conn, close=bool(conn.closed))
+
+
+async def run_async(fn, *args, **kwargs):
+    """
+    Ја извршува синхроната DB функција во executor-от,
+    за да не го блокира event loop-от додека чека на Postgres.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(_timed_call, fn, *args, **kwargs))
 
+
+def _timed_call(fn, *args, **kwargs):
+    # се мери во executor нишката: само времето на самиот повик, без чекање во редица
+    name = getattr(getattr(fn, "func", fn), "__name__", str(fn))   # partial → името на функцијата
+    with metrics.timer("db_call_seconds", name):
+        return fn(*args, **kwargs)
+
+
+def init_db(partitioned: bool = PG_PARTITIONED):
+    with connection() as conn:
+        cur = conn.cursor()
+        create_tables(cur, partitioned)
+        create_journal_tables(cur)
+        create_candle_tables(cur)
+        create_intraday_snapshot_table(cur)
+        conn.commit()
+
+
+def create_tables(cur, partitioned: bool = False):
+    """
+    Ја креира шемата во тековниот search_path.
+    Ако historical_data веќе постои, режимот се зема од постојната табела
+    без разлика на знаменцето; постојна heap табела со partitioned=True е грешка,
+    бидејќи CREATE TABLE IF NOT EXISTS не ја менува.
+    """
     cur.execute("""
             CREATE TABLE IF NOT EXISTS coins (
                 symbol    TEXT PRIMARY KEY,
@@ -26,6 +119,20 @@ def init_db():
             )
         """)
 
+    global _history_partitioned
+    if table_exists(cur, "historical_data"):
+        _history_partitioned = is_partitioned(cur, "historical_data")
+        if partitioned and not _history_partitioned:
+            raise RuntimeError(
+                "PG_PARTITIONED=1, но historical_data е постојна непартиционирана табела; "
+                "префрлете ја со: python -m data_access.partition_migration"
+            )
+    else:
+        _history_partitioned = partitioned
+    if _history_partitioned:
+        create_partitioned_tables(cur)
+        return
+
     cur.execute("""
             CREATE TABLE IF NOT EXISTS historical_data (
                 id          BIGSERIAL PRIMARY KEY,
@@ -67,39 +174,213 @@ def init_db():
             )
         """)
 
-    conn.commit()
-    conn.close()
+
+def table_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cur.fetchone()[0]
+
+
+def is_partitioned(cur, table: str) -> bool:
+    cur.execute("""
+        SELECT c.relkind = 'p'
+        FROM pg_class c
+        WHERE c.oid = to_regclass(%s)
+    """, (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def create_partitioned_tables(cur):
+    """
+    historical_data и snapshots партиционирани по година (RANGE на date).
+    Уникатниот клуч мора да го содржи клучот на партиционирање, па
+    (symbol, date) е PRIMARY KEY; INCLUDE (close) ги покрива LSTM/TA читањата
+    (index-only scan), а BRIN на date ги покрива скенирањата по опсег низ симболи.
+    id останува колона со секвенца поради JPA ентитетите.
+    """
+    cur.execute("""
+            CREATE TABLE IF NOT EXISTS historical_data (
+                id          BIGSERIAL,
+                symbol      TEXT NOT NULL,
+                date        DATE NOT NULL,
+                close       DOUBLE PRECISION,
+                high        DOUBLE PRECISION,
+                low         DOUBLE PRECISION,
+                open        DOUBLE PRECISION,
+                volume_from DOUBLE PRECISION,
+                volume_to   DOUBLE PRECISION,
+                CONSTRAINT historical_data_pkey PRIMARY KEY (symbol, date) INCLUDE (close),
+                CONSTRAINT historical_symbol_fk FOREIGN KEY (symbol)
+                    REFERENCES coins(symbol)
+                    ON UPDATE CASCADE
+                    ON DELETE CASCADE
+            ) PARTITION BY RANGE (date)
+        """)
+    cur.execute("""
+            CREATE INDEX IF NOT EXISTS historical_data_date_brin
+            ON historical_data USING BRIN (date) WITH (pages_per_range = 32)
+        """)
+
+    cur.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id             BIGSERIAL,
+                symbol         TEXT NOT NULL,
+                date           DATE NOT NULL,
+                last_price     DOUBLE PRECISION,
+                open_24h       DOUBLE PRECISION,
+                high_24h       DOUBLE PRECISION,
+                low_24h        DOUBLE PRECISION,
+                volume_24h     DOUBLE PRECISION,
+                volume_24h_to  DOUBLE PRECISION,
+                change_pct_24h DOUBLE PRECISION,
+                market_cap     DOUBLE PRECISION,
+                supply         DOUBLE PRECISION,
+                CONSTRAINT snapshots_pkey PRIMARY KEY (symbol, date),
+                CONSTRAINT snapshots_symbol_fk FOREIGN KEY (symbol)
+                    REFERENCES coins(symbol)
+                    ON UPDATE CASCADE
+                    ON DELETE CASCADE
+            ) PARTITION BY RANGE (date)
+        """)
+    cur.execute("""
+            CREATE INDEX IF NOT EXISTS snapshots_date_brin
+            ON snapshots USING BRIN (date) WITH (pages_per_range = 32)
+        """)
+
+    # партиции до следната година, за да не паѓаат нови редови во DEFAULT
+    last_year = datetime.now(tz=timezone.utc).year + 1
+    for table in ("historical_data", "snapshots"):
+        ensure_partitions(cur, table, PARTITION_FIRST_YEAR, last_year)
+
+
+def ensure_partitions(cur, table: str, first_year: int, last_year: int):
+    for year in range(first_year, last_year + 1):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_y{year}
+            PARTITION OF {table}
+            FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+        """)
+    # сè пред PARTITION_FIRST_YEAR или по last_year
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table}_default
+        PARTITION OF {table} DEFAULT
+    """)
+
+
+def create_journal_tables(cur):
+    """
+    Дневник на извршувањата: секое извршување и фазата на секој симбол во него,
+    за прекинато извршување да продолжи од каде што застанало.
+    """
+    cur.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_runs (
+                run_id       BIGSERIAL PRIMARY KEY,
+                run_date     DATE NOT NULL,
+                mode         TEXT NOT NULL,
+                status       TEXT NOT NULL,
+                resumed_from BIGINT REFERENCES pipeline_runs(run_id),
+                started_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+                finished_at  TIMESTAMPTZ
+            )
+        """)
+
+    cur.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_run_symbols (
+                run_id     BIGINT NOT NULL REFERENCES pipeline_runs(run_id) ON DELETE CASCADE,
+                symbol     TEXT NOT NULL,
+                position   INTEGER NOT NULL,
+                stage      TEXT NOT NULL,
+                last_chunk DATE,
+                rows       INTEGER NOT NULL DEFAULT 0,
+                error      TEXT,
+                claimed_by    TEXT,
+                claimed_until TIMESTAMPTZ,
+                attempts      INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (run_id, symbol)
+            )
+        """)
+
+
+def create_candle_tables(cur):
+    """
+    Intraday свеќи: една тесна табела по резолуција, без id колона.
+    REAL (4 бајти) наместо DOUBLE PRECISION: ~7 значајни цифри се доволни
+    за свеќи, а редовите се 24-1440 пати повеќе од дневните.
+    """
+    for resolution in INTRADAY_RESOLUTIONS.values():
+        table = resolution["table"]
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                symbol      TEXT NOT NULL REFERENCES coins(symbol) ON UPDATE CASCADE ON DELETE CASCADE,
+                ts          TIMESTAMPTZ NOT NULL,
+                close       REAL,
+                high        REAL,
+                low         REAL,
+                open        REAL,
+                volume_from REAL,
+                volume_to   REAL,
+                PRIMARY KEY (symbol, ts)
+            )
+        """)
+        # retention брише по време низ сите симболи
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_ts_brin
+            ON {table} USING BRIN (ts) WITH (pages_per_range = 32)
+        """)
+
+
+def create_intraday_snapshot_table(cur):
+    # snapshot daemon: ред само кога цената или волуменот се промениле
+    cur.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots_intraday (
+                symbol         TEXT NOT NULL REFERENCES coins(symbol) ON UPDATE CASCADE ON DELETE CASCADE,
+                ts             TIMESTAMPTZ NOT NULL,
+                last_price     DOUBLE PRECISION,
+                open_24h       DOUBLE PRECISION,
+                high_24h       DOUBLE PRECISION,
+                low_24h        DOUBLE PRECISION,
+                volume_24h     DOUBLE PRECISION,
+                volume_24h_to  DOUBLE PRECISION,
+                change_pct_24h DOUBLE PRECISION,
+                market_cap     DOUBLE PRECISION,
+                supply         DOUBLE PRECISION,
+                PRIMARY KEY (symbol, ts)
+            )
+        """)
+    cur.execute("""
+            CREATE INDEX IF NOT EXISTS snapshots_intraday_ts_brin
+            ON snapshots_intraday USING BRIN (ts) WITH (pages_per_range = 32)
+        """)
 
 
 def insert_coins(symbol_fullname_map: dict):
-    conn = get_conn()
-    cur = conn.cursor()
+    with connection() as conn:
+        cur = conn.cursor()
 
-    for symbol, fullname in symbol_fullname_map.items():
-        cur.execute("""
-            INSERT INTO coins(symbol, full_name)
-            VALUES (%s, %s)
-            ON CONFLICT (symbol) DO NOTHING
-        """, (symbol, fullname))
+        for symbol, fullname in symbol_fullname_map.items():
+            cur.execute("""
+                INSERT INTO coins(symbol, full_name)
+                VALUES (%s, %s)
+                ON CONFLICT (symbol) DO NOTHING
+            """, (symbol, fullname))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
 
 def snapshot_exists_today(symbol: str) -> bool:
     today = datetime.now(tz=timezone.utc).date().isoformat()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-                SELECT 1
-                FROM snapshots
-                WHERE symbol = %s
-                  AND date = %s
-                LIMIT 1
-                """, (symbol, today))
-    row = cur.fetchone()
-    conn.close()
-    return row is not None
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+                    SELECT 1
+                    FROM snapshots
+                    WHERE symbol = %s
+                      AND date = %s
+                    LIMIT 1
+                    """, (symbol, today))
+        row = cur.fetchone()
+        return row is not None
 
 
 def save_snapshot_row(symbol: str, date_str: str, row: Tuple):
@@ -107,51 +388,112 @@ def save_snapshot_row(symbol: str, date_str: str, row: Tuple):
      volume_24h, volume_24h_to, change_pct_24h,
      market_cap, supply) = row
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO snapshots
-        (symbol, date, last_price, open_24h, high_24h, low_24h,
-         volume_24h, volume_24h_to, change_pct_24h, market_cap, supply)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (symbol, date) DO UPDATE
-        SET last_price     = EXCLUDED.last_price,
-            open_24h       = EXCLUDED.open_24h,
-            high_24h       = EXCLUDED.high_24h,
-            low_24h        = EXCLUDED.low_24h,
-            volume_24h     = EXCLUDED.volume_24h,
-            volume_24h_to  = EXCLUDED.volume_24h_to,
-            change_pct_24h = EXCLUDED.change_pct_24h,
-            market_cap     = EXCLUDED.market_cap,
-            supply         = EXCLUDED.supply
-    """, (
-        symbol, date_str,
-        last_price, open_24h, high_24h, low_24h,
-        volume_24h, volume_24h_to, change_pct_24h, market_cap, supply
-    ))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO snapshots
+            (symbol, date, last_price, open_24h, high_24h, low_24h,
+             volume_24h, volume_24h_to, change_pct_24h, market_cap, supply)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (symbol, date) DO UPDATE
+            SET last_price     = EXCLUDED.last_price,
+                open_24h       = EXCLUDED.open_24h,
+                high_24h       = EXCLUDED.high_24h,
+                low_24h        = EXCLUDED.low_24h,
+                volume_24h     = EXCLUDED.volume_24h,
+                volume_24h_to  = EXCLUDED.volume_24h_to,
+                change_pct_24h = EXCLUDED.change_pct_24h,
+                market_cap     = EXCLUDED.market_cap,
+                supply         = EXCLUDED.supply
+        """, (
+            symbol, date_str,
+            last_price, open_24h, high_24h, low_24h,
+            volume_24h, volume_24h_to, change_pct_24h, market_cap, supply
+        ))
+        conn.commit()
 
 
-def insert_histoday(symbol: str, data: List[dict]) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cutoff = date(2015, 1, 1)
+def save_snapshot_rows(date_str: str, rows: Dict[str, Tuple]) -> int:
+    if not rows:
+        return 0
+
+    values = [(symbol, date_str, *row) for symbol, row in rows.items()]
+    with connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO snapshots
+            (symbol, date, last_price, open_24h, high_24h, low_24h,
+             volume_24h, volume_24h_to, change_pct_24h, market_cap, supply)
+            VALUES %s
+            ON CONFLICT (symbol, date) DO UPDATE
+            SET last_price     = EXCLUDED.last_price,
+                open_24h       = EXCLUDED.open_24h,
+                high_24h       = EXCLUDED.high_24h,
+                low_24h        = EXCLUDED.low_24h,
+                volume_24h     = EXCLUDED.volume_24h,
+                volume_24h_to  = EXCLUDED.volume_24h_to,
+                change_pct_24h = EXCLUDED.change_pct_24h,
+                market_cap     = EXCLUDED.market_cap,
+                supply         = EXCLUDED.supply
+        """, values, page_size=HISTODAY_PAGE_SIZE)
+        conn.commit()
+    return len(values)
+
+
+def histoday_rows(symbol: str, data: List[dict]) -> List[Tuple]:
+    """
+    Ги применува филтрите (денес, пред 2015, сите OHLC нули) и враќа
+    редови подготвени за запишување. Дупликат денови во истиот chunk
+    се спојуваат, бидејќи ON CONFLICT не смее да го допре истиот ред двапати.
+    """
     today = datetime.now(tz=timezone.utc).date()
-    inserted = 0
+    rows = {}
     for item in data:
         dt = datetime.fromtimestamp(item["time"], tz=timezone.utc).date()
         if dt == today:
             continue
-        if dt < cutoff:
+        if dt < HISTODAY_CUTOFF:
             continue
         if all((item.get(k) or 0) == 0 for k in ["open", "high", "low", "close"]):
             continue
-        d = dt.isoformat()
-        cur.execute("""
+        rows[dt] = (
+            symbol, dt,
+            item.get("close"),
+            item.get("high"),
+            item.get("low"),
+            item.get("open"),
+            item.get("volumefrom"),
+            item.get("volumeto"),
+        )
+    return [rows[d] for d in sorted(rows)]
+
+
+def upsert_histoday_rows(rows: List[Tuple]) -> Tuple[int, Optional[int]]:
+    """
+    Bulk upsert: сите редови одат во неколку multi-row INSERT-и
+    (HISTODAY_PAGE_SIZE по барање) наместо по еден INSERT за секој ден.
+    Враќа (inserted, updated); кај партиционирана табела поделбата не се
+    знае и се враќа (upserted, None).
+    """
+    if not rows:
+        return 0, 0
+
+    global _history_partitioned
+    with connection() as conn:
+        cur = conn.cursor()
+        if _history_partitioned is None:
+            _history_partitioned = is_partitioned(cur, "historical_data")
+        if _history_partitioned:
+            # xmax не може да се чита преку партиционирана табела, а дополнително
+            # броење на постојните клучеви би го удвоило времето на upsert-от
+            returning = "RETURNING 1"
+        else:
+            # xmax = 0 само за нови редови, кај ажурираните е ID-то на трансакцијата
+            returning = "RETURNING (xmax = 0)"
+        result = execute_values(cur, """
             INSERT INTO historical_data
             (symbol, date, close, high, low, open, volume_from, volume_to)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES %s
             ON CONFLICT (symbol, date) DO UPDATE
             SET close       = EXCLUDED.close,
                 high        = EXCLUDED.high,
@@ -159,46 +501,451 @@ def insert_histoday(symbol: str, data: List[dict]) -> int:
                 open        = EXCLUDED.open,
                 volume_from = EXCLUDED.volume_from,
                 volume_to   = EXCLUDED.volume_to
-        """, (
-            symbol, d,
+            """ + returning, rows, page_size=HISTODAY_PAGE_SIZE, fetch=True)
+        conn.commit()
+
+    if _history_partitioned:
+        return len(result), None
+    inserted = sum(1 for (is_new,) in result if is_new)
+    return inserted, len(result) - inserted
+
+
+def upsert_histoday(symbol: str, data: List[dict]) -> Tuple[int, int]:
+    return upsert_histoday_rows(histoday_rows(symbol, data))
+
+
+def insert_histoday(symbol: str, data: List[dict]) -> int:
+    inserted, updated = upsert_histoday(symbol, data)
+    return inserted + (updated or 0)
+
+
+def get_last_historical_date(symbol: str) -> Optional[date]:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT date
+            FROM historical_data
+            WHERE symbol = %s
+            ORDER BY date DESC
+            LIMIT 1
+        """, (symbol,))
+        row = cur.fetchone()
+
+        return row[0] if row else None
+
+
+def get_last_historical_dates() -> Dict[str, date]:
+    """
+    Последниот датум за секој симбол во едно барање.
+    Подпрашањето по симбол го користи (symbol, date) индексот,
+    па не се скенира целата табела како кај GROUP BY.
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.symbol,
+                   (SELECT MAX(h.date)
+                    FROM historical_data h
+                    WHERE h.symbol = c.symbol) AS last_date
+            FROM coins c
+        """)
+        rows = cur.fetchall()
+        return {symbol: last_date for symbol, last_date in rows if last_date is not None}
+
+
+def get_snapshot_symbols(day: date) -> Set[str]:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT symbol
+            FROM snapshots
+            WHERE date = %s
+        """, (day,))
+        rows = cur.fetchall()
+        return {r[0] for r in rows}
+
+
+def get_all_coin_symbols() -> List[str]:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT symbol
+            FROM coins
+            ORDER BY symbol
+        """)
+        rows = cur.fetchall()
+        return [r[0] for r in rows]
+
+
+def start_run(run_date: date, mode: str, resumed_from: Optional[int] = None) -> int:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO pipeline_runs (run_date, mode, status, resumed_from)
+            VALUES (%s, %s, 'running', %s)
+            RETURNING run_id
+        """, (run_date, mode, resumed_from))
+        run_id = cur.fetchone()[0]
+        conn.commit()
+        return run_id
+
+
+def get_unfinished_run(run_date: date) -> Optional[int]:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT run_id
+            FROM pipeline_runs
+            WHERE run_date = %s AND status IN ('running', 'interrupted')
+            ORDER BY run_id DESC
+            LIMIT 1
+        """, (run_date,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def get_last_finished_run() -> Optional[int]:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT run_id
+            FROM pipeline_runs
+            WHERE status <> 'running'
+            ORDER BY run_id DESC
+            LIMIT 1
+        """)
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def set_run_status(run_id: int, status: str):
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_runs
+            SET status = %s,
+                finished_at = CASE WHEN %s = 'running' THEN NULL ELSE now() END
+            WHERE run_id = %s
+        """, (status, status, run_id))
+        conn.commit()
+
+
+def abandon_stale_runs(run_date: date):
+    # недовршени извршувања од претходни денови не се продолжуваат
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_runs
+            SET status = 'abandoned', finished_at = now()
+            WHERE run_date <> %s AND status IN ('running', 'interrupted')
+        """, (run_date,))
+        conn.commit()
+
+
+def register_run_symbols(run_id: int, symbols: List[str]):
+    if not symbols:
+        return
+    with connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO pipeline_run_symbols (run_id, symbol, position, stage)
+            VALUES %s
+            ON CONFLICT (run_id, symbol) DO NOTHING
+        """, [(run_id, sym, i, "pending") for i, sym in enumerate(symbols)], page_size=1000)
+        conn.commit()
+
+
+def get_run_symbols(run_id: int, stage: Optional[str] = None) -> List[Tuple[str, str, Optional[date]]]:
+    """(symbol, stage, last_chunk) по редоследот на обработка."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT symbol, stage, last_chunk
+            FROM pipeline_run_symbols
+            WHERE run_id = %s AND (%s IS NULL OR stage = %s)
+            ORDER BY position
+        """, (run_id, stage, stage))
+        return cur.fetchall()
+
+
+def set_symbol_stage(run_id: int, symbol: str, stage: str, last_chunk: Optional[date] = None,
+                     rows: int = 0, error: Optional[str] = None):
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_run_symbols
+            SET stage      = %s,
+                last_chunk = COALESCE(%s, last_chunk),
+                rows       = rows + %s,
+                error      = %s,
+                updated_at = now()
+            WHERE run_id = %s AND symbol = %s
+        """, (stage, last_chunk, rows, error, run_id, symbol))
+        conn.commit()
+
+
+def set_symbols_history(run_id: int, committed: List[Tuple[str, int, date]]):
+    """(symbol, rows, last_chunk) за симболи чија историја е commit-ирана."""
+    if not committed:
+        return
+    with connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            UPDATE pipeline_run_symbols s
+            SET stage      = 'history',
+                last_chunk = COALESCE(v.last_chunk, s.last_chunk),
+                rows       = s.rows + v.rows,
+                error      = NULL,
+                updated_at = now()
+            FROM (VALUES %s) AS v(run_id, symbol, rows, last_chunk)
+            WHERE s.run_id = v.run_id AND s.symbol = v.symbol
+        """, [(run_id, sym, rows, last) for sym, rows, last in committed],
+            template="(%s::bigint, %s, %s::integer, %s::date)")
+        conn.commit()
+
+
+def set_symbols_stage(run_id: int, symbols: List[str], stage: str):
+    if not symbols:
+        return
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_run_symbols
+            SET stage = %s, error = NULL, updated_at = now()
+            WHERE run_id = %s AND symbol = ANY(%s)
+        """, (stage, run_id, list(symbols)))
+        conn.commit()
+
+
+def claim_run_symbols(run_id: int, worker: str, limit: int, timeout_seconds: int,
+                      max_attempts: int) -> List[Tuple[str, str]]:
+    """
+    Зема до `limit` незавршени симболи за worker-от. SKIP LOCKED значи дека
+    паралелните workers не се чекаат меѓусебно; истечено барање (умрен worker)
+    повторно може да се земе. Враќа (symbol, stage) по редоследот на обработка.
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_run_symbols s
+            SET claimed_by    = %s,
+                claimed_until = now() + make_interval(secs => %s),
+                attempts      = s.attempts + 1,
+                updated_at    = now()
+            FROM (
+                SELECT symbol
+                FROM pipeline_run_symbols
+                WHERE run_id = %s
+                  AND stage IN ('pending', 'history')
+                  AND attempts < %s
+                  AND (claimed_until IS NULL OR claimed_until < now())
+                ORDER BY position
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ) c
+            WHERE s.run_id = %s AND s.symbol = c.symbol
+            RETURNING s.symbol, s.stage, s.position
+        """, (worker, timeout_seconds, run_id, max_attempts, limit, run_id))
+        rows = cur.fetchall()
+        conn.commit()
+        return [(sym, stage) for sym, stage, _ in sorted(rows, key=lambda r: r[2])]
+
+
+def release_claims(run_id: int, worker: str):
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_run_symbols
+            SET claimed_until = NULL
+            WHERE run_id = %s AND claimed_by = %s
+        """, (run_id, worker))
+        conn.commit()
+
+
+def get_run_progress(run_id: int, max_attempts: int) -> dict:
+    """Број на симболи по worker и фаза, плус колку работа уште може да се земе."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COALESCE(claimed_by, ''), stage, COUNT(*)
+            FROM pipeline_run_symbols
+            WHERE run_id = %s
+            GROUP BY 1, 2
+        """, (run_id,))
+        by_worker: Dict[str, Dict[str, int]] = {}
+        for worker, stage, count in cur.fetchall():
+            by_worker.setdefault(worker, {})[stage] = count
+
+        cur.execute("""
+            SELECT
+                COUNT(*) FILTER (WHERE claimed_until IS NULL OR claimed_until < now()),
+                COUNT(*) FILTER (WHERE claimed_until >= now())
+            FROM pipeline_run_symbols
+            WHERE run_id = %s
+              AND stage IN ('pending', 'history')
+              AND attempts < %s
+        """, (run_id, max_attempts))
+        claimable, in_flight = cur.fetchone()
+        return {"by_worker": by_worker, "claimable": claimable, "in_flight": in_flight}
+
+
+def candle_rows(symbol: str, data: List[dict], step: int) -> List[Tuple]:
+    """
+    Како histoday_rows, за intraday свеќи: без свеќата која уште е отворена,
+    без свеќи со сите OHLC нули, без дупликати по време.
+    """
+    open_from = int(datetime.now(tz=timezone.utc).timestamp()) // step * step
+    rows = {}
+    for item in data:
+        ts = item["time"]
+        if ts >= open_from:
+            continue
+        if all((item.get(k) or 0) == 0 for k in ["open", "high", "low", "close"]):
+            continue
+        rows[ts] = (
+            symbol, datetime.fromtimestamp(ts, tz=timezone.utc),
             item.get("close"),
             item.get("high"),
             item.get("low"),
             item.get("open"),
             item.get("volumefrom"),
             item.get("volumeto"),
-        ))
-        inserted += 1
-    conn.commit()
-    conn.close()
-    return inserted
+        )
+    return [rows[t] for t in sorted(rows)]
 
 
-def get_last_historical_date(symbol: str) -> Optional[date]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT date
-        FROM historical_data
-        WHERE symbol = %s
-        ORDER BY date DESC
-        LIMIT 1
-    """, (symbol,))
-    row = cur.fetchone()
-    conn.close()
+def upsert_candle_rows(table: str, rows: List[Tuple]) -> int:
+    if not rows:
+        return 0
+    with connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, f"""
+            INSERT INTO {table}
+            (symbol, ts, close, high, low, open, volume_from, volume_to)
+            VALUES %s
+            ON CONFLICT (symbol, ts) DO UPDATE
+            SET close       = EXCLUDED.close,
+                high        = EXCLUDED.high,
+                low         = EXCLUDED.low,
+                open        = EXCLUDED.open,
+                volume_from = EXCLUDED.volume_from,
+                volume_to   = EXCLUDED.volume_to
+        """, rows, page_size=HISTODAY_PAGE_SIZE)
+        conn.commit()
+        return len(rows)
 
-    return row[0] if row else None
 
+def get_last_candle_times(table: str) -> Dict[str, datetime]:
+    # исто како get_last_historical_dates: подпрашање по симбол преку PK индексот
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT c.symbol,
+                   (SELECT MAX(t.ts) FROM {table} t WHERE t.symbol = c.symbol) AS last_ts
+            FROM coins c
+        """)
+        return {symbol: last_ts for symbol, last_ts in cur.fetchall() if last_ts is not None}
 
-def get_all_coin_symbols() -> List[str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT symbol
-        FROM coins
-        ORDER BY symbol
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return [r[0] for r in rows]
-    
\ No newline at end of file
+
+def get_active_symbols(limit: int) -> List[str]:
+    """Најтргуваните симболи според последниот snapshot (volume_24h_to)."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT ON (symbol) symbol, volume_24h_to
+            FROM snapshots
+            ORDER BY symbol, date DESC
+        """)
+        latest = sorted(cur.fetchall(), key=lambda r: r[1] or 0, reverse=True)
+    return [symbol for symbol, _ in latest[:limit]]
+
+
+def apply_candle_retention(resolution: str) -> Tuple[int, int]:
+    """
+    Свеќите постари од retention_days се агрегираат во downsample_to
+    резолуцијата (ако ја има) и се бришат, во една трансакција.
+    Враќа (агрегирани свеќи, избришани свеќи).
+    """
+    policy = INTRADAY_RESOLUTIONS[resolution]
+    table = policy["table"]
+    cutoff = datetime.now(tz=timezone.utc) - timedelta(days=policy["retention_days"])
+    downsampled = 0
+
+    if policy["downsample_to"]:
+        # границата на почеток на погруб интервал, за да не остане половична свеќа
+        step = INTRADAY_RESOLUTIONS[policy["downsample_to"]]["step"]
+        cutoff = datetime.fromtimestamp(int(cutoff.timestamp()) // step * step, tz=timezone.utc)
+
+    with connection() as conn:
+        cur = conn.cursor()
+        if policy["downsample_to"]:
+            target = INTRADAY_RESOLUTIONS[policy["downsample_to"]]
+            # свеќите се групираат по почетокот на погрубиот интервал;
+            # постоечките (од API) имаат предност
+            cur.execute(f"""
+                INSERT INTO {target["table"]}
+                (symbol, ts, close, high, low, open, volume_from, volume_to)
+                SELECT symbol,
+                       to_timestamp(floor(extract(epoch FROM ts) / %s) * %s) AS bucket,
+                       (array_agg(close ORDER BY ts DESC))[1],
+                       MAX(high),
+                       MIN(low),
+                       (array_agg(open ORDER BY ts))[1],
+                       SUM(volume_from),
+                       SUM(volume_to)
+                FROM {table}
+                WHERE ts < %s
+                GROUP BY symbol, bucket
+                ON CONFLICT (symbol, ts) DO NOTHING
+            """, (target["step"], target["step"], cutoff))
+            downsampled = cur.rowcount
+
+        cur.execute(f"DELETE FROM {table} WHERE ts < %s", (cutoff,))
+        deleted = cur.rowcount
+        conn.commit()
+    return downsampled, deleted
+
+
+def save_intraday_snapshots(ts: datetime, rows: Dict[str, Tuple]) -> int:
+    if not rows:
+        return 0
+    values = [(symbol, ts, *row) for symbol, row in rows.items()]
+    with connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO snapshots_intraday
+            (symbol, ts, last_price, open_24h, high_24h, low_24h,
+             volume_24h, volume_24h_to, change_pct_24h, market_cap, supply)
+            VALUES %s
+            ON CONFLICT (symbol, ts) DO NOTHING
+        """, values, page_size=HISTODAY_PAGE_SIZE)
+        conn.commit()
+    return len(values)
+
+
+def get_latest_intraday_snapshots() -> Dict[str, Tuple]:
+    """Последниот запишан intraday snapshot по симбол (за детекција на промени по рестарт)."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.symbol, s.last_price, s.open_24h, s.high_24h, s.low_24h,
+                   s.volume_24h, s.volume_24h_to, s.change_pct_24h, s.market_cap, s.supply
+            FROM coins c
+            CROSS JOIN LATERAL (
+                SELECT *
+                FROM snapshots_intraday i
+                WHERE i.symbol = c.symbol
+                ORDER BY i.ts DESC
+                LIMIT 1
+            ) s
+        """)
+        return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+
+def delete_intraday_snapshots_before(ts: datetime) -> int:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM snapshots_intraday WHERE ts < %s", (ts,))
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
@@ -1,8 +1,40 @@
+import argparse
+import hashlib
+import json
+import os
 import sqlite3
+import threading
 import psycopg2
 
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
+
 from configuration.config import *
 
+# Секоја табела: колони (без id), клуч за ON CONFLICT и колони за ажурирање.
+# Редоследот е важен: coins мора да заврши пред табелите со FK кон неа.
+TABLES = {
+    "coins": {
+        "columns": ["symbol", "full_name"],
+        "key": ["symbol"],
+        "update": [],
+    },
+    "historical_data": {
+        "columns": ["symbol", "date", "close", "high", "low", "open", "volume_from", "volume_to"],
+        "key": ["symbol", "date"],
+        "update": ["close", "high", "low", "open", "volume_from", "volume_to"],
+    },
+    "snapshots": {
+        "columns": ["symbol", "date", "last_price", "open_24h", "high_24h", "low_24h",
+                    "volume_24h", "volume_24h_to", "change_pct_24h", "market_cap", "supply"],
+        "key": ["symbol", "date"],
+        "update": ["last_price", "open_24h", "high_24h", "low_24h",
+                   "volume_24h", "volume_24h_to", "change_pct_24h", "market_cap", "supply"],
+    },
+}
+PARENT_TABLES = ["coins"]
+CHILD_TABLES = ["historical_data", "snapshots"]
+
 
 def get_sqlite_conn():
     return sqlite3.connect(SQLITE_PATH)
@@ -18,130 +50,243 @@ def get_pg_conn():
     )
 
 
-def migrate_coins():
-    sqlite_conn = get_sqlite_conn()
-    pg_conn = get_pg_conn()
-
-    s_cur = sqlite_conn.cursor()
-    p_cur = pg_conn.cursor()
-
-    print("Migrating coins...")
-
-    s_cur.execute("SELECT symbol, full_name FROM coins")
-    rows = s_cur.fetchall()
-
-    for symbol, full_name in rows:
-        p_cur.execute("""
-            INSERT INTO coins(symbol, full_name)
-            VALUES (%s, %s)
-            ON CONFLICT (symbol) DO NOTHING
-        """, (symbol, full_name))
-
-    pg_conn.commit()
-    sqlite_conn.close()
-    pg_conn.close()
-
-    print(f"Done. Migrated {len(rows)} rows into coins.")
+class Checkpoint:
+    """
+    Последниот SQLite rowid што е commit-иран во Postgres, по табела.
+    Се запишува после секој chunk, па прекинатата миграција продолжува од таму.
+    """
+
+    def __init__(self, path: str = MIGRATION_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self._state = json.load(f)
+
+    def reset(self):
+        with self._lock:
+            self._state = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def last_rowid(self, table: str) -> int:
+        with self._lock:
+            return self._state.get(table, 0)
+
+    def commit(self, table: str, rowid: int):
+        with self._lock:
+            self._state[table] = rowid
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
+
+
+def upsert_sql(table: str) -> str:
+    spec = TABLES[table]
+    columns = ", ".join(spec["columns"])
+    key = ", ".join(spec["key"])
+    if not spec["update"]:
+        return f"INSERT INTO {table} ({columns}) VALUES %s ON CONFLICT ({key}) DO NOTHING"
+    updates = ",\n                ".join(f"{c} = EXCLUDED.{c}" for c in spec["update"])
+    return f"""
+        INSERT INTO {table} ({columns})
+        VALUES %s
+        ON CONFLICT ({key}) DO UPDATE
+        SET {updates}
+    """
+
+
+def migrate_table(table: str, checkpoint: Checkpoint, chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    """
+    Ја чита табелата од SQLite во chunk-ови по rowid (никогаш цела во меморија),
+    секој chunk е еден batched upsert и еден commit во Postgres.
+    """
+    spec = TABLES[table]
+    key_len = len(spec["key"])
+    sql = upsert_sql(table)
 
-
-def migrate_historical_data():
-    sqlite_conn = get_sqlite_conn()
-    pg_conn = get_pg_conn()
-
-    s_cur = sqlite_conn.cursor()
-    p_cur = pg_conn.cursor()
-
-    print("Migrating historical_data...")
-
-    # Го игнорираме id и ги внесуваме останатите колони
-    s_cur.execute("""
-        SELECT symbol, date, close, high, low, open, volume_from, volume_to
-        FROM historical_data
-    """)
-    rows = s_cur.fetchall()
-
-    count = 0
-    for row in rows:
-        (symbol, date_str, close, high, low, open_price, volume_from, volume_to) = row
-
-        p_cur.execute("""
-            INSERT INTO historical_data
-            (symbol, date, close, high, low, open, volume_from, volume_to)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (symbol, date) DO UPDATE
-            SET close       = EXCLUDED.close,
-                high        = EXCLUDED.high,
-                low         = EXCLUDED.low,
-                open        = EXCLUDED.open,
-                volume_from = EXCLUDED.volume_from,
-                volume_to   = EXCLUDED.volume_to
-        """, (
-            symbol, date_str, close, high, low, open_price, volume_from, volume_to
-        ))
-        count += 1
-
-    pg_conn.commit()
-    sqlite_conn.close()
-    pg_conn.close()
-
-    print(f"Done. Migrated {count} rows into historical_data.")
-
-
-def migrate_snapshots():
     sqlite_conn = get_sqlite_conn()
     pg_conn = get_pg_conn()
-
     s_cur = sqlite_conn.cursor()
     p_cur = pg_conn.cursor()
 
-    print("Migrating snapshots...")
-
-    s_cur.execute("""
-        SELECT symbol, date, last_price, open_24h, high_24h, low_24h,
-               volume_24h, volume_24h_to, change_pct_24h, market_cap, supply
-        FROM snapshots
-    """)
-    rows = s_cur.fetchall()
+    last_rowid = checkpoint.last_rowid(table)
+    if last_rowid:
+        print(f"[{table}] resuming after rowid {last_rowid}")
+    else:
+        print(f"Migrating {table}...")
 
     count = 0
-    for row in rows:
-        (symbol, date_str, last_price, open_24h, high_24h, low_24h,
-         volume_24h, volume_24h_to, change_pct_24h, market_cap, supply) = row
-
-        p_cur.execute("""
-            INSERT INTO snapshots
-            (symbol, date, last_price, open_24h, high_24h, low_24h,
-             volume_24h, volume_24h_to, change_pct_24h, market_cap, supply)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (symbol, date) DO UPDATE
-            SET last_price     = EXCLUDED.last_price,
-                open_24h       = EXCLUDED.open_24h,
-                high_24h       = EXCLUDED.high_24h,
-                low_24h        = EXCLUDED.low_24h,
-                volume_24h     = EXCLUDED.volume_24h,
-                volume_24h_to  = EXCLUDED.volume_24h_to,
-                change_pct_24h = EXCLUDED.change_pct_24h,
-                market_cap     = EXCLUDED.market_cap,
-                supply         = EXCLUDED.supply
-        """, (
-            symbol, date_str, last_price, open_24h, high_24h, low_24h,
-            volume_24h, volume_24h_to, change_pct_24h, market_cap, supply
-        ))
-        count += 1
-
-    pg_conn.commit()
-    sqlite_conn.close()
-    pg_conn.close()
-
-    print(f"Done. Migrated {count} rows into snapshots.")
+    try:
+        while True:
+            s_cur.execute(f"""
+                SELECT rowid, {", ".join(spec["columns"])}
+                FROM {table}
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (last_rowid, chunk_size))
+            rows = s_cur.fetchall()
+            if not rows:
+                break
+
+            # ON CONFLICT не смее да го допре истиот клуч двапати во ист INSERT
+            by_key = {}
+            for row in rows:
+                values = row[1:]
+                by_key[values[:key_len]] = values
+
+            execute_values(p_cur, sql, list(by_key.values()), page_size=len(by_key))
+            pg_conn.commit()
+
+            last_rowid = rows[-1][0]
+            checkpoint.commit(table, last_rowid)
+            count += len(rows)
+            print(f"[{table}] {count} rows migrated (rowid {last_rowid})")
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+
+    print(f"Done. Migrated {count} rows into {table}.")
+    return count
+
+
+def _normalize(value):
+    # SQLite враќа датуми како текст, Postgres како date
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _row_hash(row) -> int:
+    digest = hashlib.blake2b(repr(tuple(_normalize(v) for v in row)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _checksum(rows_iter):
+    # сума на hash-ови по модул 2^64: не зависи од редоследот на редовите
+    count, total = 0, 0
+    for rows in rows_iter:
+        for row in rows:
+            total = (total + _row_hash(row)) % (1 << 64)
+            count += 1
+    return count, total
+
+
+def _migrated_rows_sql(table: str, columns: list) -> str:
+    """
+    SQLite редовите како што ги остава миграцијата: по еден ред за клуч,
+    последниот по rowid кај DO UPDATE, првиот кај DO NOTHING.
+    """
+    spec = TABLES[table]
+    pick = "MAX" if spec["update"] else "MIN"
+    return f"""
+        SELECT {", ".join(columns)}
+        FROM {table}
+        WHERE rowid IN (SELECT {pick}(rowid) FROM {table} GROUP BY {", ".join(spec["key"])})
+    """
+
+
+def _sqlite_chunks(table: str, chunk_size: int, columns: list = None):
+    conn = get_sqlite_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(_migrated_rows_sql(table, columns or TABLES[table]["columns"]))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+
+def _pg_chunks(table: str, chunk_size: int):
+    """
+    Само редовите со клучеви од SQLite: редовите што pipeline-от веќе ги
+    запишал во Postgres не се дел од миграцијата.
+    """
+    key = ", ".join(TABLES[table]["key"])
+    conn = get_pg_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TEMP TABLE verify_keys ON COMMIT DROP AS
+            SELECT {key} FROM {table} WITH NO DATA
+        """)
+        for keys in _sqlite_chunks(table, chunk_size, TABLES[table]["key"]):
+            execute_values(cur, f"INSERT INTO verify_keys ({key}) VALUES %s", keys, page_size=len(keys))
+        cur.execute("ANALYZE verify_keys")
+
+        # именуван cursor = server-side, Postgres ги праќа редовите во делови
+        cur = conn.cursor(name=f"verify_{table}")
+        cur.itersize = chunk_size
+        columns = ", ".join(f"t.{c}" for c in TABLES[table]["columns"])
+        cur.execute(f"SELECT {columns} FROM {table} t JOIN verify_keys k USING ({key})")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+
+def verify_table(table: str, chunk_size: int = MIGRATION_CHUNK_SIZE) -> bool:
+    s_count, s_sum = _checksum(_sqlite_chunks(table, chunk_size))
+    p_count, p_sum = _checksum(_pg_chunks(table, chunk_size))
+    ok = s_count == p_count and s_sum == p_sum
+    status = "OK" if ok else "MISMATCH"
+    print(f"[{table}] {status}: sqlite {s_count} rows / {s_sum:016x}, "
+          f"postgres {p_count} rows / {p_sum:016x}")
+    return ok
+
+
+def verify(chunk_size: int = MIGRATION_CHUNK_SIZE) -> bool:
+    print("=== Verification ===")
+    with ThreadPoolExecutor(max_workers=len(TABLES)) as pool:
+        results = list(pool.map(lambda t: verify_table(t, chunk_size), TABLES))
+    return all(results)
+
+
+def migrate(checkpoint: Checkpoint, chunk_size: int = MIGRATION_CHUNK_SIZE):
+    for table in PARENT_TABLES:
+        migrate_table(table, checkpoint, chunk_size)
+
+    # Табелите кои зависат само од coins одат паралелно, секоја со свои конекции
+    with ThreadPoolExecutor(max_workers=len(CHILD_TABLES)) as pool:
+        futures = [pool.submit(migrate_table, t, checkpoint, chunk_size) for t in CHILD_TABLES]
+        for f in futures:
+            f.result()
 
 
 def main():
-    print("=== Migration START ===")
-    migrate_coins()
-    migrate_historical_data()
-    migrate_snapshots()
-    print("=== Migration DONE ===")
+    parser = argparse.ArgumentParser(description="Stream SQLite data into Postgres")
+    parser.add_argument("--chunk-size", type=int, default=MIGRATION_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--verify-only", action="store_true")
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint()
+    if args.restart:
+        checkpoint.reset()
+    checkpoint.load()
+
+    if not args.verify_only:
+        print("=== Migration START ===")
+        migrate(checkpoint, args.chunk_size)
+        print("=== Migration DONE ===")
+
+    if not args.no_verify:
+        ok = verify(args.chunk_size)
+        if not ok:
+            raise SystemExit(1)
 
 
 if __name__ == "__main__":
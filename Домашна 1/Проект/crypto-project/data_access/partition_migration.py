@@ -0,0 +1,143 @@
+import argparse
+
+from data_access.db import get_conn, create_partitioned_tables, is_partitioned
+from configuration.config import *
+
+# Колони кои се копираат; id се пренесува за Java ентитетите да ги задржат клучевите
+COLUMNS = {
+    "historical_data": ["id", "symbol", "date", "close", "high", "low", "open",
+                        "volume_from", "volume_to"],
+    "snapshots": ["id", "symbol", "date", "last_price", "open_24h", "high_24h", "low_24h",
+                  "volume_24h", "volume_24h_to", "change_pct_24h", "market_cap", "supply"],
+}
+# Имиња кои ги зафаќа старата (heap) табела, а партиционираната ги користи истите
+LEGACY_NAMES = {
+    "historical_data": {
+        "constraints": ["historical_data_pkey", "historical_symbol_date_unique", "historical_symbol_fk"],
+        "sequence": "historical_data_id_seq",
+    },
+    "snapshots": {
+        "constraints": ["snapshots_pkey", "snapshots_symbol_date_unique", "snapshots_symbol_fk"],
+        "sequence": "snapshots_id_seq",
+    },
+}
+
+
+def _exists(cur, name: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return cur.fetchone()[0]
+
+
+def rename_legacy(cur, table: str):
+    """
+    Постојната табела станува {table}_legacy. Ограничувањата и секвенцата се
+    преименуваат, бидејќи имињата на индекси/секвенци се уникатни во шемата.
+    """
+    legacy = f"{table}_legacy"
+    cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    for name in LEGACY_NAMES[table]["constraints"]:
+        cur.execute("""
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND conname = %s
+        """, (legacy, name))
+        if cur.fetchone():
+            cur.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {name}_legacy")
+    sequence = LEGACY_NAMES[table]["sequence"]
+    if _exists(cur, sequence):
+        cur.execute(f"ALTER SEQUENCE {sequence} RENAME TO {sequence}_legacy")
+
+
+def copy_year_by_year(conn, table: str) -> int:
+    """
+    Копира по една година во трансакција. ON CONFLICT DO NOTHING ја прави
+    операцијата повторлива: прекинато копирање само се пушта повторно.
+    """
+    legacy = f"{table}_legacy"
+    columns = ", ".join(COLUMNS[table])
+    cur = conn.cursor()
+    cur.execute(f"SELECT MIN(date), MAX(date) FROM {legacy}")
+    first, last = cur.fetchone()
+    if first is None:
+        return 0
+
+    copied = 0
+    for year in range(first.year, last.year + 1):
+        cur.execute(f"""
+            INSERT INTO {table} ({columns})
+            SELECT {columns}
+            FROM {legacy}
+            WHERE date >= %s AND date < %s
+            ON CONFLICT (symbol, date) DO NOTHING
+        """, (date(year, 1, 1), date(year + 1, 1, 1)))
+        conn.commit()
+        copied += cur.rowcount
+        print(f"[{table}] {year}: {cur.rowcount} rows")
+
+    # новите редови продолжуваат по најголемиот пренесен id
+    cur.execute(f"""
+        SELECT setval(pg_get_serial_sequence(%s, 'id'),
+                      GREATEST((SELECT MAX(id) FROM {table}), 1))
+    """, (table,))
+    conn.commit()
+    return copied
+
+
+def verify_table(cur, table: str) -> bool:
+    cur.execute(f"SELECT COUNT(*) FROM {table}_legacy")
+    legacy_count = cur.fetchone()[0]
+    cur.execute(f"SELECT COUNT(*) FROM {table}")
+    count = cur.fetchone()[0]
+    ok = legacy_count == count
+    status = "OK" if ok else "MISMATCH"
+    print(f"[{table}] {status}: legacy {legacy_count} rows, partitioned {count} rows")
+    return ok
+
+
+def migrate(drop_legacy: bool = False) -> bool:
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        for table in COLUMNS:
+            if not is_partitioned(cur, table) and _exists(cur, table):
+                print(f"Renaming {table} -> {table}_legacy")
+                rename_legacy(cur, table)
+        create_partitioned_tables(cur)
+        conn.commit()
+
+        ok = True
+        for table in COLUMNS:
+            if not _exists(cur, f"{table}_legacy"):
+                continue
+            copied = copy_year_by_year(conn, table)
+            print(f"Done. Copied {copied} rows into {table}.")
+            ok = verify_table(cur, table) and ok
+
+        if ok and drop_legacy:
+            for table in COLUMNS:
+                cur.execute(f"DROP TABLE IF EXISTS {table}_legacy")
+            conn.commit()
+            print("Legacy tables dropped.")
+
+        cur.execute("ANALYZE historical_data")
+        cur.execute("ANALYZE snapshots")
+        conn.commit()
+        return ok
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move historical_data/snapshots to yearly partitions")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="drop the *_legacy tables once the row counts match")
+    args = parser.parse_args()
+
+    print("=== Partition migration START ===")
+    ok = migrate(args.drop_legacy)
+    print("=== Partition migration DONE ===")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from configuration.config import LAST_DATE
+from data_access import db
+
+# Фази на симбол во едно извршување
+PENDING = "pending"   # уште не е обработен
+HISTORY = "history"   # историјата е commit-ирана, останува snapshot-от
+DONE = "done"         # историја + snapshot
+FAILED = "failed"
+
+# Симболи со овие фази не се обработуваат повторно при продолжување
+FINISHED = (DONE, FAILED)
+
+
+class RunJournal:
+    """
+    Дневник на тековното извршување во pipeline_runs / pipeline_run_symbols.
+    Фазите се чуваат и во меморија, за проверката по симбол да не чини барање.
+    """
+
+    def __init__(self):
+        self.run_id: Optional[int] = None
+        self.resumed = False
+        self._stages: Dict[str, str] = {}
+
+    def start(self, mode: str = "auto") -> Optional[List[str]]:
+        """
+        mode:
+          auto        - продолжи го недовршеното извршување за LAST_DATE, ако постои
+          new         - секогаш ново извршување
+          only-failed - ново извршување само со неуспешните симболи од претходното
+        Враќа листа симболи ако таа е веќе позната од дневникот, инаку None.
+        """
+        db.abandon_stale_runs(LAST_DATE)
+        self.resumed = False
+        self._stages = {}
+
+        if mode == "only-failed":
+            previous = db.get_last_finished_run()
+            failed = [sym for sym, _, _ in db.get_run_symbols(previous, FAILED)] if previous else []
+            self.run_id = db.start_run(LAST_DATE, mode, previous)
+            self.register(failed)
+            print(f"Run {self.run_id}: retrying {len(failed)} failed symbols from run {previous}")
+            return failed
+
+        if mode == "auto":
+            unfinished = db.get_unfinished_run(LAST_DATE)
+            if unfinished is not None:
+                rows = db.get_run_symbols(unfinished)
+                if rows:
+                    self.run_id = unfinished
+                    self.resumed = True
+                    self._stages = {sym: stage for sym, stage, _ in rows}
+                    db.set_run_status(unfinished, "running")
+                    remaining = sum(stage not in FINISHED for stage in self._stages.values())
+                    print(f"Resuming run {unfinished}: {remaining}/{len(rows)} symbols left")
+                    return [sym for sym, _, _ in rows]
+                # прекинато пред изборот на симболи → нема што да се продолжи
+                db.set_run_status(unfinished, "abandoned")
+
+        self.run_id = db.start_run(LAST_DATE, mode)
+        print(f"Run {self.run_id} started")
+        return None
+
+    def attach(self, run_id: int):
+        # worker процес: работи во извршување кое го започнал друг процес
+        self.run_id = run_id
+        self.resumed = False
+        self._stages = {}
+
+    def adopt(self, claimed: List[Tuple[str, str]]):
+        for sym, stage in claimed:
+            self._stages[sym] = stage
+
+    def register(self, symbols: List[str]):
+        db.register_run_symbols(self.run_id, symbols)
+        for sym in symbols:
+            self._stages.setdefault(sym, PENDING)
+
+    def stage(self, symbol: str) -> str:
+        return self._stages.get(symbol, PENDING)
+
+    def history_done(self, symbol: str, last_chunk: Optional[date], rows: int):
+        db.set_symbol_stage(self.run_id, symbol, HISTORY, last_chunk, rows)
+        self._stages[symbol] = HISTORY
+
+    def history_done_many(self, committed: List[Tuple[str, int, date]]):
+        # по еден commit на writer-от: една изјава за цела група симболи
+        db.set_symbols_history(self.run_id, committed)
+        for sym, _, _ in committed:
+            self._stages[sym] = HISTORY
+
+    def failed(self, symbol: str, error: str):
+        db.set_symbol_stage(self.run_id, symbol, FAILED, error=error)
+        self._stages[symbol] = FAILED
+
+    def snapshots_done(self, symbols: List[str]):
+        db.set_symbols_stage(self.run_id, symbols, DONE)
+        for sym in symbols:
+            self._stages[sym] = DONE
+
+    def finish(self, status: str = "completed"):
+        if self.run_id is not None:
+            db.set_run_status(self.run_id, status)
+
+
+journal = RunJournal()
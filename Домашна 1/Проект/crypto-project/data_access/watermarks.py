@@ -0,0 +1,50 @@
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Set
+
+from data_access import db
+
+
+class WatermarkIndex:
+    """
+    Индекс во меморија за Filter 2 и проверката за snapshot.
+    Се полни со две барања на почетокот на извршувањето и се ажурира
+    по секое запишување, така што не останува ниедно барање по симбол.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._last_dates: Dict[str, date] = {}
+        self._snapshot_day: Optional[date] = None
+        self._snapshots: Set[str] = set()
+
+    def load(self):
+        today = datetime.now(tz=timezone.utc).date()
+        self._last_dates = db.get_last_historical_dates()
+        self._snapshots = db.get_snapshot_symbols(today)
+        self._snapshot_day = today
+        self.loaded = True
+        print(f"Watermarks loaded: {len(self._last_dates)} symbols with history, "
+              f"{len(self._snapshots)} snapshots for {today}")
+
+    def last_date(self, symbol: str) -> Optional[date]:
+        return self._last_dates.get(symbol)
+
+    def advance(self, symbol: str, last_date: date):
+        current = self._last_dates.get(symbol)
+        if current is None or last_date > current:
+            self._last_dates[symbol] = last_date
+
+    def has_snapshot_today(self, symbol: str) -> bool:
+        today = datetime.now(tz=timezone.utc).date()
+        if today != self._snapshot_day:
+            # извршувањето помина полноќ → snapshot-ите од вчера не важат
+            self._snapshots = set()
+            self._snapshot_day = today
+        return symbol in self._snapshots
+
+    def mark_snapshot(self, symbol: str):
+        self.has_snapshot_today(symbol)
+        self._snapshots.add(symbol)
+
+
+watermarks = WatermarkIndex()
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+PREFIX = "crypto_pipeline"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# име → (име на лабела, опис)
+HISTOGRAMS = {
+    "api_request_seconds": ("endpoint", "Latency of CryptoCompare requests"),
+    "db_call_seconds": ("function", "Latency of data_access.db calls"),
+}
+COUNTERS = {
+    "api_retries_total": ("reason", "Retried API requests"),
+    "histoday_empty_chunks_total": (None, "histoday windows that returned no usable rows"),
+    "symbols_skipped_total": ("reason", "Symbols skipped by a filter or failed"),
+    "sleep_seconds_total": ("reason", "Task-seconds spent sleeping (rate limiter, backoff)"),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        # горна граница на bucket-от во кој паѓа квантилот
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 6),
+        }
+
+
+class RunMetrics:
+    """
+    Метрики за едно извршување на pipeline-от.
+    DB функциите се мерат во executor нишките, па сè е под lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(tz=timezone.utc)
+            self._histograms: Dict[str, Dict[str, Histogram]] = {name: {} for name in HISTOGRAMS}
+            self._counters: Dict[str, Dict[str, float]] = {name: {} for name in COUNTERS}
+
+    def observe(self, name: str, label: str, seconds: float):
+        with self._lock:
+            self._histograms[name].setdefault(label, Histogram()).observe(seconds)
+
+    def inc(self, name: str, label: str = "", amount: float = 1):
+        with self._lock:
+            counter = self._counters[name]
+            counter[label] = counter.get(label, 0) + amount
+
+    def state(self) -> dict:
+        """Сурова состојба (picklable), за да ја спои процесот кој ги стартувал workers."""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: {label: (h.counts[:], h.count, h.sum, h.max) for label, h in by_label.items()}
+                    for name, by_label in self._histograms.items()
+                },
+                "counters": {name: dict(by_label) for name, by_label in self._counters.items()},
+            }
+
+    def merge(self, state: dict):
+        with self._lock:
+            for name, by_label in state["histograms"].items():
+                for label, (counts, count, total, peak) in by_label.items():
+                    h = self._histograms[name].setdefault(label, Histogram())
+                    h.counts = [a + b for a, b in zip(h.counts, counts)]
+                    h.count += count
+                    h.sum += total
+                    h.max = max(h.max, peak)
+            for name, by_label in state["counters"].items():
+                counter = self._counters[name]
+                for label, value in by_label.items():
+                    counter[label] = counter.get(label, 0) + value
+
+    def add_sleep(self, reason: str, seconds: float):
+        self.inc("sleep_seconds_total", reason, seconds)
+
+    @contextmanager
+    def timer(self, name: str, label: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - start)
+
+    def report(self, wall_seconds: float, summary: Optional[dict] = None) -> dict:
+        with self._lock:
+            histograms = {
+                name: {label: h.to_dict() for label, h in by_label.items()}
+                for name, by_label in self._histograms.items()
+            }
+            counters = {name: dict(by_label) for name, by_label in self._counters.items()}
+
+        api_seconds = sum(h["sum"] for h in histograms["api_request_seconds"].values())
+        db_seconds = sum(h["sum"] for h in histograms["db_call_seconds"].values())
+        sleep_seconds = sum(counters["sleep_seconds_total"].values())
+        return {
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(wall_seconds, 3),
+            "summary": summary or {},
+            # task-seconds: при паралелно извршување збирот може да е поголем од wall time
+            "time_split": {
+                "api_seconds": round(api_seconds, 3),
+                "db_seconds": round(db_seconds, 3),
+                "sleep_seconds": round(sleep_seconds, 3),
+                "sleep_by_reason": {k: round(v, 3) for k, v in counters["sleep_seconds_total"].items()},
+            },
+            "histograms": histograms,
+            "counters": counters,
+        }
+
+    def prometheus(self, wall_seconds: float) -> str:
+        lines = []
+        with self._lock:
+            for name, (label_name, help_text) in HISTOGRAMS.items():
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for label, h in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, h.counts):
+                        cumulative += n
+                        lines.append(f'{metric}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{label_name}="{label}",le="+Inf"}} {h.count}')
+                    lines.append(f'{metric}_sum{{{label_name}="{label}"}} {h.sum:.6f}')
+                    lines.append(f'{metric}_count{{{label_name}="{label}"}} {h.count}')
+
+            for name, (label_name, help_text) in COUNTERS.items():
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for label, value in sorted(self._counters[name].items()):
+                    labels = f'{{{label_name}="{label}"}}' if label_name else ""
+                    lines.append(f"{metric}{labels} {value:g}")
+
+        lines.append(f"# HELP {PREFIX}_run_wall_seconds Wall-clock duration of the last run")
+        lines.append(f"# TYPE {PREFIX}_run_wall_seconds gauge")
+        lines.append(f"{PREFIX}_run_wall_seconds {wall_seconds:.3f}")
+        lines.append(f"# HELP {PREFIX}_run_finished_timestamp_seconds Unix time the last run finished")
+        lines.append(f"# TYPE {PREFIX}_run_finished_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_run_finished_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, directory: str, wall_seconds: float, summary: Optional[dict] = None):
+        """
+        JSON извештај по извршување и Prometheus textfile (за node_exporter)
+        кој секогаш ја содржи последната состојба.
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S")
+        json_path = os.path.join(directory, f"run-{stamp}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(wall_seconds, summary), f, indent=2, default=str)
+
+        prom_path = os.path.join(directory, f"{PREFIX}.prom")
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(wall_seconds))
+        os.replace(tmp_path, prom_path)
+        print(f"Run report: {json_path}")
+        print(f"Prometheus metrics: {prom_path}")
+
+
+metrics = RunMetrics()
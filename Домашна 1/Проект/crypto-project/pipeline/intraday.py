@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import time
+import aiohttp
+
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from data_access import db
+from monitoring.metrics import metrics
+from configuration.config import *
+from services.history_writer import HistoryWriter
+from services.intraday import download_candles, missing_from
+
+
+async def ingest_resolution(session, resolution: str, symbols, concurrency: int) -> dict:
+    """
+    Filter 2/3 модел за една резолуција: watermark по симбол од табелата на
+    резолуцијата, преземање само на недостигачките свеќи, запишување преку writer-от.
+    """
+    policy = INTRADAY_RESOLUTIONS[resolution]
+    table = policy["table"]
+    step = policy["step"]
+    earliest = int((datetime.now(tz=timezone.utc) - timedelta(days=policy["retention_days"])).timestamp())
+
+    last_times = await db.run_async(db.get_last_candle_times, table)
+    summary = {"resolution": resolution, "symbols": len(symbols), "up_to_date": 0,
+               "updated": 0, "rows": 0, "failed": [], "downsampled": 0, "deleted": 0}
+
+    def advance(symbol, ts):
+        if symbol not in last_times or ts > last_times[symbol]:
+            last_times[symbol] = ts
+
+    async def on_commit(committed):
+        for _, rows, _ in committed:
+            summary["updated"] += 1
+            summary["rows"] += rows
+
+    async def on_error(symbol, e):
+        print(f"[{symbol}] {resolution} failed: {e}")
+        summary["failed"].append(symbol)
+        metrics.inc("symbols_skipped_total", "failed")
+
+    writer = HistoryWriter(write=partial(db.upsert_candle_rows, table), advance=advance)
+    writer.start(on_commit, on_error)
+
+    queue = asyncio.Queue()
+    for sym in symbols:
+        queue.put_nowait(sym)
+
+    async def worker():
+        while True:
+            try:
+                sym = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = missing_from(last_times.get(sym), earliest, step)
+            if start is None:
+                summary["up_to_date"] += 1
+                metrics.inc("symbols_skipped_total", "up_to_date")
+                continue
+            try:
+                await download_candles(session, sym, resolution, start, writer)
+            except Exception as e:
+                await on_error(sym, e)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(symbols))))))
+    finally:
+        await writer.close()
+
+    summary["downsampled"], summary["deleted"] = await db.run_async(db.apply_candle_retention, resolution)
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"=== {summary['resolution']} candles ===")
+    print(f"Symbols:       {summary['symbols']} ({summary['up_to_date']} up to date, "
+          f"{summary['updated']} updated)")
+    print(f"Rows written:  {summary['rows']}")
+    if summary["downsampled"]:
+        print(f"Downsampled:   {summary['downsampled']} candles")
+    print(f"Retention:     {summary['deleted']} old candles deleted")
+    failed = summary["failed"]
+    print(f"Failed:        {len(failed)}" + (f" -> {', '.join(failed)}" if failed else ""))
+
+
+async def main(resolutions, symbols_limit: int = INTRADAY_SYMBOLS, concurrency: int = CONCURRENCY,
+               report_dir: str = ""):
+    start_time = time.time()
+    metrics.reset()
+    db.init_pool(min(concurrency, DB_POOL_SIZE))
+    try:
+        await db.run_async(db.init_db)
+        symbols = await db.run_async(db.get_active_symbols, symbols_limit)
+        if not symbols:
+            # уште нема snapshot-и → првите симболи од coins
+            symbols = (await db.run_async(db.get_all_coin_symbols))[:symbols_limit]
+        print(f"Intraday ingestion for {len(symbols)} symbols: {', '.join(resolutions)}")
+
+        summaries = []
+        async with aiohttp.ClientSession() as session:
+            # погрубата резолуција прва, за downsampling-от да не ги засени свеќите од API
+            for resolution in sorted(resolutions, key=lambda r: -INTRADAY_RESOLUTIONS[r]["step"]):
+                summaries.append(await ingest_resolution(session, resolution, symbols, concurrency))
+    finally:
+        db.close_pool()
+
+    elapsed = time.time() - start_time
+    for summary in summaries:
+        print_summary(summary)
+    print(f"Run finished in {int(elapsed // 60)}m {elapsed % 60:.1f}s")
+    if report_dir:
+        metrics.write_reports(report_dir, elapsed, {"intraday": summaries})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Intraday (hourly/minute) candle ingestion")
+    parser.add_argument("--resolution", nargs="+", choices=sorted(INTRADAY_RESOLUTIONS), default=["hour"])
+    parser.add_argument("--symbols", type=int, default=INTRADAY_SYMBOLS,
+                        help="how many of the most traded symbols to ingest")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--report-dir", default="",
+                        help="write a JSON/Prometheus report (separate from the daily run's directory)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(args.resolution, args.symbols, args.concurrency, args.report_dir))
@@ -1,10 +1,19 @@
+import argparse
 import asyncio
 import time
 import aiohttp
 
-from data_access import db
+from data_access import columnar_store, db
+from data_access.run_journal import journal, HISTORY, FINISHED
+from data_access.watermarks import watermarks
+from monitoring.metrics import metrics
+from pipeline import sharding
 from configuration.config import *
 from services.api_client import fetch_json
+from services.filter_cache import Filter1Cache
+from services.history_writer import HistoryWriter
+from services.http_cache import http_cache
+from services.snapshots import fetch_and_store_snapshots
 from services.filters import (
     filter1_has_recent_history,
     filter2_get_missing_from,
@@ -34,35 +43,228 @@ async def fetch_top_coins_paged(session: aiohttp.ClientSession, max_coins=1500):
 
         print(f"Loaded page {page}, {len(page_data)} coins (total = {len(all_coins)})")
 
-        await asyncio.sleep(0.6)
-
     print(f"Fetched {len(all_coins)} raw coins.")
     return all_coins
 
 
-async def pick_exactly_1000_symbols(session, all_symbols):
-    valid_symbols = []
-
-    for sym in all_symbols:
-        ok = await filter1_has_recent_history(session, sym)
-        if ok:
-            valid_symbols.append(sym)
-        if len(valid_symbols) == 1000:
-            break
-
-        await asyncio.sleep(0.2)
+async def pick_exactly_1000_symbols(session, all_symbols, target: int = 1000,
+                                    concurrency: int = FILTER1_CONCURRENCY):
+    """
+    Filter1 паралелно, со зачуван редослед по market cap.
+    Штом првите `target` валидни симболи се познати (сите пред нив се проверени),
+    преостанатите проверки се откажуваат.
+    Симбол без дефинитивен одговор (мрежна грешка) се проверува уште еднаш на крајот
+    од редицата; ако пак нема одговор, се прескокнува во ова извршување, но не се кешира.
+    """
+    cache = Filter1Cache()
+    cache.load()
+
+    results = [cache.get(sym) for sym in all_symbols]
+    cached = sum(r is not None for r in results)
+    if cached:
+        print(f"Filter1: {cached} symbols answered from cache")
+
+    queue = asyncio.Queue()
+    for i, r in enumerate(results):
+        if r is None:
+            queue.put_nowait(i)
+    retried = set()
+
+    # префикс од проверени симболи и колку валидни има во него
+    prefix = {"resolved": 0, "valid": 0}
+    selection_ready = asyncio.Event()
+
+    def advance_prefix():
+        while prefix["resolved"] < len(results) and results[prefix["resolved"]] is not None:
+            if results[prefix["resolved"]]:
+                prefix["valid"] += 1
+            prefix["resolved"] += 1
+            if prefix["valid"] >= target:
+                selection_ready.set()
+                return
+
+    async def worker():
+        while not selection_ready.is_set():
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            sym = all_symbols[i]
+            ok = await filter1_has_recent_history(session, sym)
+            if ok is None:
+                if i not in retried:
+                    retried.add(i)
+                    queue.put_nowait(i)
+                    continue
+                print(f"Filter1: no answer for {sym}, skipped in this run")
+                ok = False
+            else:
+                cache.put(sym, ok)
+            results[i] = ok
+            advance_prefix()
+
+    advance_prefix()
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    ready = asyncio.create_task(selection_ready.wait())
+    all_done = asyncio.gather(*workers)
+    try:
+        await asyncio.wait({ready, all_done}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (*workers, ready):
+            task.cancel()
+        await asyncio.gather(all_done, ready, return_exceptions=True)
+        cache.save()
+
+    # worker што паднал би оставил непроверени симболи → изборот би бил непотполн
+    errors = [t.exception() for t in workers if t.done() and not t.cancelled() and t.exception()]
+    if errors:
+        print(f"Filter1: {len(errors)} workers failed, selection is incomplete")
+        raise errors[0]
+
+    metrics.inc("symbols_skipped_total", "filter1", sum(r is False for r in results))
+    skipped = sum(r is None for r in results)
+    if skipped:
+        print(f"Filter1: selection complete, cancelled {skipped} outstanding checks")
+
+    valid_symbols = [sym for sym, ok in zip(all_symbols, results) if ok]
+    return valid_symbols[:target]
+
+
+async def process_symbol(session, sym: str, summary: dict, writer: HistoryWriter, no_rows: list):
+    # Само историја; snapshot-ите се земаат групно откако ќе заврши историјата.
+    # Симболите без редови за запишување одат во no_rows, за дневникот групно.
+    missing_from = await filter2_get_missing_from(sym)
+    if missing_from is None:
+        summary["up_to_date"] += 1
+        summary["processed"] += 1
+        metrics.inc("symbols_skipped_total", "up_to_date")
+        no_rows.append((sym, 0, watermarks.last_date(sym)))
+        return
+
+    # редовите ги запишува writer-от; бројачите и дневникот се ажурираат по commit
+    queued, _ = await filter3_fill_missing_and_snapshot(session, sym, missing_from,
+                                                        with_snapshot=False, writer=writer)
+    if not queued:
+        summary["backfilled"] += 1
+        summary["processed"] += 1
+        no_rows.append((sym, 0, watermarks.last_date(sym)))
+
+
+async def process_symbols(session, symbols, concurrency: int = CONCURRENCY) -> dict:
+    total = len(symbols)
+    summary = sharding.empty_summary(total)
+
+    queue = asyncio.Queue()
+    for i, sym in enumerate(symbols, start=1):
+        stage = journal.stage(sym)
+        if stage in FINISHED or stage == HISTORY:
+            # завршено во прекинатото извршување: без барање кон API или базата
+            summary["resumed"] += 1
+            metrics.inc("symbols_skipped_total", "resumed")
+            continue
+        queue.put_nowait((i, sym))
+
+    def record_failure(sym: str, e: Exception):
+        print(f"[{sym}] failed: {e}")
+        summary["failed"].append(sym)
+        metrics.inc("symbols_skipped_total", "failed")
+
+    async def on_commit(committed):
+        for sym, rows, _ in committed:
+            summary["backfilled"] += 1
+            summary["processed"] += 1
+            summary["history_rows"] += rows
+        await db.run_async(journal.history_done_many, committed)
+
+    async def on_error(sym: str, e: Exception):
+        record_failure(sym, e)
+        await db.run_async(journal.failed, sym, str(e))
+
+    # ажурните симболи: една изјава за цела група наместо UPDATE по симбол
+    no_rows = []
+
+    async def flush_no_rows():
+        if no_rows:
+            batch = no_rows[:]
+            no_rows.clear()
+            await db.run_async(journal.history_done_many, batch)
+
+    # Преземањето и запишувањето се преклопуваат: workers полнат, writer-от празни
+    writer = HistoryWriter()
+    writer.start(on_commit, on_error)
+
+    async def worker():
+        while True:
+            try:
+                i, sym = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
 
-    return valid_symbols
+            print(f"[{i}/{total}] processing {sym}")
+            try:
+                await process_symbol(session, sym, summary, writer, no_rows)
+            except Exception as e:
+                await on_error(sym, e)
+            if len(no_rows) >= JOURNAL_FLUSH_SYMBOLS:
+                await flush_no_rows()
+
+    workers = max(1, min(concurrency, total))
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        try:
+            await writer.close()
+        finally:
+            await flush_no_rows()
+
+    # Snapshot фаза: историјата за секој симбол е веќе запишана
+    failed = set(summary["failed"])
+    done = [sym for sym in symbols if sym not in failed and journal.stage(sym) not in FINISHED]
+    summary["snapshots"] = await fetch_and_store_snapshots(session, done)
+    # без snapshot (API не го вратил) симболот останува во HISTORY фаза
+    await db.run_async(journal.snapshots_done, [s for s in done if watermarks.has_snapshot_today(s)])
+    return summary
+
+
+def print_summary(summary: dict, elapsed: float):
+    mins = int(elapsed // 60)
+    secs = elapsed % 60
+
+    print("=== Run summary ===")
+    print(f"Symbols:       {summary['processed']}/{summary['total']} processed")
+    print(f"Up to date:    {summary['up_to_date']}")
+    print(f"Backfilled:    {summary['backfilled']} ({summary['history_rows']} history rows)")
+    print(f"Snapshots:     {summary['snapshots']} saved")
+    if summary["resumed"]:
+        print(f"Resumed:       {summary['resumed']} symbols already done in run {journal.run_id}")
+    if summary["failed"]:
+        print(f"Failed:        {len(summary['failed'])} -> {', '.join(summary['failed'])}")
+    else:
+        print("Failed:        0")
+    if http_cache.mode == "record":
+        print(f"HTTP cache:    recorded {http_cache.recorded} responses")
+    elif http_cache.mode == "replay":
+        print(f"HTTP cache:    replayed {http_cache.hits} responses, {http_cache.misses} misses")
+    if elapsed > 0:
+        print(f"Throughput:    {summary['processed'] / elapsed:.2f} symbols/s")
+    print(f"Run finished in {mins}m {secs:.1f}s")
 
 
-async def main():
-    start_time = time.time()
-    db.init_db()
+async def run_pipeline(concurrency: int, journal_mode: str = "auto",
+                       workers: int = 1, shard_index: int = 0, shard_count: int = 1) -> dict:
+    await db.run_async(db.init_db)
+    # Filter 2 и проверката за snapshot се одговараат од меморија
+    await db.run_async(watermarks.load)
 
-    existing_symbols = db.get_all_coin_symbols()
+    journal_symbols = await db.run_async(journal.start, journal_mode)
+    existing_symbols = [] if journal_symbols is not None else await db.run_async(db.get_all_coin_symbols)
 
     async with aiohttp.ClientSession() as session:
-        if existing_symbols:
+        if journal_symbols is not None:
+            # продолжување или --only-failed: листата е во дневникот
+            valid_symbols = journal_symbols
+
+        elif existing_symbols:
             print(f"Found {len(existing_symbols)} symbols in coins table.")
             print("Skipping API fetch and Filter1, using symbols from DB.")
             valid_symbols = existing_symbols
@@ -101,23 +303,92 @@ async def main():
             final_symbol_map = {sym: symbol_fullname_map[sym] for sym in valid_symbols}
 
             print("Saving 1000 valid symbols into coins table...")
-            db.insert_coins(final_symbol_map)
+            await db.run_async(db.insert_coins, final_symbol_map)
 
-        # Filter2 + Filter3 за секое од 1000
-        total = len(valid_symbols)
-        for i, sym in enumerate(valid_symbols, start=1):
-            print(f"[{i}/{total}] processing {sym}")
+        if journal_symbols is None:
+            await db.run_async(journal.register, valid_symbols)
+
+    if workers > 1 or shard_count > 1:
+        # Симболите ги делат worker процеси (и хостови со --join) преку pipeline_run_symbols
+        return await sharding.run_shards(journal.run_id, valid_symbols, shard_index, shard_count,
+                                         workers, concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        # Filter2 + Filter3 за секое од 1000, паралелно по CONCURRENCY симболи
+        return await process_symbols(session, valid_symbols, concurrency)
 
-            missing_from = filter2_get_missing_from(sym)
-            await filter3_fill_missing_and_snapshot(session, sym, missing_from)
 
-            await asyncio.sleep(0.2)
+async def main(concurrency: int = CONCURRENCY, report_dir: str = REPORT_DIR,
+               journal_mode: str = "auto", workers: int = 1, shard_index: int = 0,
+               shard_count: int = 1, join: bool = False):
+    start_time = time.time()
+    metrics.reset()
+
+    # Една pool-а за целото извршување: конекциите не се отвораат по симбол
+    db.init_pool(min(concurrency, DB_POOL_SIZE))
+    try:
+        if join:
+            summary = await sharding.join_run(shard_index, shard_count, workers, concurrency)
+        else:
+            summary = await run_pipeline(concurrency, journal_mode, workers, shard_index, shard_count)
+            if COLUMNAR_SYNC:
+                # Arrow копијата ги следи само симболите со нова историја
+                await db.run_async(columnar_store.sync)
+        journal.finish("completed")
+    except BaseException:
+        # следното извршување го продолжува ова (ако е за истиот ден)
+        journal.finish("interrupted")
+        raise
+    finally:
+        db.close_pool()
 
     end_time = time.time()
-    mins = int((end_time - start_time) // 60)
-    secs = (end_time - start_time) % 60
-    print(f"Run finished in {mins}m {secs:.1f}s")
+    print_summary(summary, end_time - start_time)
+    if report_dir:
+        metrics.write_reports(report_dir, end_time - start_time, summary)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Daily crypto ingestion pipeline")
+    parser.add_argument(
+        "--http-cache", choices=["off", "record", "replay"], default=http_cache.mode,
+        help="record API responses to disk, or replay them without network",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY,
+        help=f"number of symbols processed at once (default {CONCURRENCY}, 1 = sequential)",
+    )
+    parser.add_argument(
+        "--report-dir", default=REPORT_DIR,
+        help="where to write the JSON run report and Prometheus textfile ('' disables)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="worker processes on this host; >1 shares the run through pipeline_run_symbols claims",
+    )
+    parser.add_argument("--shard-index", type=int, default=0, help="index of this host (0-based)")
+    parser.add_argument(
+        "--shard-count", type=int, default=1,
+        help="number of hosts; API keys are split across all hosts x workers",
+    )
+    parser.add_argument(
+        "--join", action="store_true",
+        help="join today's run started by another host instead of starting one",
+    )
+    resume = parser.add_mutually_exclusive_group()
+    resume.add_argument(
+        "--new-run", dest="journal_mode", action="store_const", const="new", default="auto",
+        help="start a fresh run instead of resuming an unfinished one for the same day",
+    )
+    resume.add_argument(
+        "--only-failed", dest="journal_mode", action="store_const", const="only-failed",
+        help="rerun only the symbols that failed in the previous run",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    http_cache.set_mode(args.http_cache)
+    asyncio.run(main(args.concurrency, args.report_dir, args.journal_mode,
+                     args.workers, args.shard_index, args.shard_count, args.join))
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import socket
+import time
+import aiohttp
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from data_access import db
+from data_access.run_journal import journal
+from data_access.watermarks import watermarks
+from monitoring.metrics import metrics
+from configuration.config import *
+from services.http_cache import http_cache
+from services.rate_limiter import limiter
+
+
+def worker_name(shard: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}/s{shard}"
+
+
+def merge_summary(total: dict, part: dict):
+    for key in ("processed", "up_to_date", "backfilled", "history_rows", "snapshots", "resumed"):
+        total[key] += part[key]
+    total["failed"].extend(part["failed"])
+
+
+def empty_summary(total: int = 0) -> dict:
+    return {
+        "total": total,
+        "processed": 0,
+        "up_to_date": 0,
+        "backfilled": 0,
+        "history_rows": 0,
+        "snapshots": 0,
+        "resumed": 0,
+        "failed": [],
+    }
+
+
+async def claim_loop(run_id: int, shard: int, concurrency: int) -> dict:
+    """
+    Еден worker: зема групи симболи од pipeline_run_symbols сè додека има
+    незавршени и ги обработува со истиот код како еднопроцесниот режим.
+    """
+    from pipeline.main import process_symbols
+
+    name = worker_name(shard)
+    journal.attach(run_id)
+    await db.run_async(watermarks.load)
+    summary = empty_summary()
+
+    async with aiohttp.ClientSession() as session:
+        while True:
+            claimed = await db.run_async(db.claim_run_symbols, run_id, name, CLAIM_BATCH_SIZE,
+                                         CLAIM_TIMEOUT_SECONDS, CLAIM_MAX_ATTEMPTS)
+            if not claimed:
+                break
+            journal.adopt(claimed)
+            part = await process_symbols(session, [sym for sym, _ in claimed], concurrency)
+            # HISTORY симболите без snapshot може веднаш да се земат пак (до CLAIM_MAX_ATTEMPTS)
+            await db.run_async(db.release_claims, run_id, name)
+            merge_summary(summary, part)
+            summary["total"] += len(claimed)
+            print(f"[{name}] {summary['processed']} processed, {len(summary['failed'])} failed "
+                  f"({summary['total']} claimed)")
+    return summary
+
+
+def run_worker(run_id: int, shard: int, shard_total: int, concurrency: int,
+               cache_mode: str) -> Tuple[dict, dict]:
+    """Влезна точка на worker процесот: свој подскуп клучеви, своја pool-а и сесија."""
+    limiter.shard(shard, shard_total)
+    http_cache.set_mode(cache_mode)
+    metrics.reset()
+    db.init_pool(min(concurrency, DB_POOL_SIZE))
+    try:
+        summary = asyncio.run(claim_loop(run_id, shard, concurrency))
+    finally:
+        db.close_pool()
+    return summary, metrics.state()
+
+
+def print_progress(run_id: int, progress: dict, total: int):
+    finished = sum(stages.get("done", 0) + stages.get("failed", 0)
+                   for stages in progress["by_worker"].values())
+    print(f"=== Run {run_id}: {finished}/{total} finished, "
+          f"{progress['in_flight']} in flight, {progress['claimable']} waiting ===")
+    for worker, stages in sorted(progress["by_worker"].items()):
+        if not worker:
+            continue
+        print(f"  {worker:<40} done {stages.get('done', 0):>5}  history {stages.get('history', 0):>5}  "
+              f"pending {stages.get('pending', 0):>5}  failed {stages.get('failed', 0):>5}")
+
+
+async def run_local_workers(run_id: int, shard_index: int, shard_count: int, workers: int,
+                            concurrency: int) -> dict:
+    """
+    Стартува `workers` процеси на овој хост. Глобалниот индекс на процесот
+    (хост × процес) одредува кој подскуп API клучеви го користи.
+    """
+    loop = asyncio.get_running_loop()
+    shard_total = shard_count * workers
+    summary = empty_summary()
+    # spawn: процесите не наследуваат event loop, pool-а или отворени сокети
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            loop.run_in_executor(pool, run_worker, run_id, shard_index * workers + i,
+                                 shard_total, concurrency, http_cache.mode)
+            for i in range(workers)
+        ]
+        for part, state in await asyncio.gather(*futures):
+            merge_summary(summary, part)
+            summary["total"] += part["total"]
+            metrics.merge(state)
+    return summary
+
+
+async def run_shards(run_id: int, symbols: List[str], shard_index: int, shard_count: int,
+                     workers: int, concurrency: int) -> dict:
+    """
+    Процесот кој го започнал извршувањето: ги пушта локалните workers и
+    чека додека и workers на другите хостови (--join) не ја завршат работата.
+    """
+    summary = empty_summary()
+    last_report = 0.0
+    start_workers = True
+    while True:
+        if start_workers:
+            part = await run_local_workers(run_id, shard_index, shard_count, workers, concurrency)
+            merge_summary(summary, part)
+
+        progress = await db.run_async(db.get_run_progress, run_id, CLAIM_MAX_ATTEMPTS)
+        if time.monotonic() - last_report >= SHARD_PROGRESS_INTERVAL or not progress["in_flight"]:
+            print_progress(run_id, progress, len(symbols))
+            last_report = time.monotonic()
+        # нови процеси само кога има што да се земе; инаку само се чекаат другите хостови
+        start_workers = bool(progress["claimable"])
+        if start_workers:
+            # истечени барања (умрен worker) → нов круг локално
+            continue
+        if not progress["in_flight"]:
+            break
+        await asyncio.sleep(SHARD_PROGRESS_INTERVAL)
+
+    summary["total"] = len(symbols)
+    return summary
+
+
+async def join_run(shard_index: int, shard_count: int, workers: int, concurrency: int) -> dict:
+    """
+    Хост кој се приклучува на извршувањето за денес (го започнал друг хост)
+    и зема работа додека ја има. Не го завршува извршувањето.
+    """
+    await db.run_async(db.init_db)
+    deadline = time.monotonic() + SHARD_JOIN_WAIT_SECONDS
+    while True:
+        run_id = await db.run_async(db.get_unfinished_run, LAST_DATE)
+        if run_id is not None and await db.run_async(db.get_run_symbols, run_id):
+            break
+        if time.monotonic() >= deadline:
+            print(f"No run for {LAST_DATE} to join after {SHARD_JOIN_WAIT_SECONDS}s")
+            return empty_summary()
+        await asyncio.sleep(SHARD_PROGRESS_INTERVAL)
+
+    print(f"Joining run {run_id} as shard {shard_index}/{shard_count} with {workers} workers")
+    summary = await run_local_workers(run_id, shard_index, shard_count, workers, concurrency)
+    progress = await db.run_async(db.get_run_progress, run_id, CLAIM_MAX_ATTEMPTS)
+    print_progress(run_id, progress, sum(sum(s.values()) for s in progress["by_worker"].values()))
+    return summary
@@ -0,0 +1,154 @@
+"""
+Daemon кој на секои SNAPSHOT_DAEMON_INTERVAL секунди ги зема цените за целиот
+универзум (pricemultifull во групи) и запишува intraday snapshot само за
+симболите чија цена или волумен се промениле од последното запишување.
+
+    python -m pipeline.snapshot_daemon [--interval 60] [--once]
+
+Состојбата во меморија е ограничена на еден клуч по симбол; сесијата и
+pool-ата се отвораат еднаш, а старите редови се бришат периодично.
+"""
+import argparse
+import asyncio
+import signal
+import time
+import aiohttp
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from data_access import db
+from monitoring.metrics import metrics
+from configuration.config import *
+from services.http_cache import http_cache
+from services.snapshots import fetch_snapshot_batch, snapshot_batches
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def change_key(row: Tuple) -> Tuple:
+    # цена, волумен (во монети и во USD)
+    return row[0], row[4], row[5]
+
+
+async def poll_once(session, symbols: List[str], last_seen: Dict[str, Tuple]) -> dict:
+    ts = datetime.now(tz=timezone.utc).replace(microsecond=0)
+    batches = list(snapshot_batches(symbols))
+    results = await asyncio.gather(*(fetch_snapshot_batch(session, b) for b in batches))
+
+    changed = {}
+    received = 0
+    failed_batches = 0
+    for rows in results:
+        if rows is None:
+            failed_batches += 1
+            continue
+        received += len(rows)
+        for sym, row in rows.items():
+            if last_seen.get(sym) != change_key(row):
+                changed[sym] = row
+
+    await db.run_async(db.save_intraday_snapshots, ts, changed)
+    # клучевите се ажурираат дури по commit, за неуспешен запис да се повтори
+    for sym, row in changed.items():
+        last_seen[sym] = change_key(row)
+    metrics.inc("symbols_skipped_total", "unchanged", received - len(changed))
+    return {"received": received, "changed": len(changed), "failed_batches": failed_batches}
+
+
+async def reload_symbols(last_seen: Dict[str, Tuple]) -> List[str]:
+    """Нова листа симболи; исчезнатите симболи се отстрануваат од last_seen."""
+    symbols = await db.run_async(db.get_all_coin_symbols)
+    for sym in set(last_seen) - set(symbols):
+        del last_seen[sym]
+    rss = ""
+    if resource is not None:
+        rss = f", max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MiB"
+    print(f"Snapshot daemon: {len(symbols)} symbols{rss}")
+    return symbols
+
+
+async def prune_snapshots() -> int:
+    """Бришење на редовите постари од SNAPSHOT_DAEMON_RETENTION_DAYS."""
+    cutoff = datetime.now(tz=timezone.utc) - timedelta(days=SNAPSHOT_DAEMON_RETENTION_DAYS)
+    deleted = await db.run_async(db.delete_intraday_snapshots_before, cutoff)
+    print(f"Snapshot daemon: {deleted} old rows deleted")
+    return deleted
+
+
+async def run(interval: int, once: bool = False):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C се фаќа како KeyboardInterrupt
+
+    await db.run_async(db.init_db)
+    # промените се споредуваат со последното запишано и по рестарт
+    latest = await db.run_async(db.get_latest_intraday_snapshots)
+    last_seen = {sym: change_key(row) for sym, row in latest.items()}
+
+    async with aiohttp.ClientSession() as session:
+        tick = 0
+        symbols: List[str] = []
+        while not stop.is_set():
+            started = time.monotonic()
+            refresh_due = tick % SNAPSHOT_DAEMON_REFRESH_TICKS == 0
+            # без листа симболи нема што да се повлече → нов обид на секој круг
+            if refresh_due or not symbols:
+                try:
+                    symbols = await reload_symbols(last_seen)
+                except Exception as e:
+                    print(f"[{datetime.now():%H:%M:%S}] tick {tick}: symbol reload failed: {e}")
+            if refresh_due:
+                try:
+                    await prune_snapshots()
+                except Exception as e:
+                    # неуспешно бришење не ја фрла веќе вчитаната листа
+                    print(f"[{datetime.now():%H:%M:%S}] tick {tick}: retention delete failed: {e}")
+            try:
+                result = await poll_once(session, symbols, last_seen)
+                print(f"[{datetime.now():%H:%M:%S}] tick {tick}: {result['received']}/{len(symbols)} "
+                      f"symbols, {result['changed']} changed, {result['failed_batches']} failed batches, "
+                      f"{time.monotonic() - started:.1f}s")
+            except Exception as e:
+                # еден неуспешен круг не го запира daemon-от
+                print(f"[{datetime.now():%H:%M:%S}] tick {tick} failed: {e}")
+            tick += 1
+            if once:
+                break
+
+            # следниот круг е поврзан со почетокот на овој, за интервалот да не лизга
+            delay = max(0.0, interval - (time.monotonic() - started))
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    print("Snapshot daemon stopped")
+
+
+async def main(interval: int = SNAPSHOT_DAEMON_INTERVAL, once: bool = False):
+    # record режимот би запишувал нова датотека на секој круг
+    http_cache.set_mode("off")
+    db.init_pool(2)
+    try:
+        await run(interval, once)
+    finally:
+        db.close_pool()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Poll intraday snapshots for the whole universe")
+    parser.add_argument("--interval", type=int, default=SNAPSHOT_DAEMON_INTERVAL, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="poll once and exit (for cron or testing)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(args.interval, args.once))
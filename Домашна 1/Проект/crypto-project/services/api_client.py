@@ -1,25 +1,89 @@
 import asyncio
+import json
 import aiohttp
 from typing import Optional, Dict, Any
-from configuration.config import CC_API_KEYS, RETRY_COUNT, RETRY_SLEEP
+from urllib.parse import urlparse
+from configuration.config import RETRY_COUNT, RATE_LIMIT_MAX_RETRIES
+from monitoring.metrics import metrics
+from services.http_cache import http_cache
+from services.rate_limiter import limiter, backoff_delay
 
-_api_key_index = 0
+try:
+    # orjson ги парсира bytes директно, без посебно декодирање во str
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 
-def _next_api_key() -> str:
-    global _api_key_index
-    key = CC_API_KEYS[_api_key_index]
-    _api_key_index = (_api_key_index + 1) % len(CC_API_KEYS)
-    return key
+def _header_float(headers, *names) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
+
+
+def _is_rate_limited(status: int, data) -> bool:
+    if status == 429:
+        return True
+    if isinstance(data, dict) and data.get("Response") == "Error":
+        message = str(data.get("Message", "")).lower()
+        return "rate limit" in message or data.get("Type") == 99
+    return False
 
 
 async def fetch_json(session: aiohttp.ClientSession, url: str, params: dict) -> Optional[Dict[str, Any]]:
-    for attempt in range(RETRY_COUNT):
-        headers = {"authorization": f"Apikey {_next_api_key()}"} if CC_API_KEYS else {}
+    if http_cache.mode == "replay":
+        hit, data = http_cache.get(url, params)
+        if not hit:
+            print(f"Replay miss for {url} {http_cache.normalize(params)}")
+        return data
+
+    endpoint = urlparse(url).path
+    errors = 0
+    rate_limited = 0
+    while errors < RETRY_COUNT and rate_limited <= RATE_LIMIT_MAX_RETRIES:
+        key = await limiter.acquire()
+        headers = {"authorization": f"Apikey {key}"} if key else {}
         try:
-            async with session.get(url, params=params, headers=headers, timeout=15) as resp:
-                return await resp.json()
+            with metrics.timer("api_request_seconds", endpoint):
+                async with session.get(url, params=params, headers=headers, timeout=15) as resp:
+                    status = resp.status
+                    resp_headers = resp.headers
+                    body = await resp.read() if status != 429 else b""
+                    data = json_loads(body) if body.strip() else None
+                    reason = resp.reason or ""
+                    request_info, history = resp.request_info, resp.history
+            retry_after = _header_float(resp_headers, "Retry-After")
+
+            if _is_rate_limited(status, data):
+                # клучот се паркира; следниот обид оди со друг клуч
+                rate_limited += 1
+                metrics.inc("api_retries_total", "rate_limit")
+                limiter.report_rate_limited(key, retry_after)
+                continue
+
+            if status >= 500:
+                raise aiohttp.ClientResponseError(request_info, history, status=status, message=reason)
+
+            limiter.report_success(
+                key,
+                remaining=_header_float(resp_headers, "X-RateLimit-Remaining"),
+                reset_after=_header_float(resp_headers, "X-RateLimit-Reset-After", "Retry-After"),
+            )
+            if http_cache.mode == "record":
+                http_cache.put(url, params, data)
+            return data
         except Exception as e:
-            print(f"Network error on {url} try {attempt + 1}/{RETRY_COUNT}: {e}")
-            await asyncio.sleep(RETRY_SLEEP)
+            errors += 1
+            print(f"Network error on {url} try {errors}/{RETRY_COUNT}: {e}")
+            if errors < RETRY_COUNT:
+                metrics.inc("api_retries_total", "network")
+                delay = backoff_delay(errors - 1)
+                metrics.add_sleep("backoff", delay)
+                await asyncio.sleep(delay)
     return None
@@ -0,0 +1,50 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from configuration.config import FILTER1_CACHE_PATH, FILTER1_CACHE_TTL_HOURS
+
+
+class Filter1Cache:
+    """
+    Резултати од Filter 1 зачувани на диск, за повторно извршување
+    да не ги проверува симболите што се проверени неодамна.
+    """
+
+    def __init__(self, path: str = FILTER1_CACHE_PATH, ttl_hours: float = FILTER1_CACHE_TTL_HOURS):
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours)
+        self._entries: Dict[str, dict] = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Filter1 cache unreadable, starting empty: {e}")
+            self._entries = {}
+
+    def get(self, symbol: str) -> Optional[bool]:
+        entry = self._entries.get(symbol)
+        if not entry:
+            return None
+        checked_at = datetime.fromisoformat(entry["checked_at"])
+        if datetime.now(tz=timezone.utc) - checked_at > self.ttl:
+            return None
+        return entry["ok"]
+
+    def put(self, symbol: str, ok: bool):
+        self._entries[symbol] = {
+            "ok": ok,
+            "checked_at": datetime.now(tz=timezone.utc).isoformat(),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
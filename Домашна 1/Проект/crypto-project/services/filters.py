@@ -1,24 +1,29 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 import aiohttp
 from configuration.config import CC_API_BASE, START_DATE, LAST_DATE
 from services.api_client import fetch_json
 from data_access import db
+from data_access.watermarks import watermarks
 from services.historical import download_history_range
 from services.snapshots import fetch_and_store_snapshot
 
 
-async def filter1_has_recent_history(session: aiohttp.ClientSession, symbol: str) -> bool:
+async def filter1_has_recent_history(session: aiohttp.ClientSession, symbol: str) -> Optional[bool]:
     """
     Филтер 1:
     - Провери дали симболот воопшто има свежи историски податоци на API.
     - Ако /histoday врати само нули → skip.
+    - None ако нема дефинитивен одговор (мрежна грешка по сите обиди);
+      таквиот резултат не смее да се кешира.
     """
     url = f"{CC_API_BASE}/data/v2/histoday"
     params = {"fsym": symbol, "tsym": "USD", "limit": 2}
     data = await fetch_json(session, url, params)
-    if not data or data.get("Response") != "Success":
+    if not data or data.get("Response") not in ("Success", "Error"):
+        return None
+    if data["Response"] != "Success":
         return False
     arr = data["Data"]["Data"]
     if not arr:
@@ -29,23 +34,25 @@ async def filter1_has_recent_history(session: aiohttp.ClientSession, symbol: str
     return False
 
 
-def filter2_get_missing_from(symbol: str) -> Optional[datetime.date]:
+async def filter2_get_missing_from(symbol: str) -> Optional[datetime.date]:
     """
     Филтер 2:
-    - Проверува до кој датум имаме историски податоци.
+    - Проверува до кој датум имаме историски податоци
+      (од индексот со watermarks, ако е вчитан).
     - Ако нема податоци → враќа None (што значи: full dump).
     - Ако имаме податоци до вчера → враќа None (сме ажурни).
     - Ако ни недостигаат денови → враќа од кој датум треба да почне пополнувањето.
     """
 
-    last_date_str = db.get_last_historical_date(symbol)
+    if watermarks.loaded:
+        last_date = watermarks.last_date(symbol)
+    else:
+        last_date = await db.run_async(db.get_last_historical_date, symbol)
 
     # Нема историски податоци за симболот → None = преземи 10 години
-    if not last_date_str:
+    if not last_date:
         return START_DATE
 
-    last_date = datetime.fromisoformat(last_date_str).date()
-
     # Ако имаме податоци до вчера → нема недостигачки податоци
     if last_date >= LAST_DATE:
         return None
@@ -54,24 +61,31 @@ def filter2_get_missing_from(symbol: str) -> Optional[datetime.date]:
     missing_from = last_date + timedelta(days=1)
     return missing_from
 
-async def filter3_fill_missing_and_snapshot(session, symbol: str, missing_from):
+async def filter3_fill_missing_and_snapshot(session, symbol: str, missing_from,
+                                            with_snapshot: bool = True, writer=None) -> Tuple[int, bool]:
     """
     Филтер 3:
     - Ако missing_from е None → нема историски за преземање → само snapshot
     - Ако missing_from постои → преземи ги деновите missing_from ... yesterday
+    - Ако with_snapshot е False, snapshot-от го прави групната фаза подоцна.
+    - Ако е даден writer, деновите само се ставаат во неговата редица.
+    Враќа (број на внесени/ставени денови, дали е зачуван snapshot).
     """
 
     # 1) Нема недостиг → само snapshot
     if missing_from is None:
+        if not with_snapshot:
+            return 0, False
         print(f"[{symbol}] no missing history – only snapshot")
-        await fetch_and_store_snapshot(session, symbol)
-        return
+        saved = await fetch_and_store_snapshot(session, symbol)
+        return 0, saved
 
     # 2) Има недостиг → симни опсег
     print(f"[{symbol}] downloading history from {missing_from} to {LAST_DATE}")
-    await download_history_range(session, symbol, missing_from)
+    inserted = await download_history_range(session, symbol, missing_from, writer=writer)
 
     # 3) После пополнување → snapshot за денес
-    await fetch_and_store_snapshot(session, symbol)
-
-
+    if not with_snapshot:
+        return inserted, False
+    saved = await fetch_and_store_snapshot(session, symbol)
+    return inserted, saved
@@ -0,0 +1,86 @@
+"""
+Колонарна обработка на histoday одговорите.
+
+Секој chunk се претвора еднаш во NumPy structured array; датумите, опсегот,
+HISTODAY_CUTOFF и филтерот за нула OHLC се пресметуваат врз цели колони,
+а редовите за bulk upsert-от се градат само еднаш, по спојувањето на прозорците.
+"""
+from datetime import date, datetime, timezone
+from itertools import repeat
+from typing import List, Tuple
+
+import numpy as np
+
+from configuration.config import HISTODAY_CUTOFF
+
+HISTODAY_DTYPE = np.dtype([
+    ("time", "i8"),
+    ("close", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("open", "f8"),
+    ("volumefrom", "f8"),
+    ("volumeto", "f8"),
+])
+# редоследот на колоните во historical_data по symbol, date
+VALUE_FIELDS = HISTODAY_DTYPE.names[1:]
+PRICE_FIELDS = ("open", "high", "low", "close")
+
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+def from_records(records: List[dict]) -> np.ndarray:
+    """Единствениот премин низ dict-овите од API-то. None вредностите стануваат NaN."""
+    return np.fromiter(
+        ((r["time"], r.get("close"), r.get("high"), r.get("low"), r.get("open"),
+          r.get("volumefrom"), r.get("volumeto")) for r in records),
+        dtype=HISTODAY_DTYPE, count=len(records),
+    )
+
+
+def select(chunk: np.ndarray, from_date: date, to_date: date) -> Tuple[np.ndarray, int]:
+    """
+    Филтрите од db.histoday_rows врз колони: опсег [from_date, to_date],
+    без денес, без денови пред HISTODAY_CUTOFF и без денови со сите OHLC нули.
+    Враќа (валидни денови, колку денови паднале во опсегот).
+    """
+    days = chunk["time"] // 86400
+    today = datetime.now(tz=timezone.utc).date()
+    lower = day_number(max(from_date, HISTODAY_CUTOFF))
+    upper = min(day_number(to_date), day_number(today) - 1)
+    in_range = (days >= day_number(from_date)) & (days <= day_number(to_date))
+
+    has_price = np.zeros(len(chunk), dtype=bool)
+    for field in PRICE_FIELDS:
+        column = chunk[field]
+        # NaN (null од API-то) се брои како нула, исто како `or 0`
+        has_price |= (column != 0) & ~np.isnan(column)
+
+    keep = in_range & (days >= lower) & (days <= upper) & has_price
+    return chunk[keep], int(np.count_nonzero(in_range))
+
+
+def merge(chunks: List[np.ndarray]) -> np.ndarray:
+    """Ги спојува прозорците, сортирано по датум; кај дупликат денови важи последниот."""
+    merged = np.concatenate(chunks) if chunks else np.empty(0, dtype=HISTODAY_DTYPE)
+    days = merged["time"] // 86400
+    # np.unique го враќа првото појавување → се бара во обратен редослед
+    _, first_from_end = np.unique(days[::-1], return_index=True)
+    return merged[len(merged) - 1 - first_from_end]
+
+
+def to_rows(symbol: str, days: np.ndarray) -> List[Tuple]:
+    """Редови за upsert_histoday_rows / writer-от: (symbol, date, close, high, low, open, vf, vt)."""
+    dates = (days["time"] // 86400).astype("datetime64[D]").tolist()
+    columns = []
+    for field in VALUE_FIELDS:
+        column = days[field]
+        values = column.tolist()
+        if np.isnan(column).any():
+            values = [None if v != v else v for v in values]
+        columns.append(values)
+    return list(zip(repeat(symbol), dates, *columns))
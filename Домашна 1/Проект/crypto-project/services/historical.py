@@ -1,13 +1,19 @@
 from datetime import datetime, timezone
+from typing import List, Tuple
 import asyncio
+import numpy as np
 from configuration.config import (
     CC_API_BASE,
     START_DATE,
     DAYS_PER_CHUNK,
-    REQUEST_DELAY, LAST_DATE,
+    HISTODAY_CUTOFF,
+    LAST_DATE,
 )
+from services import histoday_columns
 from services.api_client import fetch_json
 from data_access import db
+from monitoring.metrics import metrics
+from data_access.watermarks import watermarks
 
 
 async def fetch_histoday_chunk(session, symbol: str, to_ts: int, limit: int = 2000):
@@ -21,57 +27,95 @@ async def fetch_histoday_chunk(session, symbol: str, to_ts: int, limit: int = 20
         return []
 
 
-async def download_history_range(session, symbol: str, from_date=START_DATE, to_date=LAST_DATE):
+def history_windows(from_date, to_date, days_per_chunk: int = DAYS_PER_CHUNK) -> List[Tuple[int, int]]:
     """
-    Презема историски дневни податоци за опсег:
-    од from_date до to_date (и двата вклучени),
-    во повеќе chunk-ови (while loop), без ограничување на 2000 дена.
+    Ги пресметува сите (toTs, limit) прозорци однапред, од најновиот кон најстариот.
+    API-то враќа limit+1 денови што завршуваат на toTs.
     """
-
     target_ts = int(datetime(from_date.year, from_date.month, from_date.day,
                              tzinfo=timezone.utc).timestamp())
     current_ts = int(datetime(to_date.year, to_date.month, to_date.day,
                               tzinfo=timezone.utc).timestamp())
 
-    total_inserted = 0
-
+    windows = []
     while current_ts >= target_ts:
         # колку денови уште има до долната граница
         remaining_days = int((current_ts - target_ts) / 86400) + 1
-        limit = min(DAYS_PER_CHUNK, remaining_days)
-
-        # земи едно парче од историјата наназад
-        chunk = await fetch_histoday_chunk(session, symbol, current_ts, limit=limit)
-        await asyncio.sleep(REQUEST_DELAY)
-
-        if not chunk:
-            print(f"[{symbol}] no data in range, stop.")
-            break
-
-        # држиме само датуми во бараниот опсег
-        filtered = []
-        for rec in chunk:
-            rec_date = datetime.fromtimestamp(rec["time"], tz=timezone.utc).date()
-            if from_date <= rec_date <= to_date:
-                filtered.append(rec)
+        limit = min(days_per_chunk, remaining_days)
+        windows.append((current_ts, limit))
+        current_ts -= (limit + 1) * 86400
+    return windows
 
-        if not filtered:
-            print(f"[{symbol}] got chunk but no dates in requested range, stop.")
-            break
 
-        inserted = db.insert_histoday(symbol, filtered)
-        total_inserted += inserted
-
-        # најстариот датум во ова парче
-        oldest_ts = filtered[0]["time"]   # старо → ново
-        oldest_dt = datetime.fromtimestamp(oldest_ts, tz=timezone.utc)
-        print(f"[{symbol}] saved {inserted}/{len(filtered)} days from {oldest_dt.date()}")
+async def fetch_history_window(session, symbol: str, to_ts: int, limit: int,
+                               from_date, to_date) -> Tuple[np.ndarray, bool]:
+    """
+    Враќа (валидни денови како structured array, дали историјата на монетата почнува во овој прозорец).
+    Празен одговор или помалку валидни денови од limit значи дека постарите прозорци се празни.
+    """
+    chunk = await fetch_histoday_chunk(session, symbol, to_ts, limit=limit)
+    days, in_range = histoday_columns.select(histoday_columns.from_records(chunk), from_date, to_date)
+    if not len(days):
+        metrics.inc("histoday_empty_chunks_total")
+    return days, not in_range or len(days) < limit
 
-        # ако стигнавме до долната граница – стоп
-        if inserted < limit or oldest_dt.date() <= from_date:
-            break
 
-        # оди еден ден наназад од најстариот во ова парче
-        current_ts = int(oldest_dt.timestamp()) - 86400
+async def download_history_range(session, symbol: str, from_date=START_DATE, to_date=LAST_DATE,
+                                 writer=None):
+    """
+    Презема историски дневни податоци за опсег:
+    од from_date до to_date (и двата вклучени).
+    Прозорците се пресметуваат однапред и се преземаат паралелно;
+    резултатот се спојува и се запишува со еден bulk upsert,
+    или се предава на writer-от (services/history_writer.py) ако е даден.
+    """
 
-    return total_inserted
+    # пред HISTODAY_CUTOFF ништо не се запишува, па нема потреба ни да се презема
+    windows = history_windows(max(from_date, HISTODAY_CUTOFF), to_date)
+    if not windows:
+        return 0
+
+    # Прво најновиот прозорец: за повеќето монети целата историја е во него
+    first_days, reached_start = await fetch_history_window(session, symbol, *windows[0], from_date, to_date)
+    collected = [first_days]
+    fetched = 1
+
+    if not reached_start and len(windows) > 1:
+        tasks = [
+            asyncio.create_task(fetch_history_window(session, symbol, to_ts, limit, from_date, to_date))
+            for to_ts, limit in windows[1:]
+        ]
+        try:
+            # резултатите се читаат од ново кон старо, за да важи раното запирање
+            for task in tasks:
+                days, reached_start = await task
+                collected.append(days)
+                fetched += 1
+                if reached_start:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # спојување + отстранување дупликати по датум, редовите се градат само еднаш
+    rows = histoday_columns.to_rows(symbol, histoday_columns.merge(collected))
+
+    if not rows:
+        print(f"[{symbol}] no data in range, stop.")
+        return 0
+
+    if writer is not None:
+        await writer.put(symbol, rows)
+        print(f"[{symbol}] queued {len(rows)} days from {rows[0][1]} "
+              f"({fetched}/{len(windows)} windows)")
+        return len(rows)
+
+    new_rows, updated_rows = await db.run_async(db.upsert_histoday_rows, rows)
+    watermarks.advance(symbol, rows[-1][1])
+
+    # партиционирана табела не ја враќа поделбата нови/ажурирани
+    detail = f"{new_rows} upserted" if updated_rows is None else f"{new_rows} new, {updated_rows} updated"
+    print(f"[{symbol}] saved {len(rows)} days from {rows[0][1]} in {fetched}/{len(windows)} windows "
+          f"({detail})")
+    return new_rows + (updated_rows or 0)
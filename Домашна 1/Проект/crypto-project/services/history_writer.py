@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from configuration.config import WRITER_BATCH_ROWS, WRITER_QUEUE_SIZE
+from data_access import db
+from data_access.watermarks import watermarks
+from monitoring.metrics import metrics
+
+# (symbol, запишани редови, последен датум/време)
+Committed = Tuple[str, int, object]
+
+
+class HistoryWriter:
+    """
+    Посебна фаза за запишување на историјата.
+    Задачите што преземаат само ставаат редови во ограничена редица; еден writer
+    ги спојува редовите од повеќе симболи во една трансакција. Кога Postgres
+    заостанува, редицата се полни и put() чека → преземањето забавува наместо
+    меморијата да расте.
+    """
+
+    def __init__(self, queue_size: int = WRITER_QUEUE_SIZE, batch_rows: int = WRITER_BATCH_ROWS,
+                 write: Callable[[List[Tuple]], object] = db.upsert_histoday_rows,
+                 advance: Callable[[str, object], None] = watermarks.advance):
+        # write/advance се менуваат за intraday свеќите (друга табела, друг watermark)
+        self.write = write
+        self.advance = advance
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_commit = None
+        self._on_error = None
+        self.batches = 0
+
+    def start(self, on_commit: Callable[[List[Committed]], Awaitable[None]],
+              on_error: Callable[[str, Exception], Awaitable[None]]):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._on_commit = on_commit
+        self._on_error = on_error
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, symbol: str, rows: List[Tuple]):
+        start = time.perf_counter()
+        await self._enqueue((symbol, rows))
+        waited = time.perf_counter() - start
+        if waited > 0.001:
+            metrics.add_sleep("writer_backpressure", waited)
+
+    async def close(self):
+        """Ги запишува преостанатите редови и го запира writer-от."""
+        if self._task is None:
+            return
+        try:
+            if not self._task.done():
+                await self._enqueue(None)
+            await self._task
+        finally:
+            self._task = None
+
+    async def _enqueue(self, item):
+        """
+        queue.put што се натпреварува со writer-от: ако тој падне додека
+        редицата е полна, грешката се фрла наместо да се чека засекогаш.
+        """
+        self._raise_if_stopped()
+        put = asyncio.ensure_future(self._queue.put(item))
+        try:
+            await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if not put.done() or put.cancelled():
+            self._raise_if_stopped()
+        put.result()
+
+    def _raise_if_stopped(self):
+        if self._task.done():
+            # ја фрла грешката на writer-от, ако ја има
+            self._task.result()
+            raise RuntimeError("History writer stopped")
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            size = len(item[1])
+            closing = False
+            # сè што веќе чека во редицата оди во истата трансакција
+            while size < self.batch_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+                size += len(item[1])
+            await self._write(batch)
+            if closing:
+                return
+
+    async def _write(self, batch: List[Tuple[str, List[Tuple]]]):
+        rows = [row for _, symbol_rows in batch for row in symbol_rows]
+        try:
+            await db.run_async(self.write, rows)
+        except Exception as e:
+            if len(batch) == 1:
+                await self._on_error(batch[0][0], e)
+                return
+            # еден лош симбол не смее да ја сруши целата група
+            print(f"Writer: batch of {len(batch)} symbols failed ({e}), retrying one by one")
+            for item in batch:
+                await self._write([item])
+            return
+
+        self.batches += 1
+        committed = []
+        for symbol, symbol_rows in batch:
+            last_date = symbol_rows[-1][1]
+            self.advance(symbol, last_date)
+            committed.append((symbol, len(symbol_rows), last_date))
+        print(f"Writer: committed {len(rows)} rows for {len(batch)} symbols")
+        await self._on_commit(committed)
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional, Tuple
+
+from configuration.config import HTTP_CACHE_DIR, HTTP_CACHE_MODE
+
+MODES = ("off", "record", "replay")
+
+# Параметри кои никогаш не влегуваат во клучот (ниту во датотеката)
+SECRET_PARAMS = {"api_key", "apikey"}
+
+
+class HttpCache:
+    """
+    Record/replay кеш за fetch_json.
+    - record: секој успешен одговор се запишува на диск
+    - replay: одговорите се читаат од диск, без мрежа и без rate limit
+    Клучот е URL + нормализирани параметри, без API клучот.
+    """
+
+    def __init__(self, mode: str = HTTP_CACHE_MODE, directory: str = HTTP_CACHE_DIR):
+        self.directory = directory
+        self.set_mode(mode)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def set_mode(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown HTTP cache mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+
+    @staticmethod
+    def normalize(params: dict) -> dict:
+        return {
+            k: str(v)
+            for k, v in sorted((params or {}).items())
+            if k.lower() not in SECRET_PARAMS
+        }
+
+    def key(self, url: str, params: dict) -> str:
+        raw = json.dumps([url, self.normalize(params)], separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, url: str, params: dict) -> Tuple[bool, Optional[Any]]:
+        path = self._path(self.key(url, params))
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, entry["data"]
+
+    def put(self, url: str, params: dict, data: Any):
+        path = self._path(self.key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "params": self.normalize(params), "data": data}, f)
+        os.replace(tmp_path, path)
+        self.recorded += 1
+
+
+http_cache = HttpCache()
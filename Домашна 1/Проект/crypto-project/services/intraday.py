@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from configuration.config import CC_API_BASE, INTRADAY_PAGE_LIMIT, INTRADAY_RESOLUTIONS
+from data_access import db
+from monitoring.metrics import metrics
+from services.api_client import fetch_json
+
+
+async def fetch_candle_chunk(session, symbol: str, resolution: str, to_ts: int, limit: int):
+    url = f"{CC_API_BASE}{INTRADAY_RESOLUTIONS[resolution]['endpoint']}"
+    params = {"fsym": symbol, "tsym": "USD", "toTs": to_ts, "limit": limit}
+    data = await fetch_json(session, url, params)
+    if data and data.get("Response") == "Success":
+        return data["Data"]["Data"]
+    print(f"[{symbol}] {resolution} candles error or no data")
+    return []
+
+
+def candle_windows(from_ts: int, to_ts: int, step: int,
+                   page_limit: int = INTRADAY_PAGE_LIMIT) -> List[Tuple[int, int]]:
+    """Исто како history_windows, во секунди: (toTs, limit) од најново кон најстаро."""
+    windows = []
+    current = to_ts
+    while current >= from_ts:
+        remaining = (current - from_ts) // step + 1
+        limit = min(page_limit, remaining)
+        windows.append((current, limit))
+        current -= (limit + 1) * step
+    return windows
+
+
+def last_closed_candle(step: int) -> int:
+    now = int(datetime.now(tz=timezone.utc).timestamp())
+    return now // step * step - step
+
+
+async def fetch_candle_window(session, symbol: str, resolution: str, to_ts: int, limit: int,
+                              from_ts: int) -> Tuple[List[Tuple], bool]:
+    """(редови, дали историјата на монетата почнува во овој прозорец)"""
+    step = INTRADAY_RESOLUTIONS[resolution]["step"]
+    chunk = await fetch_candle_chunk(session, symbol, resolution, to_ts, limit)
+    rows = db.candle_rows(symbol, [c for c in chunk if c["time"] >= from_ts], step)
+    if not rows:
+        metrics.inc("histoday_empty_chunks_total")
+    return rows, len(rows) < limit
+
+
+async def download_candles(session, symbol: str, resolution: str, from_ts: int, writer) -> int:
+    """
+    Filter 3 за intraday: ги презема свеќите од from_ts до последната затворена
+    и ги предава на writer-от. Прво најновиот прозорец, па останатите паралелно.
+    """
+    step = INTRADAY_RESOLUTIONS[resolution]["step"]
+    windows = candle_windows(from_ts, last_closed_candle(step), step)
+    if not windows:
+        return 0
+
+    rows, reached_start = await fetch_candle_window(session, symbol, resolution, *windows[0], from_ts)
+    collected = [rows]
+    if not reached_start and len(windows) > 1:
+        results = await asyncio.gather(*(
+            fetch_candle_window(session, symbol, resolution, to_ts, limit, from_ts)
+            for to_ts, limit in windows[1:]
+        ))
+        collected.extend(rows for rows, _ in results)
+
+    merged = {}
+    for rows in collected:
+        for row in rows:
+            merged[row[1]] = row
+    if not merged:
+        return 0
+    rows = [merged[ts] for ts in sorted(merged)]
+    await writer.put(symbol, rows)
+    return len(rows)
+
+
+def missing_from(last_ts: Optional[datetime], earliest_ts: int, step: int) -> Optional[int]:
+    """
+    Filter 2 за intraday: од кога недостигаат свеќи (unix секунди),
+    или None ако симболот е ажурен. Никогаш пред retention границата.
+    """
+    start = earliest_ts if last_ts is None else max(int(last_ts.timestamp()) + step, earliest_ts)
+    if start > last_closed_candle(step):
+        return None
+    return start
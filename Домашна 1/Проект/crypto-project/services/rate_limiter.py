@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+from monitoring.metrics import metrics
+from configuration.config import (
+    CC_API_KEYS,
+    CC_CALLS_PER_SECOND_PER_KEY,
+    CC_BURST_PER_KEY,
+    BACKOFF_MAX_SLEEP,
+    RETRY_SLEEP,
+)
+
+
+class KeyBucket:
+    """Token bucket за еден API клуч."""
+
+    def __init__(self, key: Optional[str], rate: float, burst: float):
+        self.key = key
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.strikes = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    Заеднички лимитер за сите повици кон CryptoCompare.
+    Секој клуч има свој буџет (token bucket); клуч што добил rate-limit
+    одговор привремено се вади од ротација со експоненцијален backoff.
+    """
+
+    def __init__(self, keys: List[str], rate: float = CC_CALLS_PER_SECOND_PER_KEY,
+                 burst: float = CC_BURST_PER_KEY):
+        self.rate = rate
+        self.burst = burst
+        self.set_keys(keys)
+
+    def set_keys(self, keys: List[str]):
+        # без клучеви → една анонимна кофа, за да важи ограничувањето и тогаш
+        self._buckets = [KeyBucket(k, self.rate, self.burst) for k in keys] or \
+                        [KeyBucket(None, self.rate, self.burst)]
+        self._next = 0
+
+    def shard(self, index: int, count: int):
+        """
+        Клучевите се делат меѓу `count` процеси (шардови) без преклопување.
+        Ако има повеќе шардови од клучеви, клучот се дели, па се дели и буџетот.
+        """
+        keys = [b.key for b in self._buckets]
+        if len(keys) >= count:
+            self.set_keys(keys[index::count])
+            return
+        sharing = len(range(index % len(keys), count, len(keys)))
+        self.rate /= sharing
+        self.burst = max(1.0, self.burst / sharing)
+        self.set_keys([keys[index % len(keys)]])
+
+    async def acquire(self) -> Optional[str]:
+        while True:
+            now = time.monotonic()
+            wait = BACKOFF_MAX_SLEEP
+            n = len(self._buckets)
+            for offset in range(n):
+                bucket = self._buckets[(self._next + offset) % n]
+                if bucket.blocked_until > now:
+                    wait = min(wait, bucket.blocked_until - now)
+                    continue
+                bucket.refill(now)
+                if bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    self._next = (self._next + offset + 1) % n
+                    return bucket.key
+                wait = min(wait, (1 - bucket.tokens) / bucket.rate)
+            metrics.add_sleep("rate_limiter", wait)
+            await asyncio.sleep(wait)
+
+    def _bucket(self, key: Optional[str]) -> Optional[KeyBucket]:
+        for bucket in self._buckets:
+            if bucket.key == key:
+                return bucket
+        return None
+
+    def report_success(self, key: Optional[str], remaining: Optional[int] = None,
+                       reset_after: Optional[float] = None):
+        bucket = self._bucket(key)
+        if bucket is None:
+            return
+        bucket.strikes = 0
+        # провајдерот кажува дека буџетот е потрошен → не чекаме грешка
+        if remaining is not None and remaining <= 0:
+            bucket.tokens = 0
+            bucket.blocked_until = time.monotonic() + (reset_after or backoff_delay(0))
+
+    def report_rate_limited(self, key: Optional[str], retry_after: Optional[float] = None) -> float:
+        bucket = self._bucket(key)
+        if bucket is None:
+            return 0.0
+        now = time.monotonic()
+        if bucket.blocked_until > now:
+            # повици кои биле во лет пред паркирањето не го зголемуваат backoff-от
+            return bucket.blocked_until - now
+        delay = retry_after if retry_after is not None else backoff_delay(bucket.strikes)
+        bucket.strikes += 1
+        bucket.tokens = 0
+        bucket.blocked_until = now + delay
+        print(f"API key ...{(key or 'anon')[-6:]} rate limited, parked for {delay:.1f}s")
+        return delay
+
+
+def backoff_delay(attempt: int) -> float:
+    # експоненцијален backoff со случаен jitter (половина до цел интервал)
+    ceiling = min(BACKOFF_MAX_SLEEP, RETRY_SLEEP * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+limiter = RateLimiter(CC_API_KEYS)
@@ -1,17 +1,118 @@
 from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
 import aiohttp
-from configuration.config import CC_API_BASE
+from configuration.config import CC_API_BASE, SNAPSHOT_BATCH_SIZE, SNAPSHOT_FSYMS_MAX_CHARS
 from services.api_client import fetch_json
 from data_access import db
+from data_access.watermarks import watermarks
 
 
-async def fetch_and_store_snapshot(session: aiohttp.ClientSession, symbol: str):
+def snapshot_row(raw: dict) -> Tuple:
+    return (
+        raw.get("PRICE"),
+        raw.get("OPEN24HOUR"),
+        raw.get("HIGH24HOUR"),
+        raw.get("LOW24HOUR"),
+        raw.get("VOLUME24HOUR"),
+        raw.get("VOLUME24HOURTO"),
+        raw.get("CHANGEPCT24HOUR"),
+        raw.get("MKTCAP"),
+        raw.get("SUPPLY"),
+    )
+
+
+def snapshot_batches(symbols: List[str],
+                     max_symbols: int = SNAPSHOT_BATCH_SIZE,
+                     max_chars: int = SNAPSHOT_FSYMS_MAX_CHARS) -> Iterator[List[str]]:
+    """
+    Ги групира симболите така што fsyms параметарот
+    не ја надминува дозволената должина на API-то.
+    """
+    batch, length = [], 0
+    for sym in symbols:
+        extra = len(sym) + (1 if batch else 0)
+        if batch and (len(batch) >= max_symbols or length + extra > max_chars):
+            yield batch
+            batch, length = [], 0
+            extra = len(sym)
+        batch.append(sym)
+        length += extra
+    if batch:
+        yield batch
+
+
+async def fetch_snapshot_batch(session: aiohttp.ClientSession, symbols: List[str]) -> Optional[Dict[str, Tuple]]:
+    url = f"{CC_API_BASE}/data/pricemultifull"
+    params = {"fsyms": ",".join(symbols), "tsyms": "USD"}
+    data = await fetch_json(session, url, params)
+    if not data or not isinstance(data.get("RAW"), dict):
+        return None
+
+    rows = {}
+    for sym in symbols:
+        raw = (data["RAW"].get(sym) or {}).get("USD")
+        if raw:
+            rows[sym] = snapshot_row(raw)
+    return rows
+
+
+async def fetch_and_store_snapshots(session: aiohttp.ClientSession, symbols: List[str]) -> int:
+    """
+    Snapshot за повеќе симболи одеднаш: по еден pricemultifull повик на група,
+    еден bulk upsert за сите редови, и поединечни повици само за симболите
+    кои не дошле во групниот одговор.
+    """
+    today = datetime.now(tz=timezone.utc).date().isoformat()
+
+    if watermarks.loaded:
+        pending = [s for s in symbols if not watermarks.has_snapshot_today(s)]
+    else:
+        existing = await db.run_async(db.get_snapshot_symbols, datetime.now(tz=timezone.utc).date())
+        pending = [s for s in symbols if s not in existing]
+
+    if not pending:
+        print(f"Snapshots already exist for all {len(symbols)} symbols for {today}")
+        return 0
+
+    batches = list(snapshot_batches(pending))
+    print(f"Fetching snapshots for {len(pending)} symbols in {len(batches)} batches...")
+    results = await asyncio.gather(*(fetch_snapshot_batch(session, b) for b in batches))
+
+    rows: Dict[str, Tuple] = {}
+    failed: List[str] = []
+    for batch, batch_rows in zip(batches, results):
+        if batch_rows is None:
+            failed.extend(batch)
+            continue
+        rows.update(batch_rows)
+        failed.extend(s for s in batch if s not in batch_rows)
+
+    await db.run_async(db.save_snapshot_rows, today, rows)
+    for sym in rows:
+        watermarks.mark_snapshot(sym)
+    print(f"Saved {len(rows)} snapshots for {today} in one batch")
+
+    saved = len(rows)
+    if failed:
+        print(f"Retrying {len(failed)} snapshots one by one...")
+        for sym in failed:
+            if await fetch_and_store_snapshot(session, sym):
+                saved += 1
+    return saved
+
+
+async def fetch_and_store_snapshot(session: aiohttp.ClientSession, symbol: str) -> bool:
     today = datetime.now(tz=timezone.utc).date().isoformat()
 
     # 0) Ако веќе имаме snapshot за денес → не правиме ништо
-    if db.snapshot_exists_today(symbol):
+    if watermarks.loaded:
+        exists = watermarks.has_snapshot_today(symbol)
+    else:
+        exists = await db.run_async(db.snapshot_exists_today, symbol)
+    if exists:
         print(f"[{symbol}] snapshot already exists for {today}")
-        return
+        return False
 
     # 1) Пробај денешни податоци од API
     url = f"{CC_API_BASE}/data/pricemultifull"
@@ -28,20 +129,12 @@ async def fetch_and_store_snapshot(session: aiohttp.ClientSession, symbol: str):
     # 2) Ако нема податоци од API → можеш или да се откажеш, или fallback
     if raw is None:
         print(f"[{symbol}] snapshot not available from API for {today}")
-        return
+        return False
 
     # 3) Ако има податоци → подготви tuple и запиши со save_snapshot_row
-    row = (
-        raw.get("PRICE"),
-        raw.get("OPEN24HOUR"),
-        raw.get("HIGH24HOUR"),
-        raw.get("LOW24HOUR"),
-        raw.get("VOLUME24HOUR"),
-        raw.get("VOLUME24HOURTO"),
-        raw.get("CHANGEPCT24HOUR"),
-        raw.get("MKTCAP"),
-        raw.get("SUPPLY"),
-    )
+    row = snapshot_row(raw)
 
-    db.save_snapshot_row(symbol, today, row)
+    await db.run_async(db.save_snapshot_row, symbol, today, row)
+    watermarks.mark_snapshot(symbol)
     print(f"[{symbol}] snapshot saved for {today}")
+    return True